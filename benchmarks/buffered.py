@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------
+# Copyright (c) 2017, The redbiom Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+
+"""Benchmark bulk retrieval by buffered with chunks in flight
+
+Synthetic metadata for 20,000 samples are loaded, and the time to obtain a
+column for all samples by HMGET is reported for a varying number of chunks
+in flight. The benefit is dependent on the latency to the host, so the
+benchmark is most informative against a remote test instance.
+
+This benchmark writes to the database, so it must only be run against a
+test instance.
+"""
+
+import statistics
+import time
+
+import pandas as pd
+
+import redbiom
+import redbiom.admin
+import redbiom._requests
+from redbiom.tests import assert_test_env
+
+
+assert_test_env()
+
+N_SAMPLES = 20000
+CATEGORY = 'benchmark_buffered'
+IN_FLIGHT = (1, 2, 4, 8, 16)
+REPEATS = 5
+
+
+def _setup():
+    samples = ['benchmark.buffered.%d' % i for i in range(N_SAMPLES)]
+    md = pd.DataFrame([[s, str(i)] for i, s in enumerate(samples)],
+                      columns=['#SampleID', CATEGORY])
+    redbiom.admin.load_sample_metadata(md)
+    return samples
+
+
+def _teardown(samples):
+    config = redbiom.get_config()
+    post = redbiom._requests.make_post(config)
+
+    post('metadata', 'DEL', 'category:%s' % CATEGORY)
+    post('metadata', 'SREM', 'categories-represented/%s' % CATEGORY)
+    for chunk in redbiom._requests.batch_by_size(samples, 8192):
+        post(None, 'DEL',
+             '/'.join(['metadata:categories:%s' % s for s in chunk]))
+        post('metadata', 'SREM',
+             'samples-represented/%s' % '/'.join(chunk))
+
+
+def _time(samples, in_flight):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.time()
+        for _ in redbiom._requests.buffered(iter(samples), None, 'HMGET',
+                                            'metadata', buffer_size=100,
+                                            multikey='category:%s' % CATEGORY,
+                                            in_flight=in_flight):
+            pass
+        timings.append(time.time() - start)
+    return statistics.median(timings)
+
+
+def main():
+    samples = _setup()
+    try:
+        print("samples\tin flight\tmedian seconds")
+        for in_flight in IN_FLIGHT:
+            print("%d\t%d\t%0.4f" % (N_SAMPLES, in_flight,
+                                     _time(samples, in_flight)))
+    finally:
+        _teardown(samples)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------
+# Copyright (c) 2017, The redbiom Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+
+"""Benchmark the per-sample time of the fetch-sample script
+
+A synthetic sample with 10,000 features is loaded into a throwaway context,
+and the time to execute fetch-sample for that sample is reported. For
+comparison, the script is also timed against a variant which resolves each
+feature index with its own HGET, which is how the script was originally
+written.
+
+This benchmark writes to the database, so it must only be run against a
+test instance. The scripts need to be writable (redbiom admin
+scripts-writable).
+"""
+
+import hashlib
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import biom
+import requests
+
+import redbiom
+import redbiom.admin
+import redbiom._requests
+from redbiom.tests import assert_test_env
+
+
+assert_test_env()
+
+CONTEXT = 'benchmark-fetch-scripts'
+N_FEATURES = 10000
+REPEATS = 25
+
+PER_ITEM_HGET = """
+    local context = ARGV[1]
+    local key = ARGV[2]
+    local result = {}
+    local formedkey = context .. ':' .. 'sample' .. ':' .. key
+    local items = redis.call('LRANGE', formedkey, '0', '-1')
+    local resultkey
+    local ii = context .. ':' .. 'feature' .. '-index-inverted'
+    for idx, v in ipairs(items) do
+        if idx % 2 == 1 then
+            resultkey = redis.call('HGET', ii, v)
+        else
+            result[resultkey] = tonumber(v)
+        end
+    end
+    return cjson.encode(result)"""
+
+
+def _setup(n_features):
+    sample = 'benchmark.%d' % n_features
+    features = ['feature-%d' % i for i in range(n_features)]
+    data = np.random.randint(1, 100, size=(n_features, 1))
+    table = biom.Table(data, features, [sample])
+
+    md = pd.DataFrame([[sample, 'benchmark']],
+                      columns=['#SampleID', 'description'])
+    redbiom.admin.create_context(CONTEXT, 'fetch script benchmark')
+    redbiom.admin.load_sample_metadata(md)
+    redbiom.admin.load_sample_data(table, CONTEXT, tag=None)
+
+    return 'UNTAGGED_%s' % sample
+
+
+def _teardown(n_features):
+    config = redbiom.get_config()
+    get = redbiom._requests.make_get(config)
+    post = redbiom._requests.make_post(config)
+
+    keys = get(None, 'KEYS', '%s:*' % CONTEXT)
+    for key in keys:
+        post(None, 'DEL', key)
+    post('state', 'HDEL', 'contexts/%s' % CONTEXT)
+
+    sample = 'benchmark.%d' % n_features
+    post('metadata', 'DEL', 'categories:%s' % sample)
+    post('metadata', 'HDEL', 'category:description/%s' % sample)
+    post('metadata', 'SREM', 'samples-represented/%s' % sample)
+
+
+def _time(se, sha, sample):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.time()
+        se(sha, 0, CONTEXT, sample)
+        timings.append(time.time() - start)
+    return statistics.median(timings)
+
+
+def main():
+    config = redbiom.get_config()
+    se = redbiom._requests.make_script_exec(config)
+    put = redbiom._requests.make_put(config)
+
+    put(None, 'SCRIPT', 'LOAD', PER_ITEM_HGET)
+    per_item = hashlib.sha1(PER_ITEM_HGET.encode('ascii')).hexdigest()
+
+    try:
+        sample = _setup(N_FEATURES)
+        current = redbiom.admin.ScriptManager.get('fetch-sample')
+        assert se(current, 0, CONTEXT, sample) == \
+            se(per_item, 0, CONTEXT, sample)
+
+        print("features\tscript\tmedian seconds per sample")
+        for name, sha in (('HGET per item', per_item),
+                          ('fetch-sample', current)):
+            print("%d\t%s\t%0.4f" % (N_FEATURES, name,
+                                     _time(se, sha, sample)))
+    except (requests.HTTPError, ValueError) as e:
+        print("Unable to run the benchmark: %s" % e, file=sys.stderr)
+        raise
+    finally:
+        _teardown(N_FEATURES)
+
+
+if __name__ == '__main__':
+    main()
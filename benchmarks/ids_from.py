@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------
+# Copyright (c) 2017, The redbiom Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+
+"""Benchmark an exact search with a common and a rare feature
+
+A synthetic context is constructed where one feature is present in 200,000
+samples and another in 10, and the time for an exact search with both
+features is reported for the ids-from script and for fetching the
+associations of each feature.
+
+This benchmark writes to the database, so it must only be run against a
+test instance.
+"""
+
+import statistics
+import time
+
+import redbiom
+import redbiom.admin
+import redbiom.util
+import redbiom._requests
+from redbiom.tests import assert_test_env
+
+
+assert_test_env()
+
+CONTEXT = 'benchmark-ids-from'
+N_SAMPLES = 200000
+N_RARE = 10
+REPEATS = 5
+
+
+def _push(post, cmd, key, pairs):
+    for chunk in redbiom._requests.batch_by_size(pairs, 32768, key='/'.join):
+        post(CONTEXT, cmd, '/'.join([key] + ['/'.join(p) for p in chunk]))
+
+
+def _setup():
+    config = redbiom.get_config()
+    post = redbiom._requests.make_post(config)
+
+    redbiom.admin.create_context(CONTEXT, 'ids-from benchmark')
+    samples = [(str(i), 'benchmark.%d' % i) for i in range(N_SAMPLES)]
+    _push(post, 'HSET', 'sample-index-inverted', samples)
+    _push(post, 'RPUSH', 'feature:common', [(i, '1') for i, _ in samples])
+    _push(post, 'RPUSH', 'feature:rare',
+          [(str(i), '1') for i in range(0, N_SAMPLES, N_SAMPLES // N_RARE)])
+
+
+def _teardown():
+    config = redbiom.get_config()
+    post = redbiom._requests.make_post(config)
+    post(CONTEXT, 'DEL', 'sample-index-inverted/feature:common/feature:rare')
+    post('state', 'HDEL', 'contexts/%s' % CONTEXT)
+
+
+def _time(f):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.time()
+        obs = f(['common', 'rare'], True, 'feature', [CONTEXT])
+        timings.append(time.time() - start)
+        assert len(obs) == N_RARE
+    return statistics.median(timings)
+
+
+def main():
+    _setup()
+    try:
+        print("samples\tmethod\tmedian seconds")
+        for name, f in (('ids-from', redbiom.util.ids_from),
+                        ('per-id', redbiom.util._ids_from_per_id)):
+            print("%d\t%s\t%0.4f" % (N_SAMPLES, name, _time(f)))
+    finally:
+        _teardown()
+
+
+if __name__ == '__main__':
+    main()
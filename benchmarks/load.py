@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------
+# Copyright (c) 2017, The redbiom Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+
+"""Benchmark the loading of sample data
+
+Synthetic tables of increasing size are constructed, and the time to pack
+the data of every sample and every feature for the load-data script is
+reported, both per ID from biom.Table.data as was previously done and in
+bulk by redbiom.admin._axis_packer. Packing does not require a server.
+
+The throughput of redbiom.admin.load_sample_data is then reported for the
+smallest table. This writes to the database, so it must only be run against
+a test instance.
+"""
+
+import time
+
+import biom
+import numpy as np
+import pandas as pd
+import scipy.sparse as ss
+
+import redbiom
+import redbiom.admin
+import redbiom._requests
+from redbiom.tests import assert_test_env
+
+
+assert_test_env()
+
+# (samples, features, density)
+SHAPES = ((1000, 5000, 0.02), (10000, 20000, 0.005), (20000, 50000, 0.002))
+CONTEXT = 'benchmark-load'
+
+
+def _table(n_samples, n_features, density):
+    rng = np.random.default_rng(0)
+    matrix = ss.random(n_features, n_samples, density=density,
+                       format='csr', random_state=rng,
+                       data_rvs=lambda n: rng.integers(1, 1000, n))
+    samples = ['benchmark.load.%d' % i for i in range(n_samples)]
+    features = ['F%d' % i for i in range(n_features)]
+    return biom.Table(matrix, features, samples)
+
+
+def _pack_per_id(table, ids, opposite_ids, opposite_id_index, axis):
+    for id_ in ids:
+        values = table.data(id_, axis=axis, dense=False)
+        if not np.allclose(values.data - np.round(values.data, 1), 0.0):
+            raise ValueError("Data do not appear to be counts")
+
+        int_values = values.astype(int)
+        remapped = [opposite_id_index[i]
+                    for i in opposite_ids[values.indices]]
+        '|'.join(["%d|%d" % (v, i)
+                  for i, v in zip(remapped, int_values.data)])
+
+
+def _pack_bulk(table, ids, opposite_ids, opposite_id_index, axis):
+    packer = redbiom.admin._axis_packer(table, opposite_ids,
+                                        opposite_id_index, axis)
+    for id_ in ids:
+        packer(id_)
+
+
+def _time_packing(table):
+    samples = table.ids()
+    features = table.ids(axis='observation')
+    samp_index = {s: i for i, s in enumerate(samples)}
+    feat_index = {f: i for i, f in enumerate(features)}
+
+    timings = []
+    for f in (_pack_per_id, _pack_bulk):
+        start = time.time()
+        f(table, samples, features, feat_index, 'sample')
+        f(table, features, samples, samp_index, 'observation')
+        timings.append(time.time() - start)
+    return timings
+
+
+def _time_load(table):
+    config = redbiom.get_config()
+    get = redbiom._requests.make_get(config)
+    post = redbiom._requests.make_post(config)
+
+    if get('state', 'HEXISTS', 'contexts/%s' % CONTEXT):
+        raise ValueError("%s already exists" % CONTEXT)
+
+    md = pd.DataFrame([[s, 'x'] for s in table.ids()],
+                      columns=['#SampleID', 'benchmark_load'])
+    redbiom.admin.load_sample_metadata(md)
+    redbiom.admin.create_context(CONTEXT, 'load benchmark')
+
+    start = time.time()
+    redbiom.admin.load_sample_data(table, CONTEXT, tag=None)
+    elapsed = time.time() - start
+
+    # the keys of a context are not otherwise enumerable through Webdis
+    post(None, 'EVAL', "0/%s" % _quote(
+        "for _, k in ipairs(redis.call('KEYS', '%s:*')) do "
+        "redis.call('DEL', k) end" % CONTEXT))
+    post('state', 'HDEL', 'contexts/%s' % CONTEXT)
+    return elapsed
+
+
+def _quote(script):
+    from urllib.parse import quote
+    return quote(script, safe='')
+
+
+def main():
+    print("samples\tfeatures\tnonzero\tper ID seconds\tbulk seconds")
+    tables = []
+    for shape in SHAPES:
+        table = _table(*shape)
+        tables.append(table)
+        per_id, bulk = _time_packing(table)
+        print("%d\t%d\t%d\t%0.3f\t%0.3f"
+              % (shape[0], shape[1], table.nnz, per_id, bulk))
+
+    print()
+    print("samples\tnonzero\tload seconds\tnonzero per second")
+    table = tables[0]
+    elapsed = _time_load(table)
+    print("%d\t%d\t%0.3f\t%d" % (len(table.ids()), table.nnz, elapsed,
+                                 table.nnz / elapsed))
+
+
+if __name__ == '__main__':
+    main()
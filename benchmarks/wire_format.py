@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------
+# Copyright (c) 2017, The redbiom Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file COPYING.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+
+"""Benchmark JSON and msgpack responses from Webdis
+
+A set with 100,000 members is created, and SMEMBERS of it is requested in
+each of the wire formats. The size of the response, the median time to
+decode it, and the median time of the request overall are reported.
+
+This benchmark writes to the database, so it must only be run against a
+test instance. msgpack is only benchmarked if Webdis provides it.
+"""
+
+import json
+import statistics
+import time
+
+import msgpack
+
+import redbiom
+import redbiom._requests
+from redbiom.tests import assert_test_env
+
+
+assert_test_env()
+
+KEY = 'benchmark-wire-format'
+N_MEMBERS = 100000
+REPEATS = 10
+
+
+def _setup():
+    config = redbiom.get_config()
+    post = redbiom._requests.make_post(config)
+
+    members = ['10317.%09d' % i for i in range(N_MEMBERS)]
+    for chunk in redbiom._requests.batch_by_size(members, 32768):
+        post(None, 'SADD', '%s/%s' % (KEY, '/'.join(chunk)))
+
+
+def _teardown():
+    config = redbiom.get_config()
+    post = redbiom._requests.make_post(config)
+    post(None, 'DEL', KEY)
+
+
+def _median_time(f, *args):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.time()
+        f(*args)
+        timings.append(time.time() - start)
+    return statistics.median(timings)
+
+
+def main():
+    config = redbiom.get_config()
+    s = redbiom._requests.get_session()
+
+    decoders = {'json': json.loads,
+                'msgpack': lambda b: msgpack.unpackb(b, raw=False)}
+    formats = ['json']
+    if redbiom._requests._probe_wire_format(config['hostname']) == 'msgpack':
+        formats.append('msgpack')
+
+    _setup()
+    try:
+        print("members\tformat\tbytes\tmedian decode seconds\t"
+              "median request seconds")
+        for fmt in formats:
+            url = '/'.join([config['hostname'],
+                            redbiom._requests._format_request(None,
+                                                              'SMEMBERS',
+                                                              KEY, fmt=fmt)])
+            content = s.get(url).content
+            assert len(decoders[fmt](content)['SMEMBERS']) == N_MEMBERS
+
+            get = redbiom._requests.make_get(dict(config, wire_format=fmt))
+            print("%d\t%s\t%d\t%0.4f\t%0.4f" % (
+                N_MEMBERS, fmt, len(content),
+                _median_time(decoders[fmt], content),
+                _median_time(get, None, 'SMEMBERS', KEY)))
+    finally:
+        _teardown()
+
+
+if __name__ == '__main__':
+    main()
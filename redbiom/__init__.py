@@ -23,11 +23,16 @@ __db_version__ = '0.4.0'
 
 active_sessions = {}
 
+# connections of the native Redis transport, see redbiom._resp
+active_connections = {}
+
 
 def _close_sessions():
     # be polite
     for _, session in active_sessions.items():
         session.close()
+    for _, connection in active_connections.items():
+        connection.close()
 
 
 atexit.register(_close_sessions)
@@ -38,4 +43,31 @@ def get_config():
     import os
     hostname = os.environ.get('REDBIOM_HOST', 'http://qiita.ucsd.edu:7329')
 
-    return {'hostname': hostname}
+    # the number of concurrent requests to issue for operations which
+    # support it, such as fetching sample data
+    max_workers = int(os.environ.get('REDBIOM_MAX_WORKERS', 1))
+
+    # the approximate upper bound, in bytes, on the items placed into a
+    # single bulk request by redbiom._requests.buffered
+    buffer_bytes = int(os.environ.get('REDBIOM_BUFFER_BYTES', 32768))
+
+    # the format of responses from Webdis: json, msgpack, or auto to use
+    # msgpack where the server supports it
+    wire_format = os.environ.get('REDBIOM_WIRE_FORMAT', 'auto')
+
+    # a directory to persist data obtained from the server which can be
+    # reused across invocations, such as the samples represented by a
+    # context. nothing is persisted if not set
+    cache_dir = os.environ.get('REDBIOM_CACHE_DIR')
+
+    # the upper bound, in bytes, on the responses retained in cache_dir
+    cache_bytes = int(os.environ.get('REDBIOM_CACHE_BYTES', 256 * 2 ** 20))
+
+    # the number of seconds repeated lookups are retained in memory for, see
+    # redbiom.cache. 0 disables the retention
+    cache_ttl = float(os.environ.get('REDBIOM_CACHE_TTL', 60))
+
+    return {'hostname': hostname, 'max_workers': max_workers,
+            'buffer_bytes': buffer_bytes, 'wire_format': wire_format,
+            'cache_dir': cache_dir, 'cache_bytes': cache_bytes,
+            'cache_ttl': cache_ttl}
@@ -1,17 +1,30 @@
+# the Webdis extension of each response format
+_EXTENSIONS = {'json': 'json', 'msgpack': 'msg'}
+
+# {hostname: format}, for hosts where the format was determined by a probe
+_wire_formats = {}
+
+
 def _parse_validate_request(req, command):
     """Assert 200, parse, pull out the content"""
     import requests
     if req.status_code != 200:
         raise requests.HTTPError("%s : %s" % (command, req.content))
-    return req.json()[command]
+
+    if req.headers.get('Content-Type', '').startswith('application/x-msgpack'):
+        import msgpack
+        return msgpack.unpackb(req.content, raw=False)[command]
+    else:
+        return req.json()[command]
 
 
-def _format_request(context, command, other, as_bytes=False):
+def _format_request(context, command, other, as_bytes=False, fmt='json'):
     """Merge commands, context and payload"""
+    ext = _EXTENSIONS[fmt]
     if context is None:
-        data = "%s/%s.json" % (command, other)
+        data = "%s/%s.%s" % (command, other, ext)
     else:
-        data = "%s/%s:%s.json" % (command, context, other)
+        data = "%s/%s:%s.%s" % (command, context, other, ext)
 
     if as_bytes:
         return data.encode('utf-8')
@@ -19,49 +32,207 @@ def _format_request(context, command, other, as_bytes=False):
         return data
 
 
+def _wire_format(config):
+    """Determine the format to request responses from Webdis in
+
+    The format is set by REDBIOM_WIRE_FORMAT. If "auto", msgpack is used if
+    the host supports it, which is tested once per host. The format is
+    determined on the first request, rather than when a request method is
+    constructed.
+
+    Raises
+    ------
+    ValueError
+        If the format is not recognized.
+
+    Returns
+    -------
+    str
+        Either "json" or "msgpack"
+    """
+    fmt = config.get('wire_format', 'auto')
+    if fmt == 'auto':
+        hostname = config['hostname']
+        if hostname not in _wire_formats:
+            _wire_formats[hostname] = _probe_wire_format(hostname)
+        fmt = _wire_formats[hostname]
+
+    if fmt not in _EXTENSIONS:
+        raise ValueError("Unknown wire format: %s" % fmt)
+
+    return fmt
+
+
+def _probe_wire_format(hostname):
+    """Test whether Webdis provides msgpack responses
+
+    Webdis only provides msgpack if it was compiled with support for it.
+    """
+    req = get_session().get('/'.join([hostname, 'PING.msg']))
+    content_type = req.headers.get('Content-Type', '')
+
+    if req.status_code == 200 and \
+            content_type.startswith('application/x-msgpack'):
+        try:
+            _parse_validate_request(req, 'PING')
+        except Exception:
+            pass
+        else:
+            return 'msgpack'
+
+    return 'json'
+
+
 def get_session():
+    """Get the session for the current process and thread
+
+    A requests.Session is not assured to be thread safe, so sessions are
+    maintained per thread.
+    """
     import redbiom
     import requests
+    import threading
     import os
 
-    pid = os.getpid()
-    if pid not in redbiom.active_sessions:
-        redbiom.active_sessions[pid] = requests.Session()
+    key = (os.getpid(), threading.get_ident())
+    if key not in redbiom.active_sessions:
+        redbiom.active_sessions[key] = requests.Session()
 
-    return redbiom.active_sessions[pid]
+    return redbiom.active_sessions[key]
 
 
-def make_post(config, redis_protocol=None):
-    """Factory function: produce a post() method"""
+def parallel_map(func, items, workers=None):
+    """Apply a function over items concurrently, retaining order
+
+    Parameters
+    ----------
+    func : function
+        The function to apply. The function is called from worker threads,
+        so any request methods it uses should be constructed within it
+        (e.g., make_get) in order to use the session of the thread.
+    items : iterable
+        The items to apply the function to.
+    workers : int, optional
+        The number of threads to use. If not specified, the max_workers of
+        the configuration is used. If 1, no threads are created.
+
+    Returns
+    -------
+    generator
+        The results of func in order with items.
+
+    Notes
+    -----
+    Items are submitted a bounded distance ahead of the results being
+    consumed, so that results do not accumulate if the consumer is slower
+    than the requests.
+    """
     import redbiom
-    s = get_session()
-    config = redbiom.get_config()
 
+    if workers is None:
+        workers = redbiom.get_config()['max_workers']
+
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+    from collections import deque
+    import threading
+    import os
+
+    idents = set()
+    pending = deque()
+
+    def tracked(item):
+        idents.add(threading.get_ident())
+        return func(item)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for item in items:
+                pending.append(executor.submit(tracked, item))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+    finally:
+        # if the results are not consumed, do not issue further requests
+        for future in pending:
+            future.cancel()
+
+        # the worker threads are gone, so release their sessions
+        pid = os.getpid()
+        for ident in idents:
+            session = redbiom.active_sessions.pop((pid, ident), None)
+            if session is not None:
+                session.close()
+
+        for key in list(redbiom.active_connections):
+            if key[0] == pid and key[1] in idents:
+                redbiom.active_connections.pop(key).close()
+
+
+def _uses_resp(config):
+    """Test if the configured host is accessed over the Redis protocol"""
+    return config['hostname'].startswith('redis://')
+
+
+def _make_resp(config):
+    """Factory function: produce a method issuing a command over RESP
+
+    The method accepts the context, command and payload as the Webdis
+    methods do, and optionally an argument to pass verbatim as is done with
+    the body of a PUT.
+    """
+    import redbiom._resp
+    conn = redbiom._resp.get_connection(config['hostname'])
+
+    def f(context, cmd, payload, data=None):
+        args = redbiom._resp.command_args(context, cmd, payload, data)
+        return redbiom._resp.as_webdis(cmd, conn.execute(args))
+    return f
+
+
+def make_post(config, redis_protocol=None, output=None):
+    """Factory function: produce a post() method
+
+    If redis_protocol is True, the commands are not issued, and are instead
+    written to output, a binary stream which defaults to standard output
+    (see redbiom._resp.open_mass_insertion).
+    """
     if redis_protocol:
         # for expensive load operations like feature data, it potentially
         # faster to use the native protocol. this writes out the redis
         # commands in their native for feeding into redis-cli --pipe. More
         # information can be found here:
         # https://redis.io/topics/mass-insert
-        def f(context, cmd, payload):
-            import sys
-            args = payload.split('/')
-            args[0] = ':'.join([context, args[0]])
-            args.insert(0, cmd)
-
-            # https://gist.github.com/laserson/2689744
-            proto = ''
-            proto += '*' + str(len(args)) + '\r\n'
-            for arg in args:
-                proto += '$' + str(len(bytes(str(arg), 'utf-8'))) + '\r\n'
-                proto += str(arg) + '\r\n'
-            sys.stdout.write(proto)
-            sys.stdout.flush()
+        import sys
+        import redbiom._resp
+
+        if output is None:
+            output = sys.stdout.buffer
+
+        # the arguments are decoded as they would be by Webdis, and the
+        # stream is relied on for buffering rather than flushing per command
+        def f(context, cmd, payload, verbose=False):
+            args = redbiom._resp.command_args(context, cmd, payload)
+            output.write(redbiom._resp.encode_command(args))
+    elif _uses_resp(config):
+        resp = _make_resp(config)
+
+        def f(context, cmd, payload, verbose=False):
+            return resp(context, cmd, payload)
     else:
+        s = get_session()
+
         def f(context, cmd, payload, verbose=False):
+            fmt = _wire_format(config)
             req = s.post(config['hostname'],
                          data=_format_request(context, cmd, payload,
-                                              as_bytes=True))
+                                              as_bytes=True, fmt=fmt))
 
             if verbose:
                 print(context, cmd, payload[:100])
@@ -77,60 +248,146 @@ def make_put(config):
     Within Webdis, PUT is generally used to provide content in the body for
     use as a file upload.
     """
-    import redbiom
+    if _uses_resp(config):
+        resp = _make_resp(config)
+
+        def f(context, cmd, key, data):
+            return resp(context, cmd, key, data)
+        return f
+
     s = get_session()
-    config = redbiom.get_config()
 
     def f(context, cmd, key, data):
+        fmt = _wire_format(config)
         url = '/'.join([config['hostname'],
-                        _format_request(context, cmd, key)])
+                        _format_request(context, cmd, key, fmt=fmt)])
         req = s.put(url, data=data)
         return _parse_validate_request(req, cmd)
     return f
 
 
 def make_get(config):
-    """Factory function: produce a get() method"""
-    import redbiom
+    """Factory function: produce a get() method
+
+    Responses to read-only commands are served from the on-disk cache if
+    REDBIOM_CACHE_DIR is set (see redbiom._response_cache).
+    """
+    import redbiom._response_cache as rc
+
+    get = _make_get(config)
+    return rc.cached(config, get, _get_cache_key, get)
+
+
+def _make_get(config):
+    """Factory function: produce an uncached get() method"""
+    if _uses_resp(config):
+        return _make_resp(config)
+
     s = get_session()
-    config = redbiom.get_config()
 
     def f(context, cmd, data):
-        payload = _format_request(context, cmd, data)
+        payload = _format_request(context, cmd, data,
+                                  fmt=_wire_format(config))
         url = '/'.join([config['hostname'], payload])
         return _parse_validate_request(s.get(url), cmd)
     return f
 
 
+def _get_cache_key(context, cmd, data):
+    """Identify a get() request within the response cache"""
+    import json
+    import redbiom._response_cache as rc
+
+    if cmd not in rc.CACHEABLE:
+        return None
+
+    # the state of the database, such as its timestamps and scripts, is
+    # not cached
+    key = data if context is None else '%s:%s' % (context, data)
+    if key.startswith('state:'):
+        return None
+
+    return json.dumps([cmd, key])
+
+
+def _script_cache_key(sha, *args):
+    """Identify a script_exec() request within the response cache"""
+    import json
+    return json.dumps(['EVALSHA', sha] + [str(a) for a in args])
+
+
 def make_script_exec(config):
-    """Factory function: produce a script_exec() method"""
-    import redbiom
+    """Factory function: produce a script_exec() method
+
+    Results are served from the on-disk cache if REDBIOM_CACHE_DIR is set
+    (see redbiom._response_cache).
+    """
     import json
+    import redbiom._response_cache as rc
+
+    if _uses_resp(config):
+        resp = _make_resp(config)
+
+        def f(sha, *args):
+            payload = [sha]
+            payload.extend([str(a) for a in args])
+            return json.loads(resp(None, 'EVALSHA', '/'.join(payload)))
+        return rc.cached(config, f, _script_cache_key, resp)
+
     s = get_session()
-    config = redbiom.get_config()
 
     def f(sha, *args):
         payload = [sha]
         payload.extend([str(a) for a in args])
         payload = '/'.join(payload)
-        data = _format_request(None, 'EVALSHA', payload)
+        data = _format_request(None, 'EVALSHA', payload,
+                               fmt=_wire_format(config))
         req = s.post(config['hostname'], data=data)
-        return json.loads(req.json()['EVALSHA'])
+        return json.loads(_parse_validate_request(req, 'EVALSHA'))
+
+    return rc.cached(config, f, _script_cache_key, _make_get(config))
+
+
+def make_pipeline(config):
+    """Factory function: produce a pipeline() method
+
+    The method accepts a list of (context, command, payload) tuples, and
+    returns the results in order with them. Over the Redis protocol, the
+    commands are issued in a single round trip. Over Webdis, the commands
+    are issued in sequence.
+    """
+    if _uses_resp(config):
+        import redbiom._resp
+        conn = redbiom._resp.get_connection(config['hostname'])
+
+        def f(commands):
+            args = [redbiom._resp.command_args(*c) for c in commands]
+            replies = conn.pipeline(args)
+            return [redbiom._resp.as_webdis(a[0], r)
+                    for a, r in zip(args, replies)]
+        return f
+
+    post = make_post(config)
 
+    def f(commands):
+        return [post(*c) for c in commands]
     return f
 
 
-def buffered(it, prefix, cmd, context, get=None, buffer_size=10,
-             multikey=None):
+def buffered(it, prefix, cmd, context, get=None, buffer_size=None,
+             multikey=None, in_flight=None, max_bytes=None):
     """Bulk fetch data
 
     Many of the commands within REDIS accept multiple arguments (e.g., MGET).
     This method facilitates the use of these bulk commands over an iterable
-    of items. The method will additionally "chunk" by a buffer_size as to
-    limit the size of the URL being constructed. The URLs have an upper bound
-    of around 100kb from testing -- this is limit is dependent on the client
-    and the server. It is not clear what the actual limit is for Webdis. As a
-    rule of thumb, the aim is to target requests for a few kb at a time.
+    of items. The method will additionally "chunk" by the encoded size of
+    the items as to limit the size of the URL being constructed. The URLs
+    have an upper bound of around 100kb from testing -- this is limit is
+    dependent on the client and the server. It is not clear what the actual
+    limit is for Webdis. As a rule of thumb, the aim is to target requests
+    for a few tens of kb at a time. A chunk which exceeds the bound, which
+    can only occur if a single item exceeds it, is sent in the body of a
+    POST rather than in the URL.
 
     Parameters
     ----------
@@ -145,45 +402,160 @@ def buffered(it, prefix, cmd, context, get=None, buffer_size=10,
     get : function, optional
         An existing get function
     buffer_size: int, optional
-        The number of items to query for at once. It is important to avoid
-        having a buffer size which may result in a URL exceeding 100kb as in
-        testing, that was not well support unsurprisingly.
+        The maximum number of items to query for at once. By default, the
+        number of items is bounded only by max_bytes.
     multikey: string, optional
         For hashbucket commands, like HMGET, where there is an outer and inner
         key.
+    in_flight : int, optional
+        The number of chunks to request without waiting on the results of
+        prior chunks. If not specified, REDBIOM_MAX_WORKERS is used. The
+        results are yielded in order regardless.
+    max_bytes : int, optional
+        The approximate number of bytes of the items to query for at once.
+        If not specified, REDBIOM_BUFFER_BYTES is used.
+
+    Notes
+    -----
+    When more than one chunk is in flight, get is not used. Instead, the
+    chunks are pipelined over a single connection with a redis:// host, or
+    are requested concurrently, each thread with its own session, through
+    Webdis.
     """
-    if get is None:
-        import redbiom
-        config = redbiom.get_config()
-        get = make_get(config)
+    import redbiom
+    config = redbiom.get_config()
+
+    if in_flight is None:
+        in_flight = config['max_workers']
+
+    if max_bytes is None:
+        max_bytes = config['buffer_bytes']
 
+    payloads = _buffered_payloads(it, prefix, context, buffer_size, multikey,
+                                  max_bytes)
+
+    if in_flight <= 1:
+        if get is None:
+            get = make_get(config)
+        post = None
+
+        for items, bulk in payloads:
+            if _oversized(bulk, max_bytes):
+                if post is None:
+                    post = make_post(config)
+                yield items, post(None, cmd, bulk)
+            else:
+                yield items, get(None, cmd, bulk)
+
+    elif _uses_resp(config):
+        from itertools import islice
+        pipeline = make_pipeline(config)
+
+        block = list(islice(payloads, in_flight))
+        while block:
+            results = pipeline([(None, cmd, bulk) for _, bulk in block])
+            for (items, _), result in zip(block, results):
+                yield items, result
+            block = list(islice(payloads, in_flight))
+
+    else:
+        def fetch(payload):
+            # the method is constructed per call so that the session of the
+            # thread is used
+            items, bulk = payload
+            if _oversized(bulk, max_bytes):
+                method = make_post(config)
+            else:
+                method = make_get(config)
+            return items, method(None, cmd, bulk)
+
+        for result in parallel_map(fetch, payloads, in_flight):
+            yield result
+
+
+def _buffered_payloads(it, prefix, context, buffer_size, multikey,
+                       max_bytes):
+    """Form the chunked payloads of buffered
+
+    Parameters are as described by buffered. Each chunk is yielded as a
+    tuple of the items and the "/" delimited payload for them.
+    """
     if multikey is None:
         prefixer = lambda a, b, c: '%s:%s:%s' % (a, b, c)
+        header = ''
     else:
         prefixer = lambda a, b, c: c
+        header = "%s:%s/" % (context, multikey)
 
-    it = iter(it)
-    exhausted = False
-    while not exhausted:
-        items = []
-        for i in range(buffer_size):
-            try:
-                items.append(next(it).strip())
-            except StopIteration:
-                exhausted = True
-                break
+    # the header is part of every payload
+    max_bytes = max(max_bytes - len(header.encode('utf-8')), 1)
 
+    items = (i.strip() for i in it)
+    batches = batch_by_size(items, max_bytes, buffer_size,
+                            key=lambda i: prefixer(context, prefix, i))
+    for items in batches:
         # it may be possible to use _format_request here
         bulk = '/'.join([prefixer(context, prefix, i) for i in items])
-        if multikey:
-            bulk = "%s:%s/%s" % (context, multikey, bulk)
+        yield items, header + bulk
 
-        if bulk:
-            yield items, get(None, cmd, bulk)
+
+def _oversized(payload, max_bytes):
+    """Test if a payload exceeds what should be placed in a URL"""
+    return len(payload.encode('utf-8')) > max_bytes
+
+
+def batch_by_size(it, max_bytes, max_items=None, key=None):
+    """Group items into batches bounded by their encoded size
+
+    Parameters
+    ----------
+    it : iterable
+        The items to batch
+    max_bytes : int
+        The approximate upper bound, in bytes, for the "/" delimited payload
+        formed by a batch. A single item exceeding the bound is yielded as
+        its own batch.
+    max_items : int, optional
+        An upper bound on the number of items in a batch.
+    key : function, optional
+        A function producing the str which represents an item in the
+        payload. By default, the items are assumed to be str.
+
+    Returns
+    -------
+    generator of list
+        The batches, in order with the input.
+    """
+    batch = []
+    size = 0
+    for item in it:
+        formed = item if key is None else key(item)
+        nbytes = len(formed.encode('utf-8')) + 1  # +1 for the delimiter
+        full = max_items is not None and len(batch) >= max_items
+        if batch and (full or size + nbytes > max_bytes):
+            yield batch
+            batch = []
+            size = 0
+
+        batch.append(item)
+        size += nbytes
+
+    if batch:
+        yield batch
 
 
 def valid(context, get=None):
-    """Test if a context exists"""
+    """Test if a context exists
+
+    The result is retained for REDBIOM_CACHE_TTL seconds (see
+    redbiom.cache).
+    """
+    import redbiom.cache
+    redbiom.cache.lookup('valid', (context, ), lambda: _valid(context, get))
+
+
+def _valid(context, get=None):
+    """Test if a context exists, without caching the result"""
     if get is None:
         import redbiom
         config = redbiom.get_config()
@@ -0,0 +1,285 @@
+"""Direct access to Redis over its native protocol (RESP)
+
+This transport is used when REDBIOM_HOST is of the form
+redis://[:password@]host[:port][/db], and bypasses Webdis. Commands are
+expressed as they are for Webdis, with "/" delimited and URL encoded
+arguments, and the replies are represented as Webdis represents them, so
+that the transports are interchangeable.
+
+Connections are maintained per process, thread and host.
+"""
+
+
+# the number of bytes buffered when writing commands for mass insertion
+MASS_INSERTION_BUFFER = 8 * 1024 * 1024
+
+
+class _Status(str):
+    """A simple string (e.g., OK) reply"""
+    pass
+
+
+class _Error(object):
+    """An error reply"""
+    def __init__(self, message):
+        self.message = message
+
+
+def parse_hostname(hostname):
+    """Decompose a redis:// URL
+
+    Parameters
+    ----------
+    hostname : str
+        The URL, e.g., redis://127.0.0.1:6379/0
+
+    Returns
+    -------
+    tuple
+        The host, port, database and password
+    """
+    from urllib.parse import urlsplit
+
+    parts = urlsplit(hostname)
+    if parts.scheme != 'redis':
+        raise ValueError("Not a redis:// URL: %s" % hostname)
+
+    db = parts.path.strip('/')
+    db = int(db) if db else 0
+
+    return (parts.hostname or '127.0.0.1', parts.port or 6379, db,
+            parts.password)
+
+
+def encode_command(args):
+    """Encode a command as a RESP array of bulk strings
+
+    Parameters
+    ----------
+    args : list of str or bytes
+        The command and its arguments
+
+    Returns
+    -------
+    bytes
+        The encoded command
+    """
+    out = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode('utf-8')
+        out.append(b'$%d\r\n' % len(arg))
+        out.append(arg)
+        out.append(b'\r\n')
+    return b''.join(out)
+
+
+def open_mass_insertion(path=None):
+    """Open a stream to write commands for mass insertion to
+
+    Parameters
+    ----------
+    path : str, optional
+        The file to write to, which is gzip compressed if it ends in ".gz".
+        If not provided, or "-", standard output is used.
+
+    Returns
+    -------
+    io.BufferedWriter
+        A binary stream, which is buffered by MASS_INSERTION_BUFFER bytes.
+
+    Notes
+    -----
+    The commands can be loaded with "redis-cli --pipe", see
+    https://redis.io/topics/mass-insert
+    """
+    import gzip
+    import io
+    import sys
+
+    if path is None or path == '-':
+        sys.stdout.flush()
+        return open(sys.stdout.fileno(), 'wb', closefd=False,
+                    buffering=MASS_INSERTION_BUFFER)
+    elif path.endswith('.gz'):
+        return io.BufferedWriter(gzip.open(path, 'wb', compresslevel=6),
+                                 buffer_size=MASS_INSERTION_BUFFER)
+    else:
+        return open(path, 'wb', buffering=MASS_INSERTION_BUFFER)
+
+
+def command_args(context, cmd, payload, data=None):
+    """Form the arguments of a command as Webdis would
+
+    Parameters
+    ----------
+    context : str or None
+        The context to prefix the first argument with
+    cmd : str
+        The Redis command
+    payload : str
+        The "/" delimited, URL encoded, arguments
+    data : str, optional
+        An argument to append verbatim, as Webdis does with the body of a
+        PUT.
+
+    Returns
+    -------
+    list of str
+        The command and its arguments
+    """
+    from urllib.parse import unquote_plus
+
+    if context is not None:
+        payload = '%s:%s' % (context, payload)
+
+    # most arguments, such as packed counts, have nothing to decode
+    args = [cmd]
+    args.extend([unquote_plus(a) if '%' in a or '+' in a else a
+                 for a in payload.split('/')])
+    if data is not None:
+        args.append(data)
+    return args
+
+
+def as_webdis(cmd, reply):
+    """Represent a reply as Webdis would
+
+    Parameters
+    ----------
+    cmd : str
+        The command the reply is for
+    reply : object
+        The parsed reply
+
+    Returns
+    -------
+    object
+        The reply, where simple strings are [True, str], errors are
+        [False, str], and the reply of HGETALL is a dict.
+    """
+    if isinstance(reply, _Error):
+        return [False, reply.message]
+    elif isinstance(reply, _Status):
+        return [True, str(reply)]
+    elif cmd.upper() == 'HGETALL' and isinstance(reply, list):
+        return dict(zip(reply[::2], reply[1::2]))
+    else:
+        return reply
+
+
+class Connection(object):
+    """A connection to Redis
+
+    Parameters
+    ----------
+    hostname : str
+        A redis:// URL
+
+    Notes
+    -----
+    The connection is established on first use, and reestablished on use
+    after a socket error.
+    """
+    def __init__(self, hostname):
+        self.hostname = hostname
+        self._sock = None
+        self._reader = None
+
+    def _connect(self):
+        import socket
+
+        host, port, db, password = parse_hostname(self.hostname)
+        self._sock = socket.create_connection((host, port))
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._sock.makefile('rb')
+
+        setup = []
+        if password:
+            setup.append(['AUTH', password])
+        if db:
+            setup.append(['SELECT', db])
+        for args, reply in zip(setup, self._pipeline(setup)):
+            if isinstance(reply, _Error):
+                self.close()
+                raise ConnectionError("%s failed: %s" % (args[0],
+                                                         reply.message))
+
+    def close(self):
+        """Close the connection"""
+        if self._sock is not None:
+            self._reader.close()
+            self._sock.close()
+        self._sock = None
+        self._reader = None
+
+    def _read(self):
+        line = self._reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError("Connection to %s lost" % self.hostname)
+
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return _Status(rest.decode('utf-8'))
+        elif kind == b'-':
+            return _Error(rest.decode('utf-8'))
+        elif kind == b':':
+            return int(rest)
+        elif kind == b'$':
+            size = int(rest)
+            if size == -1:
+                return None
+            return self._reader.read(size + 2)[:-2].decode('utf-8')
+        elif kind == b'*':
+            size = int(rest)
+            if size == -1:
+                return None
+            return [self._read() for _ in range(size)]
+        else:
+            raise ConnectionError("Unexpected reply from %s: %r"
+                                  % (self.hostname, line))
+
+    def _pipeline(self, commands):
+        self._sock.sendall(b''.join([encode_command(c) for c in commands]))
+        return [self._read() for _ in commands]
+
+    def pipeline(self, commands):
+        """Issue commands in a single round trip
+
+        Parameters
+        ----------
+        commands : list of list of str
+            The commands, each including its arguments
+
+        Returns
+        -------
+        list
+            The parsed replies, in order with the commands. Error replies
+            are represented as _Error.
+        """
+        if self._sock is None:
+            self._connect()
+
+        try:
+            return self._pipeline(commands)
+        except (OSError, ValueError):
+            # the state of the stream is unknown, so it cannot be reused
+            self.close()
+            raise
+
+    def execute(self, args):
+        """Issue a single command, and return its parsed reply"""
+        return self.pipeline([args])[0]
+
+
+def get_connection(hostname):
+    """Get the connection for the current process, thread and host"""
+    import redbiom
+    import threading
+    import os
+
+    key = (os.getpid(), threading.get_ident(), hostname)
+    if key not in redbiom.active_connections:
+        redbiom.active_connections[key] = Connection(hostname)
+
+    return redbiom.active_connections[key]
@@ -0,0 +1,312 @@
+"""An on-disk cache of responses to read-only requests
+
+The cache is used when REDBIOM_CACHE_DIR is set. Responses are stored in an
+SQLite database per host under <REDBIOM_CACHE_DIR>/responses, and the least
+recently used are evicted once the cache exceeds REDBIOM_CACHE_BYTES.
+
+The cache is discarded wholesale when the timestamps of the database
+(state:timestamps, see redbiom.admin.create_timestamp) change, which is
+checked at most every VALIDATE_SECONDS per process, and when the database
+is written to through redbiom.admin (see invalidate). Nothing is cached for
+a database without timestamps, as there would be no indication of an update.
+"""
+
+# the commands whose responses may be cached. EVALSHA is limited to those
+# issued through redbiom._requests.make_script_exec, which only executes
+# read-only scripts
+CACHEABLE = frozenset(['SMEMBERS', 'SCARD', 'SISMEMBER', 'HGET', 'HMGET',
+                       'HGETALL', 'HKEYS', 'HEXISTS', 'LRANGE', 'EVALSHA'])
+
+# the maximum age, in seconds, of the validation of a cache against the
+# timestamps of the database
+VALIDATE_SECONDS = 60
+
+# {(pid, hostname, cache directory): ResponseCache}
+_caches = {}
+
+
+def timestamp_token(get):
+    """Describe the timestamps of the database
+
+    Parameters
+    ----------
+    get : function
+        An uncached get() method
+
+    Returns
+    -------
+    list or None
+        The number of timestamps and the latest timestamp, or None if the
+        database does not have timestamps.
+
+    Redis command summary
+    ---------------------
+    LLEN state:timestamps
+    LINDEX state:timestamps 0
+    """
+    n_timestamps = get('state', 'LLEN', 'timestamps')
+    if not n_timestamps:
+        return None
+
+    return [n_timestamps, get('state', 'LINDEX', 'timestamps/0')]
+
+
+class ResponseCache(object):
+    """A size bounded, least recently used, cache of responses
+
+    Parameters
+    ----------
+    path : str
+        The SQLite database to store the responses in
+    max_bytes : int
+        The upper bound on the size of the responses stored
+
+    Notes
+    -----
+    Responses are stored JSON encoded. The cache may be shared by threads
+    and by processes.
+    """
+    def __init__(self, path, max_bytes):
+        import os
+        import sqlite3
+        import threading
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses "
+                         "(key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                         "size INTEGER NOT NULL, used REAL NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS state "
+                         "(name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._lock = threading.Lock()
+
+        self.max_bytes = max_bytes
+        self.enabled = False
+        self.validated = None
+
+    def validate(self, token):
+        """Discard the responses if the token differs from that stored
+
+        Parameters
+        ----------
+        token : object
+            A JSON serializable description of the state of the database,
+            or None if the state cannot be described, in which case the
+            cache is disabled.
+        """
+        import json
+        import time
+
+        encoded = json.dumps(token)
+        with self._lock:
+            self.validated = time.time()
+            self.enabled = token is not None
+
+            row = self._db.execute("SELECT value FROM state "
+                                   "WHERE name = 'token'").fetchone()
+            if row is not None and row[0] == encoded:
+                return
+
+            with self._db:
+                self._db.execute("BEGIN IMMEDIATE")
+                self._db.execute("DELETE FROM responses")
+                self._db.execute("INSERT OR REPLACE INTO state "
+                                 "VALUES ('token', ?)", (encoded, ))
+
+    def get(self, key):
+        """Obtain a response
+
+        Returns
+        -------
+        tuple of (bool, object)
+            Whether the response is cached, and the response.
+        """
+        import json
+        import time
+
+        with self._lock:
+            row = self._db.execute("SELECT value FROM responses "
+                                   "WHERE key = ?", (key, )).fetchone()
+            if row is None:
+                return False, None
+
+            self._db.execute("UPDATE responses SET used = ? WHERE key = ?",
+                             (time.time(), key))
+        return True, json.loads(row[0])
+
+    def put(self, key, value):
+        """Store a response, evicting the least recently used as needed"""
+        import json
+        import time
+
+        encoded = json.dumps(value)
+        size = len(encoded)
+        if size > self.max_bytes:
+            return
+
+        with self._lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.execute("INSERT OR REPLACE INTO responses "
+                             "VALUES (?, ?, ?, ?)",
+                             (key, encoded, size, time.time()))
+
+            total, = self._db.execute("SELECT COALESCE(SUM(size), 0) "
+                                      "FROM responses").fetchone()
+            if total <= self.max_bytes:
+                return
+
+            evict = []
+            for old_key, old_size in self._db.execute(
+                    "SELECT key, size FROM responses ORDER BY used"):
+                if total <= self.max_bytes:
+                    break
+                evict.append((old_key, ))
+                total -= old_size
+            self._db.executemany("DELETE FROM responses WHERE key = ?", evict)
+
+    def clear(self):
+        """Discard the responses, and require the cache to be validated"""
+        with self._lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.execute("DELETE FROM responses")
+            self.validated = None
+
+    def close(self):
+        """Close the database"""
+        self._db.close()
+
+
+def cache_path(config):
+    """The SQLite database of the response cache for a host"""
+    import hashlib
+    import os
+
+    name = hashlib.sha1(config['hostname'].encode('utf-8')).hexdigest()
+    return os.path.join(os.path.expanduser(config['cache_dir']), 'responses',
+                        '%s.sqlite' % name)
+
+
+def get_cache(config, get):
+    """Obtain the valid response cache for a host, if there is one
+
+    Parameters
+    ----------
+    config : dict
+        The redbiom configuration
+    get : function
+        An uncached get() method, used to validate the cache
+
+    Returns
+    -------
+    ResponseCache or None
+        The cache, or None if caching is not enabled, or is not possible.
+    """
+    import os
+    import time
+
+    if not config.get('cache_dir'):
+        return None
+
+    key = (os.getpid(), config['hostname'], config['cache_dir'])
+    cache = _caches.get(key)
+    if cache is None:
+        cache = ResponseCache(cache_path(config), config['cache_bytes'])
+        _caches[key] = cache
+
+    if cache.validated is None or \
+            time.time() - cache.validated > VALIDATE_SECONDS:
+        cache.validate(timestamp_token(get))
+
+    return cache if cache.enabled else None
+
+
+def invalidate(config):
+    """Discard the cached responses for a host
+
+    Parameters
+    ----------
+    config : dict
+        The redbiom configuration
+
+    Notes
+    -----
+    The database may be modified without its timestamps changing, such as
+    by redbiom.admin, and responses cached prior to the modification would
+    otherwise be served until the timestamps next change. The cache is
+    shared by processes, so the responses are discarded for them as well.
+    """
+    import os
+    import sqlite3
+
+    if not config.get('cache_dir'):
+        return
+
+    key = (os.getpid(), config['hostname'], config['cache_dir'])
+    cache = _caches.get(key)
+    try:
+        if cache is None:
+            path = cache_path(config)
+            if not os.path.exists(path):
+                return
+            cache = ResponseCache(path, config['cache_bytes'])
+            _caches[key] = cache
+
+        cache.clear()
+    except sqlite3.Error:
+        # the cache is an optimization, and is not essential
+        pass
+
+
+def cached(config, f, key, get):
+    """Serve the responses of a request method from the cache
+
+    Parameters
+    ----------
+    config : dict
+        The redbiom configuration
+    f : function
+        A request method, such as produced by redbiom._requests.make_get
+    key : function
+        A function of the arguments to f, producing a str which identifies
+        the request, or None if the request is not to be cached.
+    get : function
+        An uncached get() method, used to validate the cache
+
+    Returns
+    -------
+    function
+        A request method with the same signature as f.
+    """
+    import sqlite3
+
+    if not config.get('cache_dir'):
+        return f
+
+    def cached_f(*args):
+        formed = key(*args)
+        if formed is None:
+            return f(*args)
+
+        try:
+            cache = get_cache(config, get)
+            if cache is None:
+                return f(*args)
+
+            hit, value = cache.get(formed)
+        except sqlite3.Error:
+            # the cache is an optimization, and is not essential
+            return f(*args)
+
+        if hit:
+            return value
+
+        value = f(*args)
+        try:
+            cache.put(formed, value)
+        except sqlite3.Error:
+            pass
+        return value
+
+    return cached_f
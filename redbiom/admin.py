@@ -1,5 +1,6 @@
 from urllib.parse import quote_plus as _quote_plus
 from math import ceil
+from itertools import chain
 import numpy as np
 
 
@@ -63,6 +64,47 @@ class ScriptManager:
                         call_in_chunks('LPUSH', KEYS[idx], items)
                     end
                     return redis.status_reply("OK")""",
+                'load-batch': """
+                    -- KEYS[1] is the load journal, KEYS[2] is the set of
+                    -- identifiers represented, and the remaining KEYS are
+                    -- those of the identifiers in the batch. ARGV[1] names
+                    -- the batch, and is followed by the packed data of each
+                    -- key, and then by the identifiers themselves. A batch
+                    -- the journal notes as loaded is not loaded again, which
+                    -- allows for an interrupted load to be resumed
+                    if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+                        return 0
+                    end
+
+                    -- see load-data
+                    local call_in_chunks = function (command, key, args)
+                        local step = 7900
+                        for i = 1, #args, step do
+                            redis.call(command,
+                                       key,
+                                       unpack(args,
+                                              i,
+                                              math.min(i + step - 1, #args)))
+                        end
+                    end
+
+                    local n = #KEYS - 2
+                    for idx = 1, n do
+                        local items = {}
+                        for item in string.gmatch(ARGV[idx + 1], "([^|]+)") do
+                            table.insert(items, item)
+                        end
+                        call_in_chunks('LPUSH', KEYS[idx + 2], items)
+                    end
+
+                    local ids = {}
+                    for idx = n + 2, #ARGV do
+                        table.insert(ids, ARGV[idx])
+                    end
+                    call_in_chunks('SADD', KEYS[2], ids)
+
+                    redis.call('HSET', KEYS[1], ARGV[1], '1')
+                    return 1""",
                 'fetch-feature': """
                     local context = ARGV[1]
                     local key = ARGV[2]
@@ -73,18 +115,33 @@ class ScriptManager:
                                              formedkey,
                                              '0', '-1')
 
-                    -- adapted from https://gist.github.com/klovadis/5170446
-                    local resultkey
+                    -- the list is composed of index, value pairs. gather
+                    -- the indices so they can be resolved in bulk
+                    local indices = {}
+                    for idx = 1, #items, 2 do
+                        table.insert(indices, items[idx])
+                    end
+
+                    -- resolve the indices with HMGET, chunked to remain
+                    -- under the Lua stack limit (see load-data)
                     local ii = context .. ':' .. 'sample' .. '-index-inverted'
-                    for idx, v in ipairs(items) do
-                        if idx % 2 == 1 then
-                            -- it is likely possible to issue a HMGET
-                            resultkey = redis.call('HGET', ii, v)
-                        else
-                            result[resultkey] = tonumber(v)
+                    local step = 7900
+                    local names = {}
+                    for i = 1, #indices, step do
+                        local chunk = redis.call('HMGET', ii,
+                                                 unpack(indices,
+                                                        i,
+                                                        math.min(i + step - 1,
+                                                                 #indices)))
+                        for _, name in ipairs(chunk) do
+                            table.insert(names, name)
                         end
                     end
 
+                    for position, name in ipairs(names) do
+                        result[name] = tonumber(items[position * 2])
+                    end
+
                     return cjson.encode(result)""",
                 'fetch-sample': """
                     local context = ARGV[1]
@@ -96,21 +153,500 @@ class ScriptManager:
                                              formedkey,
                                              '0', '-1')
 
-                    -- adapted from https://gist.github.com/klovadis/5170446
-                    local resultkey
+                    -- the list is composed of index, value pairs. gather
+                    -- the indices so they can be resolved in bulk
+                    local indices = {}
+                    for idx = 1, #items, 2 do
+                        table.insert(indices, items[idx])
+                    end
+
+                    -- resolve the indices with HMGET, chunked to remain
+                    -- under the Lua stack limit (see load-data)
                     local ii = context .. ':' .. 'feature' .. '-index-inverted'
-                    for idx, v in ipairs(items) do
-                        if idx % 2 == 1 then
-                            -- it is likely possible to issue a HMGET
-                            resultkey = redis.call('HGET', ii, v)
+                    local step = 7900
+                    local names = {}
+                    for i = 1, #indices, step do
+                        local chunk = redis.call('HMGET', ii,
+                                                 unpack(indices,
+                                                        i,
+                                                        math.min(i + step - 1,
+                                                                 #indices)))
+                        for _, name in ipairs(chunk) do
+                            table.insert(names, name)
+                        end
+                    end
+
+                    for position, name in ipairs(names) do
+                        result[name] = tonumber(items[position * 2])
+                    end
+
+                    return cjson.encode(result)""",
+                'fetch-indexed': """
+                    local context = ARGV[1]
+                    local axis = ARGV[2]
+                    local result = {}
+
+                    -- ARGV[3] onward are the IDs to obtain. the index, value
+                    -- pairs are returned as stored, and the resolution of
+                    -- the indices is left to the caller. as the same
+                    -- indices tend to recur across many IDs, this avoids
+                    -- repeatedly sending large identifiers like sOTUs
+                    for position = 3, #ARGV do
+                        local key = ARGV[position]
+                        local formedkey = context .. ':' .. axis .. ':' .. key
+                        local items = redis.call('LRANGE',
+                                                 formedkey,
+                                                 '0', '-1')
+                        for idx, v in ipairs(items) do
+                            items[idx] = tonumber(v)
+                        end
+                        result[key] = items
+                    end
+
+                    return cjson.encode(result)""",
+                'ids-from': """
+                    local context = ARGV[1]
+                    local axis = ARGV[2]
+                    local exact = ARGV[3] == '1'
+                    local min_count = tonumber(ARGV[4])
+                    local other
+                    if axis == 'feature' then
+                        other = 'sample'
+                    else
+                        other = 'feature'
+                    end
+
+                    -- ARGV[5] onward are the IDs to search with. the
+                    -- indices of the other axis associated with each ID
+                    -- are either intersected or unioned, and only the
+                    -- indices which remain are resolved
+                    local keys = {}
+                    for position = 5, #ARGV do
+                        table.insert(keys, context .. ':' .. axis .. ':' ..
+                                           ARGV[position])
+                    end
+
+                    -- for an intersection, process the shortest lists
+                    -- first as the candidates can only shrink
+                    if exact then
+                        local lengths = {}
+                        for _, key in ipairs(keys) do
+                            lengths[key] = redis.call('LLEN', key)
+                        end
+                        table.sort(keys, function (a, b)
+                            return lengths[a] < lengths[b]
+                        end)
+                    end
+
+                    -- the number of list elements to examine at a time
+                    -- when probing for candidates. this must be even as
+                    -- the lists are composed of index, value pairs
+                    local probe = 10000
+
+                    local retained = nil
+                    local remaining = 0
+                    for _, key in ipairs(keys) do
+                        if retained == nil or not exact then
+                            local items = redis.call('LRANGE', key, '0', '-1')
+                            local observed = {}
+                            for idx = 1, #items, 2 do
+                                if tonumber(items[idx + 1]) >= min_count then
+                                    observed[items[idx]] = true
+                                end
+                            end
+
+                            if retained == nil then
+                                retained = observed
+                                for _, _ in pairs(observed) do
+                                    remaining = remaining + 1
+                                end
+                            else
+                                for index, _ in pairs(observed) do
+                                    retained[index] = true
+                                end
+                            end
                         else
-                            result[resultkey] = tonumber(v)
+                            -- the intersection is empty, and cannot become
+                            -- otherwise
+                            if remaining == 0 then
+                                break
+                            end
+
+                            -- only the candidates are of interest, so stop
+                            -- examining the list once all are observed
+                            local observed = {}
+                            local found = 0
+                            local start = 0
+                            while found < remaining do
+                                local items = redis.call('LRANGE', key, start,
+                                                         start + probe - 1)
+                                if #items == 0 then
+                                    break
+                                end
+
+                                for idx = 1, #items, 2 do
+                                    local index = items[idx]
+                                    if retained[index] and
+                                            not observed[index] and
+                                            tonumber(items[idx + 1]) >=
+                                            min_count then
+                                        observed[index] = true
+                                        found = found + 1
+                                    end
+                                end
+                                start = start + probe
+                            end
+                            retained = observed
+                            remaining = found
+                        end
+                    end
+
+                    local indices = {}
+                    for index, _ in pairs(retained or {}) do
+                        table.insert(indices, index)
+                    end
+
+                    -- resolve the indices with HMGET, chunked to remain
+                    -- under the Lua stack limit (see load-data)
+                    local ii = context .. ':' .. other .. '-index-inverted'
+                    local step = 7900
+                    local names = {}
+                    for i = 1, #indices, step do
+                        local chunk = redis.call('HMGET', ii,
+                                                 unpack(indices,
+                                                        i,
+                                                        math.min(i + step - 1,
+                                                                 #indices)))
+                        for _, name in ipairs(chunk) do
+                            table.insert(names, name)
                         end
                     end
 
-                    return cjson.encode(result)"""}
-    _admin_scripts = ('get-index', 'load-data')
-    _cache = {}
+                    return cjson.encode(names)""",
+                'index-ambiguities': """
+                    -- KEYS[1] is the ambiguity index, a hash of untagged
+                    -- sample IDs to a JSON array of their tagged IDs, KEYS[2]
+                    -- is the number of tagged IDs indexed, and ARGV are the
+                    -- tagged IDs to index
+                    local added = 0
+                    for _, tagged in ipairs(ARGV) do
+                        local sep = string.find(tagged, '_', 1, true)
+                        if sep then
+                            local untagged = string.sub(tagged, sep + 1)
+                            local current = redis.call('HGET', KEYS[1],
+                                                       untagged)
+                            local known = {}
+                            if current then
+                                known = cjson.decode(current)
+                            end
+
+                            local present = false
+                            for _, id in ipairs(known) do
+                                if id == tagged then
+                                    present = true
+                                    break
+                                end
+                            end
+
+                            if not present then
+                                table.insert(known, tagged)
+                                redis.call('HSET', KEYS[1], untagged,
+                                           cjson.encode(known))
+                                added = added + 1
+                            end
+                        end
+                    end
+                    redis.call('INCRBY', KEYS[2], added)
+                    return added""",
+                'ambiguities': """
+                    -- ARGV[1] is the context, and ARGV[2] onward are untagged
+                    -- sample IDs. the index is only of use if it describes
+                    -- every sample represented in the context
+                    local context = ARGV[1]
+                    local size = redis.call('GET',
+                                            context .. ':ambiguity-index-size')
+                    local represented = redis.call('SCARD',
+                                                   context ..
+                                                   ':samples-represented')
+                    if tonumber(size or '-1') ~= represented then
+                        return cjson.encode(false)
+                    end
+
+                    local ids = {}
+                    for position = 2, #ARGV do
+                        table.insert(ids, ARGV[position])
+                    end
+
+                    -- chunked to remain under the Lua stack limit (see
+                    -- load-data)
+                    local index = context .. ':ambiguity-index'
+                    local step = 7900
+                    local result = {}
+                    for i = 1, #ids, step do
+                        local chunk = redis.call('HMGET', index,
+                                                 unpack(ids,
+                                                        i,
+                                                        math.min(i + step - 1,
+                                                                 #ids)))
+                        for offset, value in ipairs(chunk) do
+                            if value then
+                                result[ids[i + offset - 1]] =
+                                    cjson.decode(value)
+                            end
+                        end
+                    end
+
+                    return cjson.encode(result)""",
+                'index-categories': """
+                    -- ARGV are sample IDs. The categories of each sample, as
+                    -- stored in metadata:categories:<id>, are expressed as
+                    -- the set metadata:categories-set:<id>, which also holds
+                    -- the empty string so that it exists for samples without
+                    -- informative categories. The number of samples with a
+                    -- set is maintained under metadata:categories-set-size
+                    local added = 0
+                    for _, id in ipairs(ARGV) do
+                        local encoded = redis.call('GET',
+                                                   'metadata:categories:' ..
+                                                   id)
+                        if encoded then
+                            local key = 'metadata:categories-set:' .. id
+                            if redis.call('EXISTS', key) == 0 then
+                                added = added + 1
+                            end
+
+                            local columns = cjson.decode(encoded)
+                            table.insert(columns, '')
+
+                            -- chunked to remain under the Lua stack limit
+                            -- (see load-data)
+                            redis.call('DEL', key)
+                            local step = 7900
+                            for i = 1, #columns, step do
+                                redis.call('SADD', key,
+                                           unpack(columns,
+                                                  i,
+                                                  math.min(i + step - 1,
+                                                           #columns)))
+                            end
+                        end
+                    end
+                    redis.call('INCRBY', 'metadata:categories-set-size',
+                               added)
+                    return added""",
+                'sample-categories': """
+                    -- ARGV[1] is either "common" or "all", and ARGV[2] onward
+                    -- are sample IDs. The sets of categories (see
+                    -- index-categories) are only of use if every sample with
+                    -- metadata has one
+                    local size = redis.call('GET',
+                                            'metadata:categories-set-size')
+                    local represented = redis.call('SCARD',
+                                                   'metadata:samples-' ..
+                                                   'represented')
+                    if tonumber(size or '-1') ~= represented then
+                        return cjson.encode(false)
+                    end
+
+                    -- samples without metadata are ignored
+                    local keys = {}
+                    for position = 2, #ARGV do
+                        local id = ARGV[position]
+                        if redis.call('EXISTS',
+                                      'metadata:categories:' .. id) == 1 then
+                            table.insert(keys,
+                                         'metadata:categories-set:' .. id)
+                        end
+                    end
+
+                    local command = 'SUNION'
+                    if ARGV[1] == 'common' then
+                        command = 'SINTER'
+                    end
+
+                    -- chunked to remain under the Lua stack limit (see
+                    -- load-data), where the columns of an intersection must
+                    -- be observed in every chunk
+                    local step = 7900
+                    local chunks = 0
+                    local observed = {}
+                    for i = 1, #keys, step do
+                        local members = redis.call(command,
+                                                   unpack(keys,
+                                                          i,
+                                                          math.min(i + step -
+                                                                   1,
+                                                                   #keys)))
+                        chunks = chunks + 1
+                        for _, member in ipairs(members) do
+                            observed[member] = (observed[member] or 0) + 1
+                        end
+                    end
+
+                    local columns = {}
+                    for member, count in pairs(observed) do
+                        if member ~= '' and
+                                (command == 'SUNION' or count == chunks) then
+                            table.insert(columns, member)
+                        end
+                    end
+
+                    return cjson.encode({found=#keys, columns=columns})""",
+                'where': """
+                    -- ARGV[1] is a plan of a where clause (see
+                    -- redbiom.where_expr.compile_plan), and the IDs of the
+                    -- samples satisfying it are returned
+                    local plan = cjson.decode(ARGV[1])
+
+                    local comparisons = {
+                        lt = function (a, b) return a < b end,
+                        le = function (a, b) return a <= b end,
+                        gt = function (a, b) return a > b end,
+                        ge = function (a, b) return a >= b end,
+                        eq = function (a, b) return a == b end,
+                        ne = function (a, b) return a ~= b end}
+
+                    -- values are interpreted as pandas.to_numeric does,
+                    -- where tonumber alone would also accept hexadecimal
+                    local numeric = function (value)
+                        local stripped = string.match(value, '^%s*(.-)%s*$')
+                        local lowered = string.lower(stripped)
+                        local sign, word = string.match(lowered,
+                                                        '^([-+]?)(%a+)$')
+                        if word == 'inf' or word == 'infinity' then
+                            if sign == '-' then
+                                return -math.huge
+                            end
+                            return math.huge
+                        end
+
+                        if not string.find(stripped,
+                                           '^[-+]?[%d.]+[eE]?[-+]?%d*$') then
+                            return nil
+                        end
+                        return tonumber(stripped)
+                    end
+
+                    -- the ranges of scores satisfying a comparison against
+                    -- a category indexed as a sorted set (see
+                    -- redbiom.admin.index_numeric_category)
+                    local ranges = {
+                        lt = function (v) return {{'-inf', '(' .. v}} end,
+                        le = function (v) return {{'-inf', v}} end,
+                        gt = function (v) return {{'(' .. v, '+inf'}} end,
+                        ge = function (v) return {{v, '+inf'}} end,
+                        eq = function (v) return {{v, v}} end,
+                        ne = function (v)
+                            return {{'-inf', '(' .. v}, {'(' .. v, '+inf'}}
+                        end}
+
+                    local indexed = function (name)
+                        return redis.call('SISMEMBER',
+                                          'metadata:numeric-represented',
+                                          name) == 1
+                    end
+
+                    -- {sample: value} of each category used
+                    local categories = {}
+                    local category = function (name)
+                        if categories[name] == nil then
+                            local values = {}
+                            local flat = redis.call('HGETALL',
+                                                    'metadata:category:' ..
+                                                    name)
+                            for i = 1, #flat, 2 do
+                                values[flat[i]] = flat[i + 1]
+                            end
+                            categories[name] = values
+                        end
+                        return categories[name]
+                    end
+
+                    local evaluate
+                    evaluate = function (node)
+                        local found = {}
+                        if node.kind == 'and' or node.kind == 'or' then
+                            local left = evaluate(node.left)
+                            local right = evaluate(node.right)
+                            for id in pairs(left) do
+                                if node.kind == 'or' or right[id] then
+                                    found[id] = true
+                                end
+                            end
+                            if node.kind == 'or' then
+                                for id in pairs(right) do
+                                    found[id] = true
+                                end
+                            end
+                        elseif node.kind == 'compare' and
+                                type(node.value) == 'number' and
+                                indexed(node.name) then
+                            local key = 'metadata:numeric:' .. node.name
+                            local bound = string.format('%.17g', node.value)
+                            for _, range in ipairs(ranges[node.op](bound)) do
+                                local ids = redis.call('ZRANGEBYSCORE', key,
+                                                       range[1], range[2])
+                                for _, id in ipairs(ids) do
+                                    found[id] = true
+                                end
+                            end
+                        elseif node.kind == 'compare' then
+                            local compare = comparisons[node.op]
+                            local is_numeric = type(node.value) == 'number'
+                            for id, value in pairs(category(node.name)) do
+                                if is_numeric then
+                                    value = numeric(value)
+                                end
+                                if value ~= nil and
+                                        compare(value, node.value) then
+                                    found[id] = true
+                                end
+                            end
+                        elseif node.kind == 'compare-names' then
+                            local compare = comparisons[node.op]
+                            local other = category(node.other)
+                            for id, value in pairs(category(node.name)) do
+                                local a = numeric(value)
+                                local b = other[id] and numeric(other[id])
+                                if a ~= nil and b ~= nil and
+                                        compare(a, b) then
+                                    found[id] = true
+                                end
+                            end
+                        elseif node.kind == 'in' then
+                            local members = {}
+                            for _, value in ipairs(node.values) do
+                                members[value] = true
+                            end
+                            for id, value in pairs(category(node.name)) do
+                                if (members[value] == true) ~=
+                                        node.negate then
+                                    found[id] = true
+                                end
+                            end
+                        else
+                            error('Unknown plan node: ' .. tostring(node.kind))
+                        end
+                        return found
+                    end
+
+                    local ids = {}
+                    for id in pairs(evaluate(plan)) do
+                        table.insert(ids, id)
+                    end
+                    return cjson.encode(ids)"""}
+    _admin_scripts = ('get-index', 'load-data', 'load-batch',
+                      'index-ambiguities', 'index-categories')
+
+    @staticmethod
+    def _sha_cache():
+        """The cache of the SHA1s of the scripts loaded
+
+        The SHA1s of scripts are determined by their content, so do not
+        expire.
+        """
+        import redbiom.cache
+        return redbiom.cache.get_cache('scripts')
 
     @staticmethod
     def load_scripts(read_only=True):
@@ -124,22 +660,21 @@ class ScriptManager:
         """
         import redbiom
         import redbiom._requests
-        import hashlib
 
         config = redbiom.get_config()
-        s = redbiom._requests.get_session()
+        put = redbiom._requests.make_put(config)
         post = redbiom._requests.make_post(config)
-        get = redbiom._requests.make_get(config)
+        get = redbiom._requests._make_get(config)
 
         for name, script in ScriptManager._scripts.items():
             if read_only and name in ScriptManager._admin_scripts:
                 continue
 
-            sha1 = hashlib.sha1(script.encode('ascii')).hexdigest()
+            sha1 = ScriptManager.sha1(name)
             keypair = 'scripts/%s/%s' % (name, sha1)
 
             # load the script
-            s.put(config['hostname'] + '/SCRIPT/LOAD', data=script)
+            put(None, 'SCRIPT', 'LOAD', script)
 
             # create a mapping
             post('state', 'HSET', keypair)
@@ -148,6 +683,24 @@ class ScriptManager:
             obs = get('state', 'HGET', 'scripts/%s' % name)
             assert obs == sha1
 
+    @staticmethod
+    def sha1(name):
+        """Compute the SHA1 of a script, as Redis does, without the server
+
+        Parameters
+        ----------
+        name : str
+            The name of the script
+
+        Raises
+        ------
+        KeyError
+            If the script name is not recognized
+        """
+        import hashlib
+        script = ScriptManager._scripts[name]
+        return hashlib.sha1(script.encode('ascii')).hexdigest()
+
     @staticmethod
     def get(name):
         """Retreive the SHA1 of a script
@@ -162,19 +715,21 @@ class ScriptManager:
         ValueError
             If the script name is not recognized
         """
-        if name in ScriptManager._cache:
-            return ScriptManager._cache[name]
+        cache = ScriptManager._sha_cache()
+        sha = cache.get(name)
+        if sha is not None:
+            return sha
 
         import redbiom
         import redbiom._requests
         config = redbiom.get_config()
-        get = redbiom._requests.make_get(config)
+        get = redbiom._requests._make_get(config)
 
         sha = get('state', 'HGET', 'scripts/%s' % name)
         if sha is None:
             raise ValueError('Unknown script')
 
-        ScriptManager._cache[name] = sha
+        cache[name] = sha
 
         return sha
 
@@ -184,10 +739,25 @@ class ScriptManager:
         import redbiom
         import redbiom._requests
         config = redbiom.get_config()
-        s = redbiom._requests.get_session()
-        s.get(config['hostname'] + '/SCRIPT/FLUSH')
-        s.get(config['hostname'] + '/DEL/state:scripts')
-        ScriptManager._cache = {}
+        get = redbiom._requests._make_get(config)
+        get(None, 'SCRIPT', 'FLUSH')
+        get('state', 'DEL', 'scripts')
+        _invalidate_caches(config)
+
+
+def _invalidate_caches(config):
+    """Discard the cached lookups and responses following a write
+
+    Parameters
+    ----------
+    config : dict
+        The redbiom configuration
+    """
+    import redbiom.cache
+    import redbiom._response_cache
+
+    redbiom.cache.clear()
+    redbiom._response_cache.invalidate(config)
 
 
 def create_timestamp():
@@ -225,7 +795,7 @@ def get_timestamps():
     import redbiom
     import redbiom._requests
     config = redbiom.get_config()
-    get = redbiom._requests.make_get(config)
+    get = redbiom._requests._make_get(config)
     return get('state', 'LRANGE', 'timestamps/0/-1')
 
 
@@ -259,10 +829,11 @@ def create_context(name, description):
         print("Unable to create context: %s" % name, file=sys.stderr)
         raise
     ScriptManager.load_scripts()
+    _invalidate_caches(config)
 
 
 def _load_axis_data(table, ids, opposite_ids, opposite_id_index, axis_label,
-                    context, batchsize):
+                    context, batchsize, workers=None):
     """Manage the loading of data for a particular axis
 
     Parameters
@@ -282,6 +853,9 @@ def _load_axis_data(table, ids, opposite_ids, opposite_id_index, axis_label,
         The context to load the data into
     batchsize : int
         The number of identifiers to group into a single request
+    workers : int, optional
+        The number of batches to send concurrently. If not specified, the
+        max_workers of the configuration is used.
 
     Notes
     -----
@@ -303,8 +877,24 @@ def _load_axis_data(table, ids, opposite_ids, opposite_id_index, axis_label,
     and "ARGV" are the "packeddata". "KEYS" and "ARGV" are expected to be in
     index order with each other.
     """
-    import redbiom
-    import redbiom._requests
+    batches = _axis_batches(table, ids, opposite_ids, opposite_id_index,
+                            axis_label, context, batchsize)
+    _load_batches(batches, context, workers)
+
+
+def _axis_batches(table, ids, opposite_ids, opposite_id_index, axis_label,
+                  context, batchsize, done=()):
+    """Pack the data of an axis into batches for loading
+
+    Parameters are as described by _load_axis_data. Batches named in done
+    (e.g., "sample:3") are not packed.
+
+    Returns
+    -------
+    generator of (str, list of str, list of str, list of str)
+        The name of a batch, its identifiers, their keys, and their packed
+        data. The batches are packed as they are consumed.
+    """
     if axis_label == 'feature':
         axis = 'observation'
     elif axis_label == 'sample':
@@ -312,45 +902,179 @@ def _load_axis_data(table, ids, opposite_ids, opposite_id_index, axis_label,
     else:
         raise ValueError("%s is unrecognized as an axis" % axis)
 
-    config = redbiom.get_config()
-    post = redbiom._requests.make_post(config)
-    loader_sha = ScriptManager.get('load-data')
+    packer = _axis_packer(table, opposite_ids, opposite_id_index, axis)
 
-    # partition our IDs into smaller batches
+    # partition our IDs into smaller batches. the partition is a function of
+    # only the IDs and batchsize, so that the batches are stable over resumes
     splits = max(1, ceil(len(ids) / batchsize))
-    for batch in np.array_split(ids, splits):
+    for number, batch in enumerate(np.array_split(ids, splits)):
+        name = '%s:%d' % (axis_label, number)
+        if name in done:
+            continue
+
         keys = []
         argv = []
 
         # pack the id specific data into a format the Lua logic expects
         for id_ in batch:
-            values = table.data(id_, axis=axis, dense=False)
-            if not np.allclose(values.data - np.round(values.data, 1), 0.0):
-                raise ValueError("Data do not appear to be counts")
+            keys.append(f"{context}:{axis_label}:{id_}")
+            argv.append(packer(id_))
 
-            int_values = values.astype(int)
-            remapped = [opposite_id_index[i]
-                        for i in opposite_ids[values.indices]]
+        yield name, list(batch), keys, argv
 
-            packed = '|'.join(["%d|%d" % (v, i)
-                               for i, v in zip(remapped, int_values.data)])
 
-            keys.append(f"{context}:{axis_label}:{id_}")
-            argv.append(packed)
+def _load_batches(batches, context, workers=None, post=None, journal=None,
+                  loader_sha=None):
+    """Send packed batches to the server
 
-        nkeys = str(len(keys))
+    Parameters
+    ----------
+    batches : iterable of tuple
+        The batches, as produced by _axis_batches
+    context : str
+        The context the data are loaded into
+    workers : int, optional
+        The number of batches to send concurrently. If not specified, the
+        max_workers of the configuration is used.
+    post : function, optional
+        A post() method to send the batches with, in order, rather than
+        with a pool of workers (e.g., to write them for mass insertion).
+    journal : str, optional
+        The key of the load journal. If provided, each batch is loaded by
+        the "load-batch" script, which notes the batch as loaded in the
+        journal, and skips the batch if it already was.
+    loader_sha : str, optional
+        The SHA1 of the load-data script, if it is not to be obtained from
+        the server.
+
+    Notes
+    -----
+    The batches are consumed a bounded distance ahead of those sent (see
+    redbiom._requests.parallel_map), so packing proceeds while batches are
+    in flight without all of them being held in memory. Each identifier is
+    loaded by a single batch, so the order the batches are applied in does
+    not matter.
+
+    Redis command summary
+    ---------------------
+    EVALSHA <load-batch-sha1> N+2 <context>:load-journal \
+        <context>:<axis_label>s-represented <context>:<axis_label>:<id> ... \
+        <batch> <packeddata> ... <id> ...
+
+    or, without a journal,
+
+    EVALSHA <load-data-sha1> N <context>:<axis_label>:<id> ... <packeddata> ...
+    SADD <context>:<axis_label>s-represented <id> ...
+    """
+    import redbiom
+    import redbiom._requests
+
+    config = redbiom.get_config()
+
+    if journal is not None:
+        loader_sha = ScriptManager.get('load-batch')
+    elif loader_sha is None:
+        loader_sha = ScriptManager.get('load-data')
+
+    def send(batch, post=post):
+        # the method is constructed per call so that the session of the
+        # thread is used
+        if post is None:
+            post = redbiom._requests.make_post(config)
+        name, ids, keys, argv = batch
+        axis_label = name.split(':')[0]
+        represented = f"{axis_label}s-represented"
+
+        if journal is not None:
+            # load the count data, note the identifiers as represented and
+            # the batch as loaded, atomically
+            payload = [loader_sha, str(len(keys) + 2), journal,
+                       f"{context}:{represented}"]
+            payload.extend(keys)
+            payload.append(name)
+            payload.extend(argv)
+            payload.extend(ids)
+            post(None, 'EVALSHA', '/'.join(payload))
+            return
 
         # load the count data
-        payload = [loader_sha, nkeys] + keys + argv
-        post(None, 'EVALSHA', '/'.join(payload))
+        nkeys = str(len(keys))
+        post(None, 'EVALSHA', '/'.join([loader_sha, nkeys] + keys + argv))
 
         # note which identifiers are represented
-        payload = f"{axis_label}s-represented/%s" % '/'.join(batch)
-        post(context, 'SADD', payload, verbose=False)
+        post(context, 'SADD', '%s/%s' % (represented, '/'.join(ids)),
+             verbose=False)
+
+    if post is not None:
+        for batch in batches:
+            send(batch)
+        return
+
+    for _ in redbiom._requests.parallel_map(send, batches, workers):
+        pass
+
+
+def _axis_packer(table, opposite_ids, opposite_id_index, axis):
+    """Produce a function which packs the data of an ID for load-data
+
+    Parameters
+    ----------
+    table : biom.Table
+        The table to obtain data from
+    opposite_ids : iterable of str
+        The IDs of the opposite axis in the table, in table order
+    opposite_id_index : dict
+        The index which maps an opposite ID to the index value within
+        the Redis database for the identifier
+    axis : str
+        The biom.Table axis of the IDs to pack
+
+    Raises
+    ------
+    ValueError
+        If the table does not appear to contain counts.
+
+    Returns
+    -------
+    function
+        A function of an ID which returns its nonzero values and the index
+        values of the associated opposite IDs as "value|index|value|index".
+
+    Notes
+    -----
+    The matrix is oriented once such that the vector of each ID is
+    contiguous, which allows for the count check, the conversion to integer
+    and the remapping of the opposite IDs to be performed in bulk.
+    """
+    matrix = table.matrix_data
+    matrix = matrix.tocsc() if axis == 'sample' else matrix.tocsr()
+    matrix.sort_indices()
+
+    if not np.allclose(matrix.data - np.round(matrix.data, 1), 0.0):
+        raise ValueError("Data do not appear to be counts")
+
+    remap = np.array([opposite_id_index[i] for i in opposite_ids],
+                     dtype=np.int64)
+
+    # the value, index pairs of all IDs, interleaved, in storage order
+    pairs = np.empty(2 * matrix.nnz, dtype=np.int64)
+    pairs[0::2] = matrix.data.astype(int)
+    pairs[1::2] = remap[matrix.indices]
+
+    indptr = matrix.indptr
+
+    def packer(id_):
+        position = table.index(id_, axis=axis)
+        start = 2 * indptr[position]
+        end = 2 * indptr[position + 1]
+        return '|'.join(map(str, pairs[start:end].tolist()))
+
+    return packer
 
 
 def load_sample_data(table, context, tag=None, redis_protocol=False,
-                     batchsize=1000):
+                     batchsize=1000, workers=None, output=None, resume=False,
+                     offline=False):
     """Load nonzero sample data.
 
     Parameters
@@ -362,9 +1086,23 @@ def load_sample_data(table, context, tag=None, redis_protocol=False,
     tag : str
         A tag to associated the samples with (e.g., a preparation ID).
     redis_protocol : bool, optional
-        Generate commands for bulk load instead of HTTP requests.
+        Generate commands for bulk load instead of HTTP requests. The
+        samples to load, and their indices, are still determined by the
+        server.
     batchsize : int, optional
         The number of samples or features to load at once
+    workers : int, optional
+        The number of batches of data to send concurrently. If not
+        specified, the max_workers of the configuration is used.
+    output : str, optional
+        With redis_protocol, the file to write the commands to. Standard
+        output is used by default.
+    resume : bool, optional
+        Resume an interrupted load of the table into the context, loading
+        only what was not already.
+    offline : bool, optional
+        With redis_protocol, do not consult the server at all, see
+        write_sample_data. The context must not yet contain data.
 
     Raises
     ------
@@ -372,6 +1110,10 @@ def load_sample_data(table, context, tag=None, redis_protocol=False,
         If the context to load into does not exist.
         If a samples metadata has not already been loaded.
         If a table is empty.
+        If a load into the context was interrupted, and resume is not set.
+        If resume is set, and there is no interrupted load of the table.
+        If resume is set with redis_protocol.
+        If offline is set without redis_protocol.
 
     Notes
     -----
@@ -387,14 +1129,31 @@ def load_sample_data(table, context, tag=None, redis_protocol=False,
     odd indices correspond to the counts associated with the sample/feature
     combination.
 
+    The batches of sample and feature data are sent by a pool of workers,
+    and are packed as earlier batches are in flight.
+
+    The progress of a load is recorded in <context>:load-journal, a hash of
+    the samples being loaded, and of each batch of data loaded, which is
+    removed once the load completes. If a load is interrupted, it can be
+    resumed with the same table and tag, and the batches already loaded are
+    not loaded again. Only a single load into a context can be in progress.
+
     Redis command summary
     ---------------------
+    EXISTS <context>:load-journal
+    HSET <context>:load-journal samples <json>
+    HGET <context>:load-journal samples
+    HKEYS <context>:load-journal
     EVALSHA <get-index-sha1> 1 <context>:feature-index <feature_id>
     EVALSHA <get-index-sha1> 1 <context>:sample-index <redbiom_id>
-    LPUSH <context>:samples:<redbiom_id> <count> <feature_id> ...
-    LPUSH <context>:features:<redbiom_id> <count> <redbiom_id> ...
-    SADD <context>:samples-represented <redbiom_id> ... <redbiom_id>
-    SADD <context>:features-represented <feature_id> ... <feature_id>
+    EVALSHA <load-batch-sha1> N+2 <context>:load-journal \
+        <context>:<axis>s-represented <context>:<axis>:<id> ... \
+        <batch> <packeddata> ... <id> ...
+    EVALSHA <index-ambiguities-sha1> 2 <context>:ambiguity-index \
+        <context>:ambiguity-index-size <redbiom_id> ...
+    GET <context>:ambiguity-index-size
+    SCARD <context>:samples-represented
+    DEL <context>:load-journal
 
     Returns
     -------
@@ -403,14 +1162,207 @@ def load_sample_data(table, context, tag=None, redis_protocol=False,
     """
     import redbiom
     import redbiom._requests
-    import redbiom.util
+
+    if offline and not redis_protocol:
+        raise ValueError("An offline load requires redis_protocol.")
+    if redis_protocol and resume:
+        raise ValueError("A load for mass insertion cannot be resumed.")
+
+    if redis_protocol and offline:
+        return write_sample_data(table, context, output, tag)
+
+    import json
 
     config = redbiom.get_config()
-    get = redbiom._requests.make_get(config)
+
+    # the database is read as it is being modified, so responses must not
+    # be served from the cache
+    get = redbiom._requests._make_get(config)
     post = redbiom._requests.make_post(config)
 
     redbiom._requests.valid(context, get)
 
+    if redis_protocol:
+        return _write_staged_data(table, context, tag, output, get)
+
+    journal = '%s:load-journal' % context
+    if resume:
+        staged = get(context, 'HGET', 'load-journal/samples')
+        if staged is None:
+            raise ValueError("There is no load to resume in this context.")
+
+        table = _stage_for_resume(table, tag, json.loads(staged))
+        done = set(get(context, 'HKEYS', 'load-journal'))
+    else:
+        if get(context, 'EXISTS', 'load-journal'):
+            raise ValueError("A load into this context was interrupted, and "
+                             "must be resumed first.")
+
+        table = _stage_for_load(table, context, get, tag)
+        done = set()
+
+        staged = json.dumps(list(table.ids()))
+        post(context, 'HSET', 'load-journal/samples/%s' % quote_plus(staged))
+
+    samples = table.ids()[:]
+    obs = table.ids(axis='observation')[:]
+
+    obs_index = {i: j for i, j in zip(obs, get_index(context, obs, 'feature'))}
+    samp_index = {i: j for i, j in
+                  zip(samples, get_index(context, samples, 'sample'))}
+
+    # the batches of both axes share the senders
+    batches = chain(_axis_batches(table, samples, obs, obs_index, 'sample',
+                                  context, batchsize=10, done=done),
+                    _axis_batches(table, obs, samples, samp_index, 'feature',
+                                  context, batchsize=500, done=done))
+    _load_batches(batches, context, workers, journal=journal)
+
+    # the index is rebuilt in full if it does not describe the context
+    # (e.g., if the context predates the index)
+    index_ambiguities(context, samples)
+    if not _ambiguity_index_complete(context, get):
+        index_ambiguities(context)
+
+    _load_taxonomy(table, context, obs_index, post)
+
+    post(context, 'DEL', 'load-journal')
+
+    _invalidate_caches(config)
+    return len(samples)
+
+
+def write_sample_data(table, context, output=None, tag=None, batchsize=1000):
+    """Write the commands to load nonzero sample data for mass insertion
+
+    Parameters
+    ----------
+    table : biom.Table
+        The BIOM table to load.
+    context : str
+        The context to load into.
+    output : str, optional
+        The file to write the commands to, which is gzip compressed if it
+        ends in ".gz". Standard output is used by default.
+    tag : str
+        A tag to associated the samples with (e.g., a preparation ID).
+    batchsize : int, optional
+        The number of samples or features to load at once
+
+    Raises
+    ------
+    ValueError
+        If a table is empty.
+
+    Notes
+    -----
+    The server is not consulted, so the commands can be produced where it
+    is not accessible, and later loaded with "redis-cli --pipe". As the
+    indices of the samples and features cannot be obtained from the server,
+    they are assigned anew, and so the context is expected to exist and to
+    not yet contain data. Similarly, it is not verified that the metadata
+    of the samples have been loaded.
+
+    The commands are those issued by load_sample_data, preceded by loading
+    the scripts used.
+
+    Redis command summary
+    ---------------------
+    SCRIPT LOAD <script>
+    HSET state:scripts <name> <sha1>
+    HMSET <context>:feature-index <feature_id> <index> ...
+    HMSET <context>:feature-index-inverted <index> <feature_id> ...
+    HSET <context>:feature-index current_id <n>
+    HMSET <context>:sample-index <redbiom_id> <index> ...
+    HMSET <context>:sample-index-inverted <index> <redbiom_id> ...
+    HSET <context>:sample-index current_id <n>
+    EVALSHA <load-data-sha1> N <context>:<axis_label>:<id> ... <packeddata> ...
+    SADD <context>:samples-represented <redbiom_id> ... <redbiom_id>
+    SADD <context>:features-represented <feature_id> ... <feature_id>
+    EVALSHA <index-ambiguities-sha1> 2 <context>:ambiguity-index \
+        <context>:ambiguity-index-size <redbiom_id> ...
+
+    Returns
+    -------
+    int
+        The number of samples written.
+    """
+    import redbiom
+    import redbiom._requests
+    import redbiom._resp
+
+    config = redbiom.get_config()
+
+    table = _tag_table(table, tag)
+    if table.is_empty():
+        raise ValueError("The table is empty.")
+    table = table.filter(lambda v, i, md: v.sum() > 0, axis='observation',
+                         inplace=False)
+
+    samples = table.ids()[:]
+    obs = table.ids(axis='observation')[:]
+
+    with redbiom._resp.open_mass_insertion(output) as stream:
+        post = redbiom._requests.make_post(config, redis_protocol=True,
+                                           output=stream)
+
+        for name in ('load-data', 'index-ambiguities'):
+            script = ScriptManager._scripts[name]
+            post(None, 'SCRIPT', 'LOAD/%s' % quote_plus(script))
+            post('state', 'HSET',
+                 'scripts/%s/%s' % (name, ScriptManager.sha1(name)))
+
+        obs_index = _assign_index(context, obs, 'feature', post)
+        samp_index = _assign_index(context, samples, 'sample', post)
+
+        _write_data(table, context, obs_index, samp_index, post,
+                    config['buffer_bytes'])
+
+    return len(samples)
+
+
+def _write_staged_data(table, context, tag, output, get):
+    """Write the commands to load the novel samples of a table
+
+    Parameters
+    ----------
+    table : biom.Table
+        The table to load
+    context : str
+        The context to load into
+    tag : str
+        The tag to apply to the samples
+    output : str
+        The file to write the commands to, or None for standard output
+    get : function
+        An uncached getter
+
+    Notes
+    -----
+    Unlike write_sample_data, the samples are staged against the server so
+    that those already loaded, or lacking metadata, are omitted, and the
+    indices of the samples and features are obtained from the server. The
+    scripts are expected to be loaded.
+
+    Redis command summary
+    ---------------------
+    EVALSHA <get-index-sha1> 1 <context>:feature-index <feature_id>
+    EVALSHA <get-index-sha1> 1 <context>:sample-index <redbiom_id>
+
+    and the commands written, as described by write_sample_data, with the
+    exception of those loading scripts and indices.
+
+    Returns
+    -------
+    int
+        The number of samples written.
+    """
+    import redbiom
+    import redbiom._requests
+    import redbiom._resp
+
+    config = redbiom.get_config()
+
     table = _stage_for_load(table, context, get, tag)
     samples = table.ids()[:]
     obs = table.ids(axis='observation')[:]
@@ -419,26 +1371,119 @@ def load_sample_data(table, context, tag=None, redis_protocol=False,
     samp_index = {i: j for i, j in
                   zip(samples, get_index(context, samples, 'sample'))}
 
-    _load_axis_data(table, samples, obs, obs_index, 'sample', context,
-                    batchsize=10)
-    _load_axis_data(table, obs, samples, samp_index, 'feature', context,
-                    batchsize=500)
+    with redbiom._resp.open_mass_insertion(output) as stream:
+        post = redbiom._requests.make_post(config, redis_protocol=True,
+                                           output=stream)
+        _write_data(table, context, obs_index, samp_index, post,
+                    config['buffer_bytes'])
+
+    _invalidate_caches(config)
+    return len(samples)
+
+
+def _write_data(table, context, obs_index, samp_index, post, max_bytes):
+    """Write the commands to load the data of a staged table
+
+    Parameters
+    ----------
+    table : biom.Table
+        The table, reduced to the samples to load
+    context : str
+        The context to load into
+    obs_index : dict
+        The index value of each feature within the context
+    samp_index : dict
+        The index value of each sample within the context
+    post : function
+        A post() method writing commands for mass insertion
+    max_bytes : int
+        The upper bound on the size of a command indexing ambiguities
+    """
+    samples = table.ids()[:]
+    obs = table.ids(axis='observation')[:]
+
+    batches = chain(_axis_batches(table, samples, obs, obs_index,
+                                  'sample', context, 10),
+                    _axis_batches(table, obs, samples, samp_index,
+                                  'feature', context, 500))
+    _load_batches(batches, context, post=post,
+                  loader_sha=ScriptManager.sha1('load-data'))
+
+    indexer = ScriptManager.sha1('index-ambiguities')
+    for payload in _ambiguity_payloads(context, samples, indexer, max_bytes):
+        post(None, 'EVALSHA', payload)
+
+    _load_taxonomy(table, context, obs_index, post)
+
+
+def _assign_index(context, keys, axis, post, batchsize=1000):
+    """Assign unique integer values to keys without consulting the server
+
+    Parameters
+    ----------
+    context : str
+        The context to operate in
+    keys : list or tuple of str
+        The keys to assign an index to
+    axis : str
+        Either feature or sample
+    post : function
+        A post() method to store the index with
+    batchsize : int, optional
+        The number of keys to store at once
+
+    Notes
+    -----
+    The indices are as the "get-index" script would assign them to a context
+    lacking an index.
+
+    Returns
+    -------
+    dict
+        {key: index}
+    """
+    index = {k: i for i, k in enumerate(keys)}
+
+    splits = max(1, ceil(len(keys) / batchsize))
+    for batch in np.array_split(keys, splits):
+        pairs = [(quote_plus(k), str(index[k])) for k in batch]
+        post(context, 'HMSET', '%s-index/%s'
+             % (axis, '/'.join(['%s/%s' % (k, i) for k, i in pairs])))
+        post(context, 'HMSET', '%s-index-inverted/%s'
+             % (axis, '/'.join(['%s/%s' % (i, k) for k, i in pairs])))
+
+    post(context, 'HSET', '%s-index/current_id/%d' % (axis, len(index)))
+    return index
+
 
-    # load up taxonomy
+def _load_taxonomy(table, context, obs_index, post):
+    """Load the taxonomy of the features of a table, if present
+
+    Parameters
+    ----------
+    table : biom.Table
+        The table being loaded
+    context : str
+        The context to load into
+    obs_index : dict
+        The index value of each feature within the context
+    post : function
+        A post() method
+
+    Redis command summary
+    ---------------------
+    HSET <context>:state has-taxonomy 1
+    SADD <context>:taxonomy-children:<node> <child> ...
+    HMSET <context>:taxonomy-parents <child> <node> ...
+    SADD <context>:terminal-of:<node> <index> ...
+    """
     taxonomy = _metadata_to_taxonomy_tree(table.ids(axis='observation'),
                                           table.metadata(axis='observation'))
     if taxonomy is not None:
         post(context, 'HSET', "state/has-taxonomy/1")
-        hmgetter = redbiom._requests.buffered
 
-        tip_names = {n.name: n for n in taxonomy.tips()}
-        ids_ = hmgetter(tip_names, None, 'HMGET', context,
-                        get=get, buffer_size=100,
-                        multikey='feature-index')
-
-        for blk in ids_:
-            for entity, idx in zip(*blk):
-                tip_names[entity].name = idx
+        for tip in taxonomy.tips():
+            tip.name = str(obs_index[tip.name])
 
         for node in taxonomy.postorder(include_self=False):
             if not node.is_tip():
@@ -466,7 +1511,77 @@ def load_sample_data(table, context, tag=None, redis_protocol=False,
                     post(context, 'SADD', 'terminal-of:%s/%s' % (node.name,
                                                                  id_pack))
 
-    return len(samples)
+
+def index_ambiguities(context, samples=None):
+    """Index the tagged sample IDs of a context by their untagged ID
+
+    Parameters
+    ----------
+    context : str
+        The context to operate in
+    samples : iterable of str, optional
+        The tagged sample IDs (e.g., "rid_sampleid") to index. If not
+        provided, all samples represented in the context are indexed.
+
+    Notes
+    -----
+    The index, <context>:ambiguity-index, is a hash of an untagged sample ID
+    to a JSON array of the tagged sample IDs it corresponds to, which allows
+    redbiom.util.resolve_ambiguities to obtain only what is necessary for
+    the samples requested. The number of tagged sample IDs indexed is
+    maintained under <context>:ambiguity-index-size, and the index is only
+    used if it equals the number of samples represented in the context.
+
+    Indexing is idempotent.
+
+    Redis command summary
+    ---------------------
+    SMEMBERS <context>:samples-represented
+    EVALSHA <index-ambiguities-sha1> 2 <context>:ambiguity-index \
+        <context>:ambiguity-index-size <redbiom_id> ...
+
+    Returns
+    -------
+    int
+        The number of tagged sample IDs newly indexed.
+    """
+    import redbiom
+    import redbiom._requests
+
+    config = redbiom.get_config()
+    post = redbiom._requests.make_post(config)
+
+    if samples is None:
+        get = redbiom._requests._make_get(config)
+        samples = get(context, 'SMEMBERS', 'samples-represented')
+
+    indexer = ScriptManager.get('index-ambiguities')
+
+    added = 0
+    for payload in _ambiguity_payloads(context, samples, indexer,
+                                       config['buffer_bytes']):
+        added += post(None, 'EVALSHA', payload)
+
+    _invalidate_caches(config)
+    return added
+
+
+def _ambiguity_payloads(context, samples, indexer, max_bytes):
+    """Form the EVALSHA payloads of index-ambiguities for samples"""
+    import redbiom._requests
+
+    keys = ['%s:ambiguity-index' % context,
+            '%s:ambiguity-index-size' % context]
+
+    for batch in redbiom._requests.batch_by_size(samples, max_bytes):
+        yield '/'.join([indexer, '2'] + keys + list(batch))
+
+
+def _ambiguity_index_complete(context, get):
+    """Test if the ambiguity index describes every sample in a context"""
+    size = get(context, 'GET', 'ambiguity-index-size')
+    represented = get(context, 'SCARD', 'samples-represented')
+    return size is not None and int(size) == represented
 
 
 def _metadata_to_taxonomy_tree(ids, metadata):
@@ -510,7 +1625,7 @@ def _metadata_to_taxonomy_tree(ids, metadata):
     return t
 
 
-def load_sample_metadata(md, tag=None):
+def load_sample_metadata(md, tag=None, numeric=None):
     """Load sample metadata.
 
     Parameters
@@ -520,11 +1635,25 @@ def load_sample_metadata(md, tag=None):
     tag : str, optional
         A tag associated with the information being loaded such as a
         preparation ID.
+    numeric : iterable of str, optional
+        Categories to additionally index by their numeric values (see
+        index_numeric_category).
+
+    Raises
+    ------
+    ValueError
+        If a category to index numerically is not known.
 
     Notes
     -----
     Values considered to be non-informative are omitted from load.
 
+    The categories of each sample are also expressed as a set (see
+    index_sample_categories) if the writable scripts are loaded.
+
+    Categories which are indexed numerically remain so as further samples
+    are loaded.
+
     TODO: expose a stable list of the nullables, see #19
 
     Returns
@@ -535,10 +1664,15 @@ def load_sample_metadata(md, tag=None):
     Redis command summary
     ---------------------
     SMEMBERS metadata:samples-represented
-    SET metadata:categories:<sample_id> <JSON-of-informative-columns>
+    MSET metadata:categories:<sample_id> <JSON-of-informative-columns> ...
+    EVALSHA <index-categories-sha1> 0 <sample_id> ...
     HMSET metadata:category:<column> <sample_id> <val> ... <sample_id> <val>
     SADD metadata:samples-represented <sample_id> ... <sample_id> ...
     SADD metadata:categories-represented <column> ... <column>
+    GET metadata:categories-set-size
+    SCARD metadata:samples-represented
+    SMEMBERS metadata:numeric-represented
+    ZADD metadata:numeric:<column> <val> <sample_id> ... <val> <sample_id>
     """
     import json
     import redbiom
@@ -547,8 +1681,10 @@ def load_sample_metadata(md, tag=None):
 
     config = redbiom.get_config()
     post = redbiom._requests.make_post(config)
-    put = redbiom._requests.make_put(config)
-    get = redbiom._requests.make_get(config)
+
+    # the database is read as it is being modified, so responses must not
+    # be served from the cache
+    get = redbiom._requests._make_get(config)
 
     null_values = redbiom.util.NULL_VALUES
 
@@ -569,39 +1705,228 @@ def load_sample_metadata(md, tag=None):
 
     md.set_index(md.columns[0], inplace=True)
 
+    numeric = set(numeric or ())
+    for col in numeric - set(md.columns):
+        if not get('metadata', 'SISMEMBER', 'categories-represented/%s'
+                   % col):
+            raise ValueError("%s is not a category" % col)
+
+    # the categories indexed numerically prior to this load are maintained
+    # as samples are added, while the others are indexed in full after it
+    maintained = set(get('metadata', 'SMEMBERS', 'numeric-represented'))
+    unindexed = sorted(numeric - maintained)
+
     # subset to only the novel IDs
     represented = get('metadata', 'SMEMBERS', 'samples-represented')
     md = md.loc[list(set(md.index) - set(represented))]
     if len(md) == 0:
+        for col in unindexed:
+            index_numeric_category(col)
         return 0
 
     samples = md.index
     indexed_columns = md.columns
-    for idx, row in md.iterrows():
-        # denote what columns contain information
-        columns = [c for c, i in zip(md.columns, row.values)
-                   if _indexable(i, null_values)]
-        key = "categories:%s" % idx
-
-        # TODO: express metadata-categories using redis sets, see #18
-        put('metadata', 'SET', key, json.dumps(columns))
+    indexable = _indexable_mask(md, null_values)
+
+    # denote what columns contain information
+    columns = indexed_columns.to_numpy(dtype=object)
+    categories = ["metadata:categories:%s/%s"
+                  % (quote_plus(str(idx)), quote_plus(json.dumps(
+                      columns[informative].tolist())))
+                  for idx, informative in zip(md.index, indexable.values)]
+
+    # the categories are also expressed as sets, see index_sample_categories,
+    # if the writable scripts are loaded. otherwise the sets no longer
+    # describe every sample, and are not used
+    try:
+        indexer = ScriptManager.get('index-categories')
+    except ValueError:
+        indexer = None
+
+    for batch in redbiom._requests.batch_by_size(zip(samples, categories),
+                                                 config['buffer_bytes'],
+                                                 key=lambda i: i[1]):
+        post(None, 'MSET', '/'.join([c for _, c in batch]))
+        if indexer is not None:
+            ids = [quote_plus(str(i)) for i, _ in batch]
+            post(None, 'EVALSHA', '/'.join([indexer, '0'] + ids))
 
     for col in indexed_columns:
+        values = md[col][indexable[col]]
         bulk_set = ["%s/%s" % (idx, quote_plus(str(v)))
-                    for idx, v in zip(md.index, md[col])
-                    if _indexable(v, null_values)]
+                    for idx, v in zip(values.index, values)]
         payload = "category:%s/%s" % (col, '/'.join(bulk_set))
         post('metadata', 'HMSET', payload)
 
+        if col in maintained:
+            _index_numeric(col, values, post, config['buffer_bytes'])
+
     payload = "samples-represented/%s" % '/'.join(md.index)
     post('metadata', 'SADD', payload)
 
     payload = "categories-represented/%s" % '/'.join(md.columns)
     post('metadata', 'SADD', payload)
 
+    for col in unindexed:
+        index_numeric_category(col)
+
+    # the sets are rebuilt in full if they do not describe every sample
+    # (e.g., if the samples were loaded prior to the sets)
+    if indexer is not None and not _sample_categories_complete(get):
+        index_sample_categories()
+
+    _invalidate_caches(config)
     return len(samples)
 
 
+def index_sample_categories(samples=None):
+    """Express the categories of samples as sets
+
+    Parameters
+    ----------
+    samples : iterable of str, optional
+        The sample IDs to index. If not provided, all samples with metadata
+        are indexed.
+
+    Notes
+    -----
+    The informative categories of a sample are stored as a JSON array under
+    metadata:categories:<sample_id>, and as a set under
+    metadata:categories-set:<sample_id>, which allows for the categories
+    common to, or across, samples to be determined by the server. The set
+    additionally contains the empty string, so that it exists for samples
+    without informative categories. The number of samples with a set is
+    maintained under metadata:categories-set-size, and the sets are only
+    used if it equals the number of samples with metadata.
+
+    Indexing is idempotent.
+
+    Redis command summary
+    ---------------------
+    SMEMBERS metadata:samples-represented
+    EVALSHA <index-categories-sha1> 0 <sample_id> ...
+
+    Returns
+    -------
+    int
+        The number of samples newly indexed.
+    """
+    import redbiom
+    import redbiom._requests
+
+    config = redbiom.get_config()
+    post = redbiom._requests.make_post(config)
+
+    if samples is None:
+        get = redbiom._requests._make_get(config)
+        samples = get('metadata', 'SMEMBERS', 'samples-represented')
+
+    indexer = ScriptManager.get('index-categories')
+
+    added = 0
+    for batch in redbiom._requests.batch_by_size(
+            (quote_plus(str(i)) for i in samples), config['buffer_bytes']):
+        added += post(None, 'EVALSHA', '/'.join([indexer, '0'] + batch))
+
+    _invalidate_caches(config)
+    return added
+
+
+def index_numeric_category(category):
+    """Index the numeric values of a category as a sorted set
+
+    Parameters
+    ----------
+    category : str
+        The category to index
+
+    Raises
+    ------
+    ValueError
+        If the category is not known.
+
+    Notes
+    -----
+    The samples of a category with a numeric value, as interpreted by
+    pandas.to_numeric, are stored in the sorted set
+    metadata:numeric:<category> scored by that value. The category is then
+    added to metadata:numeric-represented, which denotes the set describes
+    every sample of the category, so that range comparisons in where
+    clauses are resolved by the set (see redbiom.where_expr.where_ids).
+
+    Indexing is idempotent.
+
+    Redis command summary
+    ---------------------
+    SISMEMBER metadata:categories-represented <category>
+    HGETALL metadata:category:<category>
+    ZADD metadata:numeric:<category> <val> <sample_id> ... <val> <sample_id>
+    SADD metadata:numeric-represented <category>
+
+    Returns
+    -------
+    int
+        The number of samples with a numeric value.
+    """
+    import pandas as pd
+    import redbiom
+    import redbiom._requests
+
+    config = redbiom.get_config()
+    post = redbiom._requests.make_post(config)
+    get = redbiom._requests._make_get(config)
+
+    if not get('metadata', 'SISMEMBER', 'categories-represented/%s'
+               % category):
+        raise ValueError("%s is not a category" % category)
+
+    values = pd.Series(dict(get('metadata:category', 'HGETALL', category)),
+                       dtype=object)
+    indexed = _index_numeric(category, values, post, config['buffer_bytes'])
+    post('metadata', 'SADD', 'numeric-represented/%s' % category)
+
+    _invalidate_caches(config)
+    return indexed
+
+
+def _index_numeric(category, values, post, max_bytes):
+    """Add the numeric values of a category to its sorted set
+
+    Parameters
+    ----------
+    category : str
+        The category
+    values : pd.Series
+        The values of the category indexed by sample ID
+    post : function
+        A poster
+    max_bytes : int
+        The upper bound on the size of a request
+
+    Returns
+    -------
+    int
+        The number of values which are numeric.
+    """
+    import pandas as pd
+    import redbiom._requests
+
+    values = pd.to_numeric(values, errors='coerce').dropna()
+    members = ("%r/%s" % (float(v), quote_plus(str(i)))
+               for i, v in values.items())
+    for batch in redbiom._requests.batch_by_size(members, max_bytes):
+        post('metadata', 'ZADD', 'numeric:%s/%s' % (category,
+                                                    '/'.join(batch)))
+    return len(values)
+
+
+def _sample_categories_complete(get):
+    """Test if the sets of categories describe every sample with metadata"""
+    size = get('metadata', 'GET', 'categories-set-size')
+    represented = get('metadata', 'SCARD', 'samples-represented')
+    return size is not None and int(size) == represented
+
+
 def load_sample_metadata_full_search(md, tag=None):
     """Load stem -> sample associations
 
@@ -666,6 +1991,7 @@ def load_sample_metadata_full_search(md, tag=None):
         post('metadata', 'SADD', payload)
     cat_stems = len(stems)
 
+    _invalidate_caches(config)
     return (value_stems, cat_stems)
 
 
@@ -674,6 +2000,29 @@ def _indexable(value, nullables):
     return value not in nullables
 
 
+def _indexable_mask(md, nullables):
+    """Test, in bulk, which values of a DataFrame are storable
+
+    Parameters
+    ----------
+    md : pd.DataFrame
+        The metadata
+    nullables : set
+        The values which are not informative
+
+    Returns
+    -------
+    pd.DataFrame of bool
+        True where a value is storable, as _indexable would determine.
+    """
+    import pandas as pd
+
+    # nulls such as np.nan do not compare equal to themselves, so are
+    # tested for separately from the nullable strings
+    nullable = [v for v in nullables if not pd.isnull(v)]
+    return ~(md.isin(nullable) | md.isnull())
+
+
 class AlreadyLoaded(ValueError):
     pass
 
@@ -709,11 +2058,7 @@ def _stage_for_load(table, context, get, tag=None):
     """
     import redbiom.util
 
-    if tag is None:
-        tag = 'UNTAGGED'
-
-    table = table.update_ids({i: "%s_%s" % (tag, i) for i in table.ids()},
-                             inplace=False)
+    table = _tag_table(table, tag)
     samples = set(table.ids())
 
     if not samples:
@@ -733,6 +2078,50 @@ def _stage_for_load(table, context, get, tag=None):
     return table.filter(lambda v, i, md: v.sum() > 0, axis='observation')
 
 
+def _stage_for_resume(table, tag, samples):
+    """Reduce a table to the samples of an interrupted load
+
+    Parameters
+    ----------
+    table : biom.Table
+        The table to operate on
+    tag : str
+        The tag applied to the samples
+    samples : list of str
+        The tagged sample IDs of the interrupted load
+
+    Raises
+    ------
+    ValueError
+        If the table does not contain the samples.
+
+    Returns
+    -------
+    biom.Table
+        A copy of the input table, as staged by _stage_for_load for the
+        interrupted load.
+    """
+    table = _tag_table(table, tag)
+    if not set(samples).issubset(table.ids()):
+        raise ValueError("The table does not contain the samples of the "
+                         "load being resumed.")
+
+    table.filter(set(samples))
+    return table.filter(lambda v, i, md: v.sum() > 0, axis='observation')
+
+
+def _tag_table(table, tag=None):
+    """Copy a table, prefixing its sample IDs with a tag
+
+    The tag defaults to UNTAGGED.
+    """
+    if tag is None:
+        tag = 'UNTAGGED'
+
+    return table.update_ids({i: "%s_%s" % (tag, i) for i in table.ids()},
+                            inplace=False)
+
+
 def get_index(context, keys, axis, batchsize=100):
     """Get a unique integer value for a key within a context
 
@@ -0,0 +1,532 @@
+"""Asynchronous access to redbiom
+
+The methods here mirror those of redbiom._requests, redbiom.fetch,
+redbiom.util and redbiom.search, but do not block while a request is in
+flight, which allows redbiom to be embedded within an asyncio application
+such as a web service. This module depends on aiohttp, which is optional and
+only required when these methods are used.
+
+A single aiohttp.ClientSession is maintained per event loop so that
+connections are reused across requests. The session should be closed with
+close_session() prior to the event loop terminating.
+"""
+import weakref
+
+
+# {event loop: aiohttp.ClientSession}
+_sessions = weakref.WeakKeyDictionary()
+
+
+def _import_aiohttp():
+    try:
+        import aiohttp
+    except ImportError:
+        raise ImportError("redbiom.aio requires aiohttp. It can be installed "
+                          "with: pip install aiohttp")
+    return aiohttp
+
+
+def get_session():
+    """Get the session for the running event loop"""
+    import asyncio
+    aiohttp = _import_aiohttp()
+
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession()
+        _sessions[loop] = session
+
+    return session
+
+
+async def close_session():
+    """Close the session of the running event loop, if one exists"""
+    import asyncio
+
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+def _check_config(config):
+    """Assert the host is accessed through Webdis"""
+    import redbiom._requests
+    if redbiom._requests._uses_resp(config):
+        raise ValueError("redbiom.aio requires a Webdis host, not: %s"
+                         % config['hostname'])
+
+
+async def _parse_validate_request(req, command):
+    """Assert 200, parse, pull out the content"""
+    import requests
+    if req.status != 200:
+        content = await req.read()
+        raise requests.HTTPError("%s : %s" % (command, content))
+
+    # Webdis may not describe the response as application/json
+    return (await req.json(content_type=None))[command]
+
+
+def make_post(config):
+    """Factory function: produce an awaitable post() method"""
+    from redbiom._requests import _format_request
+    _check_config(config)
+
+    async def f(context, cmd, payload):
+        data = _format_request(context, cmd, payload, as_bytes=True)
+        async with get_session().post(config['hostname'], data=data) as req:
+            return await _parse_validate_request(req, cmd)
+    return f
+
+
+def make_get(config):
+    """Factory function: produce an awaitable get() method"""
+    from redbiom._requests import _format_request
+    _check_config(config)
+
+    async def f(context, cmd, data):
+        payload = _format_request(context, cmd, data)
+        url = '/'.join([config['hostname'], payload])
+        async with get_session().get(url) as req:
+            return await _parse_validate_request(req, cmd)
+    return f
+
+
+def make_script_exec(config):
+    """Factory function: produce an awaitable script_exec() method"""
+    import json
+    from redbiom._requests import _format_request
+    _check_config(config)
+
+    async def f(sha, *args):
+        payload = [sha]
+        payload.extend([str(a) for a in args])
+        payload = '/'.join(payload)
+        data = _format_request(None, 'EVALSHA', payload)
+        async with get_session().post(config['hostname'], data=data) as req:
+            return json.loads(await _parse_validate_request(req, 'EVALSHA'))
+
+    return f
+
+
+async def buffered(it, prefix, cmd, context, get=None, buffer_size=None,
+                   multikey=None, in_flight=None, max_bytes=None):
+    """Bulk fetch data
+
+    Parameters are as described by redbiom._requests.buffered, with the
+    exception that get, if provided, must be an awaitable get method. At
+    most in_flight chunks are requested concurrently, and the results are
+    yielded in order.
+    """
+    import asyncio
+    import redbiom
+    import redbiom._requests
+
+    config = redbiom.get_config()
+    if get is None:
+        get = make_get(config)
+    post = make_post(config)
+
+    if in_flight is None:
+        in_flight = config['max_workers']
+
+    if max_bytes is None:
+        max_bytes = config['buffer_bytes']
+
+    payloads = list(redbiom._requests._buffered_payloads(it, prefix, context,
+                                                         buffer_size,
+                                                         multikey, max_bytes))
+
+    semaphore = asyncio.Semaphore(max(in_flight, 1))
+
+    async def request(bulk):
+        async with semaphore:
+            if redbiom._requests._oversized(bulk, max_bytes):
+                return await post(None, cmd, bulk)
+            return await get(None, cmd, bulk)
+
+    results = await asyncio.gather(*[request(bulk) for _, bulk in payloads])
+    for (items, _), result in zip(payloads, results):
+        yield items, result
+
+
+async def valid(context, get=None):
+    """Test if a context exists"""
+    if get is None:
+        import redbiom
+        config = redbiom.get_config()
+        get = make_get(config)
+
+    if not await get('state', 'HEXISTS', 'contexts/%s' % context):
+        raise ValueError("Unknown context: %s" % context)
+
+
+async def script_sha(name, get=None):
+    """Retrieve the SHA1 of a script
+
+    The SHA1s are shared with redbiom.admin.ScriptManager.
+
+    Raises
+    ------
+    ValueError
+        If the script name is not recognized
+    """
+    import redbiom.admin
+
+    cache = redbiom.admin.ScriptManager._sha_cache()
+    sha = cache.get(name)
+    if sha is not None:
+        return sha
+
+    if get is None:
+        import redbiom
+        config = redbiom.get_config()
+        get = make_get(config)
+
+    sha = await get('state', 'HGET', 'scripts/%s' % name)
+    if sha is None:
+        raise ValueError('Unknown script')
+
+    cache[name] = sha
+    return sha
+
+
+async def ids_from(it, exact, axis, contexts, min_count=1):
+    """Grab samples from an iterable of IDs
+
+    Parameters and return values are as described by redbiom.util.ids_from.
+    The batches of IDs are requested concurrently.
+    """
+    import asyncio
+    import redbiom
+    import redbiom._requests
+
+    config = redbiom.get_config()
+    se = make_script_exec(config)
+
+    if axis not in {'feature', 'sample'}:
+        raise ValueError("Unknown axis: %s" % axis)
+
+    if not isinstance(contexts, (list, set, tuple)):
+        contexts = [contexts]
+
+    it = list(it)
+    try:
+        fetcher = await script_sha('ids-from')
+    except ValueError:
+        # the server predates the script
+        return await _ids_from_per_id(it, exact, axis, contexts, min_count)
+
+    batches = list(redbiom._requests.batch_by_size(it,
+                                                   config['buffer_bytes']))
+
+    retrieved = set()
+    for context in contexts:
+        blocks = await asyncio.gather(*[se(fetcher, 0, context, axis,
+                                           int(exact), min_count, *batch)
+                                        for batch in batches])
+
+        context_ids = None
+        for block in blocks:
+            # an empty result is decoded as an empty dict as Lua does not
+            # distinguish an empty array
+            block = set(block or [])
+            if context_ids is None:
+                context_ids = block
+            elif exact:
+                context_ids &= block
+            else:
+                context_ids |= block
+
+        if context_ids:
+            retrieved = retrieved.union(context_ids)
+
+    return retrieved
+
+
+async def _ids_from_per_id(it, exact, axis, contexts, min_count=1):
+    """Grab samples from IDs, obtaining the associations of each ID
+
+    Parameters and return values are as described by redbiom.util.ids_from.
+    """
+    import asyncio
+    import redbiom
+
+    config = redbiom.get_config()
+    se = make_script_exec(config)
+    fetcher = await script_sha('fetch-%s' % axis)
+
+    retrieved = set()
+    for context in contexts:
+        blocks = await asyncio.gather(*[se(fetcher, 0, context, id_)
+                                        for id_ in it])
+
+        context_ids = None
+        for block in blocks:
+            block = {k for k, v in block.items() if v >= min_count}
+            if context_ids is None:
+                context_ids = block
+            elif exact:
+                context_ids = context_ids.intersection(block)
+            else:
+                context_ids.update(block)
+
+        if context_ids:
+            retrieved = retrieved.union(context_ids)
+
+    return retrieved
+
+
+async def resolve_ambiguities(context, samples, get=None):
+    """Determine mappings for requested samples
+
+    Parameters and return values are as described by
+    redbiom.util.resolve_ambiguities. The ambiguity index is queried
+    concurrently, and if it is unavailable or incomplete, all samples
+    represented in the context are obtained instead.
+    """
+    import asyncio
+    import redbiom
+    import redbiom._requests
+    import redbiom.util
+
+    config = redbiom.get_config()
+    if get is None:
+        get = make_get(config)
+
+    samples = list(samples)
+
+    ctx_with_ambig = None
+    try:
+        sha = await script_sha('ambiguities', get)
+    except ValueError:
+        # the server predates the script
+        sha = None
+
+    if sha is not None:
+        se = make_script_exec(config)
+        batches = redbiom._requests.batch_by_size(
+            redbiom.util._ambiguity_lookups(samples), config['buffer_bytes'])
+        found = await asyncio.gather(*[se(sha, 0, context, *batch)
+                                       for batch in batches])
+        if not any(f is False for f in found):
+            ctx_with_ambig = {}
+            for f in found:
+                ctx_with_ambig.update(f)
+
+    if ctx_with_ambig is None:
+        represented = await get(context, 'SMEMBERS', 'samples-represented')
+        ctx_with_ambig = redbiom.util._ambiguity_map(represented)
+
+    return redbiom.util._resolve_with_ambiguity_map(samples, ctx_with_ambig)
+
+
+async def feature_ids_from_indices(context, indices, get=None):
+    """Resolve feature indices to feature IDs
+
+    Parameters, return values and exceptions are as described by
+    redbiom.fetch.feature_ids_from_indices.
+    """
+    if get is None:
+        import redbiom
+        config = redbiom.get_config()
+        get = make_get(config)
+
+    result = {}
+    async for idx, names in buffered(iter([str(i) for i in indices]), None,
+                                     'HMGET', context, get=get,
+                                     multikey='feature-index-inverted'):
+        for id_, name in zip(idx, names):
+            if name is None:
+                # this should not happen and is a consistency check
+                raise ValueError("An unassociated index has been found")
+            result[int(id_)] = name
+
+    return result
+
+
+async def taxon_ancestors(context, ids, get=None, normalize=None):
+    """Fetch the taxonomy information for a set of IDs
+
+    Parameters and return values are as described by
+    redbiom.fetch.taxon_ancestors.
+    """
+    import redbiom.fetch
+
+    if get is None:
+        import redbiom
+        config = redbiom.get_config()
+        get = make_get(config)
+
+    remapped = {}
+    async for names, idx in buffered(iter(ids), None, 'HMGET', context,
+                                     get=get, multikey='feature-index'):
+        for name, id_ in zip(names, idx):
+            remapped[name] = id_ if id_ is not None else name
+
+    to_get = list(remapped.values())
+    child_parent = {}
+    while to_get:
+        new_to_get = set()
+        async for children, parents in buffered(iter(to_get), None, 'HMGET',
+                                                context, get=get,
+                                                multikey='taxonomy-parents'):
+            for child, parent in zip(children, parents):
+                if parent is None:
+                    continue
+
+                child_parent[child] = parent
+                new_to_get.add(parent)
+        to_get = new_to_get
+
+    return redbiom.fetch._lineages(ids, remapped, child_parent, normalize)
+
+
+async def data_from_samples(context, samples, skip_taxonomy=False,
+                            normalize_taxonomy=None):
+    """Fetch sample data from an iterable of samples.
+
+    Parameters and return values are as described by
+    redbiom.fetch.data_from_samples. The batches of samples are requested
+    concurrently.
+    """
+    import asyncio
+    import redbiom
+    import redbiom.fetch
+    import redbiom._requests
+    import redbiom.util
+
+    config = redbiom.get_config()
+    get = make_get(config)
+    se = make_script_exec(config)
+
+    await valid(context, get)
+
+    _, _, _, rimap = await resolve_ambiguities(context, samples, get)
+
+    fetch_indexed = await script_sha('fetch-indexed', get)
+    batches = list(redbiom._requests.batch_by_size(
+        rimap, redbiom.fetch.FETCH_BATCH_BYTES,
+        redbiom.fetch.FETCH_BATCH_SIZE))
+
+    # 0 -> we're passing 0 keys, and instead using ARGV
+    fetched = await asyncio.gather(*[se(fetch_indexed, 0, context, 'sample',
+                                        *batch)
+                                     for batch in batches])
+
+    sample_ids, unique_indices, rows, columns, values = \
+        redbiom.fetch._coo_from_indexed(zip(batches, fetched))
+
+    index_to_feature = await feature_ids_from_indices(context,
+                                                      unique_indices, get)
+    obs_ids = [index_to_feature[idx] for idx in unique_indices]
+
+    if skip_taxonomy:
+        lineages = None
+    else:
+        lineages = await taxon_ancestors(context, obs_ids, get,
+                                         normalize=normalize_taxonomy)
+
+    return redbiom.fetch._table_from_coo(values, rows, columns, obs_ids,
+                                         sample_ids, lineages, rimap)
+
+
+async def metadata_full(query, categories=False, get=None):
+    """Find samples or categories
+
+    Parameters, return values and exceptions are as described by
+    redbiom.search.metadata_full.
+
+    Notes
+    -----
+    The query is evaluated by redbiom.set_expr and redbiom.where_expr. The
+    terms of the query are obtained concurrently in advance of the
+    evaluation, and where clauses are evaluated within Redis where possible
+    (see redbiom.where_expr.where_ids).
+    """
+    import ast
+    import asyncio
+    import json
+    import redbiom
+    import redbiom.admin
+    import redbiom.search
+    import redbiom.set_expr
+    import redbiom.where_expr
+
+    config = redbiom.get_config()
+    if get is None:
+        get = make_get(config)
+
+    if categories:
+        target = 'category-search'
+    else:
+        target = 'text-search'
+
+    stem_f = redbiom.search._stemmer()
+
+    # gather the requests the query evaluation will make
+    plan = redbiom.search.query_plan(query)
+    where_sha = None
+    if not categories and any(t == 'where' for t, _ in plan):
+        try:
+            where_sha = await script_sha('where', get)
+        except ValueError:
+            # the server predates the script
+            pass
+        else:
+            se = make_script_exec(config)
+
+    requests = set()
+    evaluated = {}
+    for plan_type, q in plan:
+        if plan_type == 'where' and where_sha is not None:
+            where_plan = redbiom.where_expr.compile_plan(q)
+            if where_plan is not None:
+                evaluated[q] = se(where_sha, 0, redbiom.admin.quote_plus(
+                    json.dumps(where_plan)))
+                continue
+
+        for node in ast.walk(ast.parse(q, mode='eval')):
+            if not isinstance(node, ast.Name):
+                continue
+
+            if plan_type == 'set':
+                stem = next(stem_f(node.id), None)
+                if stem is not None:
+                    requests.add(('metadata:%s' % target, 'SMEMBERS', stem))
+            elif node.id not in {'None', 'none'}:
+                requests.add(('metadata:category', 'HGETALL', node.id))
+
+    requests = list(requests)
+    results = await asyncio.gather(*[get(*r) for r in requests])
+    prefetched = dict(zip(requests, results))
+
+    # an empty array is encoded by Lua as an empty object
+    results = await asyncio.gather(*evaluated.values())
+    evaluated = {q: set(r) for q, r in zip(evaluated, results)}
+
+    def prefetched_get(context, cmd, data):
+        return prefetched[(context, cmd, data)]
+
+    samples = set()
+    for plan_type, q in plan:
+        if plan_type == 'set':
+            samples.update(redbiom.set_expr.seteval(q, get=prefetched_get,
+                                                    target=target,
+                                                    stemmer=stem_f))
+        elif plan_type == 'where':
+            if categories:
+                raise ValueError("where clauses not allowed with a category "
+                                 "search")
+            if q in evaluated:
+                obs = evaluated[q]
+            else:
+                obs = set(redbiom.where_expr.whereeval(q, get=prefetched_get)
+                          .index)
+            if samples:
+                samples &= obs
+            else:
+                samples = obs
+
+    return samples
@@ -0,0 +1,223 @@
+"""In-process caching of repeated lookups
+
+Lookups which are commonly repeated within a session, such as testing
+whether a context exists, are retained in memory so that repeating them does
+not require a request to the server. Entries expire after REDBIOM_CACHE_TTL
+seconds (default 60), and setting it to 0 disables the caching. Writes made
+through redbiom.admin discard all entries, while clear() can be used when
+the database is updated by other means.
+
+The number of hits and misses of each cache is reported by stats().
+"""
+import threading
+
+
+# the default upper bound on the number of entries in a cache
+DEFAULT_MAXSIZE = 1024
+
+# {name: LRUCache}
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class LRUCache(object):
+    """A bounded, least recently used, mapping whose entries may expire
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        The upper bound on the number of entries.
+    ttl : float, optional
+        The default number of seconds an entry is retained for. By default,
+        entries do not expire.
+
+    Notes
+    -----
+    The cache is safe to use from multiple threads.
+    """
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=None):
+        from collections import OrderedDict
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # {key: (expiry or None, value)}
+        self._lock = threading.Lock()
+
+    def _lookup(self, key):
+        """Obtain an unexpired entry, noting its use, or raise KeyError"""
+        import time
+
+        expiry, value = self._data[key]
+        if expiry is not None and expiry <= time.monotonic():
+            del self._data[key]
+            raise KeyError(key)
+
+        self._data.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        """Obtain the value of a key, recording a hit or a miss"""
+        with self._lock:
+            try:
+                value = self._lookup(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store the value of a key
+
+        Parameters
+        ----------
+        key : hashable
+            The key
+        value : object
+            The value
+        ttl : float, optional
+            The number of seconds to retain the value for, if not the
+            default of the cache.
+        """
+        import time
+
+        if ttl is None:
+            ttl = self.ttl
+        expiry = None if ttl is None else time.monotonic() + ttl
+
+        with self._lock:
+            self._data[key] = (expiry, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Remove a key, returning its value if it was present"""
+        with self._lock:
+            try:
+                value = self._lookup(key)
+            except KeyError:
+                return default
+
+            del self._data[key]
+            return value
+
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            try:
+                self._lookup(key)
+            except KeyError:
+                return False
+            return True
+
+    def __getitem__(self, key):
+        with self._lock:
+            return self._lookup(key)
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __len__(self):
+        return len(self._data)
+
+
+def get_cache(name, maxsize=DEFAULT_MAXSIZE, ttl=None):
+    """Obtain a named cache, creating it if necessary
+
+    Parameters
+    ----------
+    name : str
+        The name of the cache
+    maxsize : int, optional
+        The upper bound on the number of entries, if the cache is created.
+    ttl : float, optional
+        The default lifetime of entries, if the cache is created.
+
+    Returns
+    -------
+    LRUCache
+        The cache
+    """
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = LRUCache(maxsize, ttl)
+        return _caches[name]
+
+
+def clear():
+    """Discard the entries of all caches"""
+    with _caches_lock:
+        caches = list(_caches.values())
+
+    for cache in caches:
+        cache.clear()
+
+
+def stats():
+    """Summarize the use of the caches
+
+    Returns
+    -------
+    dict
+        {name: {'hits': int, 'misses': int, 'size': int}}
+    """
+    with _caches_lock:
+        caches = dict(_caches)
+
+    return {name: {'hits': c.hits, 'misses': c.misses, 'size': len(c)}
+            for name, c in caches.items()}
+
+
+def lookup(name, key, compute):
+    """Obtain a result from a named cache, computing it if necessary
+
+    Parameters
+    ----------
+    name : str
+        The name of the cache to use
+    key : tuple
+        The arguments which determine the result
+    compute : function
+        Called without arguments to produce the result if it is not cached
+
+    Notes
+    -----
+    Results are keyed by the host in use as well, and are retained for
+    REDBIOM_CACHE_TTL seconds. A copy of the result is returned, so it may
+    be modified by the caller. Exceptions are not cached.
+
+    Returns
+    -------
+    object
+        The result
+    """
+    import copy
+    import redbiom
+
+    config = redbiom.get_config()
+    ttl = config['cache_ttl']
+    if ttl <= 0:
+        return compute()
+
+    key = (config['hostname'], ) + tuple(key)
+    try:
+        hash(key)
+    except TypeError:
+        return compute()
+
+    cache = get_cache(name)
+    missing = object()
+    result = cache.get(key, missing)
+    if result is missing:
+        result = compute()
+        cache.set(key, result, ttl)
+
+    return copy.copy(result)
@@ -47,26 +47,59 @@ def coherency(context):
               help="The name of the context to load into.")
 @click.option('--tag', required=False, type=str, default=None,
               help="The tag associated to the samples (e.g., preparation ID).")
-@click.option('--mass-insertion', default=False, is_flag=True)
-def load_sample_data(table, context, tag, mass_insertion):
+@click.option('--mass-insertion', default=False, is_flag=True,
+              help=("Write the commands to load the data for "
+                    "\"redis-cli --pipe\" to standard output rather than "
+                    "loading it. The samples to load and their indices are "
+                    "determined by the server."))
+@click.option('--offline', default=False, is_flag=True,
+              help=("Write the commands for mass insertion without "
+                    "consulting the server. The samples are not verified to "
+                    "have metadata, and the context must not yet contain "
+                    "data. Implies --mass-insertion."))
+@click.option('--mass-insertion-output', required=False, default=None,
+              type=click.Path(dir_okay=False, writable=True),
+              help=("Write the commands for mass insertion to this file "
+                    "rather than standard output. The file is gzip "
+                    "compressed if it ends in \".gz\". Implies "
+                    "--mass-insertion."))
+@click.option('--workers', required=False, type=click.IntRange(min=1),
+              default=None,
+              help=("The number of batches of data to send concurrently. "
+                    "Defaults to $REDBIOM_MAX_WORKERS, or 1 if that is not "
+                    "set."))
+@click.option('--resume', default=False, is_flag=True,
+              help=("Resume an interrupted load of the table into the "
+                    "context. The same table and tag must be provided."))
+def load_sample_data(table, context, tag, mass_insertion, offline,
+                     mass_insertion_output, workers, resume):
     """Load nonzero entries per sample."""
     import redbiom.admin
     import biom
     table = biom.load_table(table)
+    mass_insertion = any([mass_insertion, offline,
+                          mass_insertion_output is not None])
     redbiom.admin.load_sample_data(table, context, tag=tag,
-                                   redis_protocol=mass_insertion)
+                                   redis_protocol=mass_insertion,
+                                   workers=workers,
+                                   output=mass_insertion_output,
+                                   resume=resume, offline=offline)
 
 
 @admin.command(name='load-sample-metadata')
 @click.option('--metadata', required=True, type=click.Path(exists=True),
               help="The filepath to the sample metadata to load.")
-def load_sample_metadata(metadata):
+@click.option('--numeric', type=str, required=False, multiple=True,
+              help=("A category to index by its numeric values, which "
+                    "speeds up range comparisons in where clauses. Can be "
+                    "specified multiple times."))
+def load_sample_metadata(metadata, numeric):
     """Load sample metadata."""
     import redbiom.admin
     import pandas as pd
     metadata = pd.read_csv(metadata, sep='\t', dtype=str,
                            keep_default_na=False, na_values=[])
-    n_loaded = redbiom.admin.load_sample_metadata(metadata)
+    n_loaded = redbiom.admin.load_sample_metadata(metadata, numeric=numeric)
     click.echo("Loaded %d samples" % n_loaded)
 
 
@@ -148,10 +148,15 @@ def fetch_sample_metadata(from_, samples, all_columns, context, output,
               required=False,
               help=("If using --resolve-ambiguities=most-reads, set this flag "
                     "to retain the artifact ID of the sample kept"))
+@click.option('--workers', required=False, type=click.IntRange(min=1),
+              default=None,
+              help=("The number of concurrent requests to issue. Defaults to "
+                    "$REDBIOM_MAX_WORKERS, or 1 if that is not set."))
 @click.argument('features', nargs=-1)
 def fetch_samples_from_obserations(features, exact, from_, output,
                                    context, md5, resolve_ambiguities,
-                                   fetch_taxonomy, retain_artifact_id):
+                                   fetch_taxonomy, retain_artifact_id,
+                                   workers):
     """Fetch sample data containing features."""
     if retain_artifact_id and resolve_ambiguities != 'merge-reads':
         raise ValueError('--retain-artifact-id only impacts a merge-reads '
@@ -163,7 +168,8 @@ def fetch_samples_from_obserations(features, exact, from_, output,
     import redbiom.fetch
     skip_taxonomy = not fetch_taxonomy
     tab, map_ = redbiom.fetch.data_from_features(context, iterable, exact,
-                                                 skip_taxonomy=skip_taxonomy)
+                                                 skip_taxonomy=skip_taxonomy,
+                                                 workers=workers)
 
     if md5:
         tab, new_ids = redbiom.util.convert_biom_ids_to_md5(tab)
@@ -208,10 +214,14 @@ def fetch_samples_from_obserations(features, exact, from_, output,
               required=False,
               help=("If using --resolve-ambiguities=most-reads, set this flag "
                     "to retain the artifact ID of the sample kept"))
+@click.option('--workers', required=False, type=click.IntRange(min=1),
+              default=None,
+              help=("The number of concurrent requests to issue. Defaults to "
+                    "$REDBIOM_MAX_WORKERS, or 1 if that is not set."))
 @click.argument('samples', nargs=-1)
 def fetch_samples_from_samples(samples, from_, output, context, md5,
                                resolve_ambiguities, fetch_taxonomy,
-                               retain_artifact_id):
+                               retain_artifact_id, workers):
     """Fetch sample data."""
     if retain_artifact_id and resolve_ambiguities != 'merge-reads':
         raise ValueError('--retain-artifact-id only impacts a merge-reads '
@@ -223,7 +233,8 @@ def fetch_samples_from_samples(samples, from_, output, context, md5,
     import redbiom.fetch
     skip_taxonomy = not fetch_taxonomy
     table, ambig = redbiom.fetch.data_from_samples(context, iterable,
-                                                   skip_taxonomy=skip_taxonomy)
+                                                   skip_taxonomy=skip_taxonomy,
+                                                   workers=workers)
 
     if md5:
         table, new_ids = redbiom.util.convert_biom_ids_to_md5(table)
@@ -268,8 +279,13 @@ def fetch_samples_from_samples(samples, from_, output, context, md5,
               help="Calculate and use MD5 for the features. This will also "
               "save a tsv file with the original feature name and the md5",
               default=False)
+@click.option('--workers', required=False, type=click.IntRange(min=1),
+              default=None,
+              help=("The number of concurrent requests to issue. Defaults to "
+                    "$REDBIOM_MAX_WORKERS, or 1 if that is not set."))
 def qiita_study(study_id, context, resolve_ambiguities, fetch_taxonomy,
-                retain_artifact_id, remove_blanks, output_basename, md5):
+                retain_artifact_id, remove_blanks, output_basename, md5,
+                workers):
     """Fetch sample data from a Qiita study."""
     if retain_artifact_id and resolve_ambiguities != 'merge-reads':
         raise ValueError('--retain-artifact-id only impacts a merge-reads '
@@ -281,7 +297,8 @@ def qiita_study(study_id, context, resolve_ambiguities, fetch_taxonomy,
     import redbiom.fetch
     skip_taxonomy = not fetch_taxonomy
     table, ambig = redbiom.fetch.data_from_samples(context, samples,
-                                                   skip_taxonomy=skip_taxonomy)
+                                                   skip_taxonomy=skip_taxonomy,
+                                                   workers=workers)
 
     if remove_blanks:
         keep = {i for i in table.ids() if 'blank' not in i.lower()}
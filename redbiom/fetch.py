@@ -1,3 +1,10 @@
+# bounds for the batches of samples obtained per fetch-indexed request. the
+# byte bound limits the request body, while the sample bound limits both the
+# size of the response and the time the script occupies the server
+FETCH_BATCH_BYTES = 8192
+FETCH_BATCH_SIZE = 100
+
+
 def tags_in_context(context, get=None):
     """Fetch the unique tags within a context
 
@@ -63,7 +70,18 @@ def samples_in_context(context, unambiguous, get=None):
     Redis Command Summary
     ---------------------
     SMEMBERS <context>:samples-represented
+
+    The result is retained for REDBIOM_CACHE_TTL seconds (see
+    redbiom.cache).
     """
+    import redbiom.cache
+    return redbiom.cache.lookup(
+        'samples_in_context', (context, unambiguous),
+        lambda: _samples_in_context(context, unambiguous, get))
+
+
+def _samples_in_context(context, unambiguous, get=None):
+    """Fetch samples in a context, without caching the result"""
     import redbiom
     import redbiom._requests
     import redbiom.util
@@ -106,7 +124,17 @@ def features_in_context(context, get=None):
     Redis Command Summary
     ---------------------
     SMEMBERS <context>:features-represented
+
+    The result is retained for REDBIOM_CACHE_TTL seconds (see
+    redbiom.cache).
     """
+    import redbiom.cache
+    return redbiom.cache.lookup('features_in_context', (context, ),
+                                lambda: _features_in_context(context, get))
+
+
+def _features_in_context(context, get=None):
+    """Features in a context, without caching the result"""
     import redbiom
     import redbiom._requests
     import redbiom.util
@@ -158,10 +186,15 @@ def sample_metadata(samples, common=True, context=None, restrict_to=None,
 
     Redis command summary
     ---------------------
+    EVALSHA <sample-categories-sha1> 0 <common|all> <sample_id> ...
     MGET metadata:categories:<sample_id> ... metadata:categories:<sample_id>
     HMGET metadata:category:<column> <sample_id> ... <sample_id>
+
+    The categories of the samples are combined by the server, unless the
+    database predates the sets of categories (see
+    redbiom.admin.index_sample_categories), in which case they are obtained
+    with MGET.
     """
-    import json
     from collections import defaultdict
     import pandas as pd
     import redbiom
@@ -191,28 +224,12 @@ def sample_metadata(samples, common=True, context=None, restrict_to=None,
     if not ambig_assoc:
         raise ValueError("None of the samples were found in the context")
 
-    # TODO: express metadata-categories using redis sets
-    # and then this can be done with SINTER
-    all_columns = []
-    all_samples = []
-
-    getter = redbiom._requests.buffered(list(ambig_assoc), 'categories',
-                                        'MGET', 'metadata', get=get,
-                                        buffer_size=200)
-    for samples, columns_by_sample in getter:
-        all_samples.extend(samples)
-        for column_set in columns_by_sample:
-            if column_set is not None:
-                column_set = json.loads(column_set)
-                all_columns.append(set(column_set))
+    all_samples = [s.strip() for s in ambig_assoc]
+    common = common and restrict_to is None
 
-    columns_to_get = set(all_columns[0])
-
-    for columns in all_columns[1:]:
-        if (restrict_to is not None) or (not common):
-            columns_to_get = columns_to_get.union(columns)
-        else:
-            columns_to_get = columns_to_get.intersection(columns)
+    columns_to_get = _sample_categories(all_samples, common)
+    if columns_to_get is None:
+        columns_to_get = _sample_categories_json(all_samples, common, get)
 
     if restrict_to is not None:
         if not set(restrict_to).issubset(columns_to_get):
@@ -242,7 +259,91 @@ def sample_metadata(samples, common=True, context=None, restrict_to=None,
     return md, ambig_map
 
 
-def data_from_features(context, features, exact, skip_taxonomy=False):
+def _sample_categories(samples, common):
+    """Combine the categories of samples using the sets of categories
+
+    Parameters
+    ----------
+    samples : list of str
+        The samples of interest
+    common : bool
+        If True, obtain the categories common to the samples. Otherwise,
+        obtain the categories of any of the samples.
+
+    Returns
+    -------
+    set or None
+        The categories, or None if the sets of categories are unavailable or
+        do not describe every sample. Samples without metadata are ignored.
+    """
+    import redbiom
+    import redbiom._requests
+    import redbiom.admin
+
+    config = redbiom.get_config()
+    try:
+        sha = redbiom.admin.ScriptManager.get('sample-categories')
+    except ValueError:
+        # the server predates the script
+        return None
+
+    se = redbiom._requests.make_script_exec(config)
+    mode = 'common' if common else 'all'
+
+    columns = None
+    for batch in redbiom._requests.batch_by_size(samples,
+                                                 config['buffer_bytes']):
+        found = se(sha, 0, mode, *batch)
+        if found is False:
+            return None
+
+        # none of the samples of the batch have metadata
+        if not found['found']:
+            continue
+
+        # an empty array is encoded by Lua as an empty object
+        batch_columns = set(found['columns'])
+        if columns is None:
+            columns = batch_columns
+        elif common:
+            columns &= batch_columns
+        else:
+            columns |= batch_columns
+
+    return set() if columns is None else columns
+
+
+def _sample_categories_json(samples, common, get):
+    """Combine the categories of samples from their JSON representation
+
+    Parameters are as described by _sample_categories, and get is a get()
+    method.
+    """
+    import json
+    import redbiom._requests
+
+    all_columns = []
+    getter = redbiom._requests.buffered(samples, 'categories', 'MGET',
+                                        'metadata', get=get)
+    for _, columns_by_sample in getter:
+        for column_set in columns_by_sample:
+            if column_set is not None:
+                all_columns.append(set(json.loads(column_set)))
+
+    if not all_columns:
+        return set()
+
+    columns_to_get = all_columns[0]
+    for columns in all_columns[1:]:
+        if common:
+            columns_to_get = columns_to_get.intersection(columns)
+        else:
+            columns_to_get = columns_to_get.union(columns)
+    return columns_to_get
+
+
+def data_from_features(context, features, exact, skip_taxonomy=False,
+                       workers=None):
     """Fetch sample data from an iterable of features.
 
     Parameters
@@ -257,6 +358,9 @@ def data_from_features(context, features, exact, skip_taxonomy=False):
     skip_taxonomy : bool, optional
         If true, do not resolve taxonomy. This greatly reduces fetch time.
         Default is false.
+    workers : int, optional
+        The number of concurrent requests to issue. If not specified,
+        REDBIOM_MAX_WORKERS is used.
 
     Returns
     -------
@@ -276,13 +380,14 @@ def data_from_features(context, features, exact, skip_taxonomy=False):
     redbiom._requests.valid(context, get)
 
     # determine the samples which contain the features of interest
-    samples = redbiom.util.ids_from(features, exact, 'feature', [context])
+    samples = redbiom.util.ids_from(features, exact, 'feature', [context],
+                                    workers=workers)
 
     return _biom_from_samples(context, iter(samples), get=get,
-                              skip_taxonomy=skip_taxonomy)
+                              skip_taxonomy=skip_taxonomy, workers=workers)
 
 
-def data_from_samples(context, samples, skip_taxonomy=False):
+def data_from_samples(context, samples, skip_taxonomy=False, workers=None):
     """Fetch sample data from an iterable of samples.
 
     Paramters
@@ -294,6 +399,9 @@ def data_from_samples(context, samples, skip_taxonomy=False):
     skip_taxonomy : bool, optional
         If true, do not resolve taxonomy. This greatly reduces fetch time.
         Default is false.
+    workers : int, optional
+        The number of concurrent requests to issue. If not specified,
+        REDBIOM_MAX_WORKERS is used.
 
     Returns
     -------
@@ -303,11 +411,12 @@ def data_from_samples(context, samples, skip_taxonomy=False):
         A map of {sample_id_in_table: original_id}. This map can be used to
         identify what samples are ambiguous based off their original IDs.
     """
-    return _biom_from_samples(context, samples, skip_taxonomy=skip_taxonomy)
+    return _biom_from_samples(context, samples, skip_taxonomy=skip_taxonomy,
+                              workers=workers)
 
 
 def _biom_from_samples(context, samples, get=None, normalize_taxonomy=None,
-                       skip_taxonomy=False):
+                       skip_taxonomy=False, workers=None):
     """Create a BIOM table from an iterable of samples
 
     Parameters
@@ -323,6 +432,9 @@ def _biom_from_samples(context, samples, get=None, normalize_taxonomy=None,
     skip_taxonomy : bool, optional
         If true, do not resolve taxonomy. This greatly reduces fetch time.
         Default is false.
+    workers : int, optional
+        The number of concurrent requests to issue for the sample data. If
+        not specified, REDBIOM_MAX_WORKERS is used.
 
     Returns
     -------
@@ -332,14 +444,20 @@ def _biom_from_samples(context, samples, get=None, normalize_taxonomy=None,
         A map of {sample_id_in_table: original_id}. This map can be used to
         identify what samples are ambiguous based off their original IDs.
 
+    Notes
+    -----
+    Samples are requested in batches, bounded by FETCH_BATCH_BYTES of
+    identifiers and at most FETCH_BATCH_SIZE samples, so that the number of
+    requests made scales with the volume of data rather than the number of
+    samples. The sample data are obtained with feature indices rather than
+    feature IDs, and each unique index is resolved once. The table is
+    assembled from coordinate arrays in a single step.
+
     Redis command summary
     ---------------------
-    HMGET <context>:feature-index-inverted
-    EVALSHA <fetch-sample-sha1> 0 context <redbiom-id>
+    EVALSHA <fetch-indexed-sha1> 0 context sample <redbiom-id> ... <redbiom-id>
+    HMGET <context>:feature-index-inverted <index> ... <index>
     """
-    from operator import itemgetter
-    import scipy.sparse as ss
-    import biom
     import redbiom.admin
     import redbiom._requests
     import redbiom.util
@@ -349,8 +467,6 @@ def _biom_from_samples(context, samples, get=None, normalize_taxonomy=None,
     if get is None:
         get = redbiom._requests.make_get(config)
 
-    se = redbiom._requests.make_script_exec(config)
-
     redbiom._requests.valid(context, get)
 
     samples = list(samples)  # unroll iterator if necessary
@@ -359,30 +475,27 @@ def _biom_from_samples(context, samples, get=None, normalize_taxonomy=None,
     stable_ids, unobserved, ambig_assoc, rimap = \
         redbiom.util.resolve_ambiguities(context, samples, get)
 
-    table_data = []
-    unique_indices = set()
-    fetch_sample = redbiom.admin.ScriptManager.get('fetch-sample')
-    for id_ in rimap:
+    fetch_indexed = redbiom.admin.ScriptManager.get('fetch-indexed')
+    batches = redbiom._requests.batch_by_size(rimap, FETCH_BATCH_BYTES,
+                                              FETCH_BATCH_SIZE)
+
+    def fetcher(batch):
+        # a script_exec is constructed per call so that the session of the
+        # thread is used
+        se = redbiom._requests.make_script_exec(config)
+
         # 0 -> we're passing 0 keys, and instead using ARGV
-        data = se(fetch_sample, 0, context, id_)
-        table_data.append((id_, data))
-        unique_indices.update(data)
-
-    # construct a mapping of
-    # {feature ID : index position in the BIOM table}
-    unique_indices_map = {observed: index
-                          for index, observed in enumerate(unique_indices)}
-
-    # pull out the feature and sample IDs in the desired ordering
-    obs_ids = [id_ for id_, _ in sorted(unique_indices_map.items(),
-                                        key=itemgetter(1))]
-    sample_ids = [id_ for id_, _ in table_data]
-
-    # fill in the matrix
-    mat = ss.lil_matrix((len(unique_indices), len(table_data)))
-    for col, (sample, col_data) in enumerate(table_data):
-        for obs_id, value in col_data.items():
-            mat[unique_indices_map[obs_id], col] = value
+        return batch, se(fetch_indexed, 0, context, 'sample', *batch)
+
+    fetched = redbiom._requests.parallel_map(fetcher, batches, workers)
+    sample_ids, unique_indices, rows, columns, values = \
+        _coo_from_indexed(fetched)
+
+    # the unique feature indices define the rows of the table, and each is
+    # resolved only once
+    index_to_feature = feature_ids_from_indices(context, unique_indices,
+                                                get=get)
+    obs_ids = [index_to_feature[idx] for idx in unique_indices]
 
     if skip_taxonomy:
         lineages = None
@@ -390,6 +503,92 @@ def _biom_from_samples(context, samples, get=None, normalize_taxonomy=None,
         lineages = taxon_ancestors(context, obs_ids, get,
                                    normalize=normalize_taxonomy)
 
+    return _table_from_coo(values, rows, columns, obs_ids, sample_ids,
+                           lineages, rimap)
+
+
+def _coo_from_indexed(fetched):
+    """Gather the COO components of a table from fetch-indexed results
+
+    Parameters
+    ----------
+    fetched : iterable of (list of str, dict)
+        The batches of redbiom IDs requested, and the fetch-indexed result
+        for each batch.
+
+    Returns
+    -------
+    list of str
+        The sample IDs, defining the columns of the table.
+    list of int
+        The unique feature indices, defining the rows of the table.
+    np.ndarray
+        The row of each value.
+    np.ndarray
+        The column of each value.
+    np.ndarray
+        The values.
+    """
+    import numpy as np
+
+    # the COO components of the table, gathered per sample as they arrive
+    sample_ids = []
+    indices = []
+    values = []
+    columns = []
+
+    for batch, data in fetched:
+        for id_ in batch:
+            # the data are index, value pairs. an empty sample is decoded
+            # as an empty dict as Lua does not distinguish an empty array
+            pairs = np.asarray(data[id_] or [], dtype=np.int64)
+            indices.append(pairs[::2])
+            values.append(pairs[1::2])
+            columns.append(np.full(len(pairs) // 2, len(sample_ids),
+                                   dtype=np.int64))
+            sample_ids.append(id_)
+
+    if sample_ids:
+        indices = np.concatenate(indices)
+        values = np.concatenate(values).astype(float)
+        columns = np.concatenate(columns)
+    else:
+        indices = values = columns = np.array([], dtype=np.int64)
+
+    unique_indices, rows = np.unique(indices, return_inverse=True)
+    return sample_ids, unique_indices.tolist(), rows, columns, values
+
+
+def _table_from_coo(values, rows, columns, obs_ids, sample_ids, lineages,
+                    rimap):
+    """Construct a BIOM table from its COO components
+
+    Parameters
+    ----------
+    values, rows, columns : np.ndarray
+        The COO components of the table.
+    obs_ids : list of str
+        The feature IDs, in order with the rows.
+    sample_ids : list of str
+        The redbiom IDs, in order with the columns.
+    lineages : list of list or None
+        The lineages of the features, if obtained.
+    rimap : dict
+        {redbiom ID: sample ID in table}
+
+    Returns
+    -------
+    biom.Table
+        The table with the sample IDs updated.
+    dict
+        A map of {sample_id_in_table: original_id}.
+    """
+    import scipy.sparse as ss
+    import biom
+
+    mat = ss.coo_matrix((values, (rows, columns)),
+                        shape=(len(obs_ids), len(sample_ids))).tocsr()
+
     if lineages is not None:
         obs_md = [{'taxonomy': lineage} for lineage in lineages]
     else:
@@ -406,6 +605,64 @@ def _biom_from_samples(context, samples, get=None, normalize_taxonomy=None,
     return table, ambiguity_map
 
 
+def feature_ids_from_indices(context, indices, get=None, cache=None):
+    """Resolve feature indices to feature IDs
+
+    Parameters
+    ----------
+    context : str
+        The context to operate in
+    indices : Iterable of int
+        The feature indices to resolve
+    get : function, optional
+        A get method
+    cache : dict, optional
+        A dict of {index: feature ID} of already resolved indices. Only
+        indices not present are requested, and the dict is updated with
+        those which are obtained. The cache must only be shared for a single
+        context.
+
+    Raises
+    ------
+    ValueError
+        If an index is not associated with a feature.
+
+    Returns
+    -------
+    dict
+        {index: feature ID} for the requested indices
+
+    Redis Command Summary
+    ---------------------
+    HMGET <context>:feature-index-inverted <index> ... <index>
+    """
+    import redbiom._requests
+
+    if get is None:
+        import redbiom
+        config = redbiom.get_config()
+        get = redbiom._requests.make_get(config)
+
+    if cache is None:
+        cache = {}
+
+    indices = set(indices)
+    to_get = [str(idx) for idx in indices if idx not in cache]
+
+    hmgetter = redbiom._requests.buffered
+    remapped_bulk = hmgetter(iter(to_get), None, 'HMGET', context,
+                             get=get, multikey='feature-index-inverted')
+
+    for idx, names in remapped_bulk:
+        for id_, name in zip(idx, names):
+            if name is None:
+                # this should not happen and is a consistency check
+                raise ValueError("An unassociated index has been found")
+            cache[int(id_)] = name
+
+    return {idx: cache[idx] for idx in indices}
+
+
 def taxon_ancestors(context, ids, get=None, normalize=None):
     """Fetch the taxonomy information for a set of IDs
 
@@ -429,7 +686,6 @@ def taxon_ancestors(context, ids, get=None, normalize=None):
     ---------------------
     HMGET <context>:taxonomy-parents <child> ... <child>
     """
-    from itertools import zip_longest
     import redbiom._requests
 
     if get is None:
@@ -439,8 +695,7 @@ def taxon_ancestors(context, ids, get=None, normalize=None):
 
     hmgetter = redbiom._requests.buffered
     remapped_bulk = hmgetter(iter(ids), None, 'HMGET', context,
-                             get=get, buffer_size=200,
-                             multikey='feature-index')
+                             get=get, multikey='feature-index')
 
     # map the feature identifier to an internal ID
     # if an internal ID does not exist, keep the provided ID
@@ -457,8 +712,7 @@ def taxon_ancestors(context, ids, get=None, normalize=None):
     while to_get:
         key = 'taxonomy-parents'
         getter = hmgetter(iter(to_get), None, 'HMGET',
-                          context, get=get,
-                          buffer_size=200, multikey=key)
+                          context, get=get, multikey=key)
 
         new_to_get = set()
         for block in getter:
@@ -470,6 +724,31 @@ def taxon_ancestors(context, ids, get=None, normalize=None):
                 new_to_get.add(parent)
         to_get = new_to_get
 
+    return _lineages(ids, remapped, child_parent, normalize)
+
+
+def _lineages(ids, remapped, child_parent, normalize=None):
+    """Form lineages from child -> parent relationships
+
+    Parameters
+    ----------
+    ids : list or tuple of str
+        The IDs to form lineages for
+    remapped : dict
+        {ID: internal ID}
+    child_parent : dict
+        {child: parent} for the internal IDs and their ancestors
+    normalize : list, optional
+        The ranks to normalize a lineage too (e.g., [k, p, c, o, f, g, s])
+
+    Returns
+    -------
+    list of list or None
+        The lineage information for each ID in order with ids, or None if
+        there is no taxonomy information.
+    """
+    from itertools import zip_longest
+
     if not child_parent:
         return None
 
@@ -538,8 +817,7 @@ def taxon_descendents(context, taxon, get=None):
         to_get = new_to_get
 
     remapped_bulk = hmgetter(to_keep, None, 'HMGET', context,
-                             get=get, buffer_size=200,
-                             multikey='feature-index-inverted')
+                             get=get, multikey='feature-index-inverted')
 
     remapped = {name
                 for idx, names in remapped_bulk
@@ -655,11 +933,15 @@ def metadata(where=None, tag=None, restrict_to=None):
 
     Redis command summary
     ---------------------
-    MGET metadata:categories:<sample_id> ... metadata:categories:<sample_id>
-    HMGET metadata:category:<column> <sample_id> ... <sample_id>
+    SMEMBERS metadata:categories-represented
+    HGETALL metadata:category:<column>
+
+    Notes
+    -----
+    The samples considered are those with a value for any of the
+    categories, so the cost of a query is proportional to the categories
+    requested rather than to the samples in the database.
     """
-    import json
-    from collections import defaultdict
     import pandas as pd
     import redbiom
     import redbiom._requests
@@ -679,34 +961,7 @@ def metadata(where=None, tag=None, restrict_to=None):
         else:
             categories = set(restrict_to)
 
-    samples = set(get('metadata', 'SMEMBERS', 'samples-represented'))
-    if tag is None:
-        samples = {s for s in samples if '_' not in s}
-    else:
-        samples = {s for s in samples if s.startswith('%s_' % tag)}
-
-    getter = redbiom._requests.buffered(samples, 'categories',
-                                        'MGET', 'metadata', get=get,
-                                        buffer_size=200)
-
-    samples_to_get = []
-    for chunk in getter:
-        for sample, column_set in zip(*chunk):
-            if sample in samples:
-                # only keep the sample if it has a category of interest
-                if column_set is not None:
-                    column_set = set(json.loads(column_set))
-                    if column_set.intersection(categories):
-                        samples_to_get.append(sample)
-
-    metadata = defaultdict(dict)
-    for sample in samples_to_get:
-        metadata[sample]['#SampleID'] = sample
-
-    for category in categories:
-        for sample, value in get_sample_values(samples_to_get, category, get):
-            metadata[sample][category] = value
-
+    metadata = _category_values(categories, tag, get)
     md = pd.DataFrame(metadata).T
 
     if len(md.columns) == 0:
@@ -716,6 +971,48 @@ def metadata(where=None, tag=None, restrict_to=None):
         return md.ids(where=where)
 
 
+def _category_values(categories, tag, get):
+    """Obtain the values of the samples with any of the categories
+
+    Parameters
+    ----------
+    categories : iterable of str
+        The categories of interest
+    tag : str or None
+        If None, only untagged samples are considered. Otherwise, only the
+        samples of the tag are.
+    get : function
+        A get method
+
+    Returns
+    -------
+    dict
+        {sample: {'#SampleID': sample, category: value, ...}}
+
+    Redis command summary
+    ---------------------
+    HGETALL metadata:category:<column>
+    """
+    from collections import defaultdict
+
+    if tag is None:
+        keep = lambda s: '_' not in s
+    else:
+        prefix = '%s_' % tag
+        keep = lambda s: s.startswith(prefix)
+
+    # each category is stored as a hash of only the samples with a value
+    metadata = defaultdict(dict)
+    for category in categories:
+        values = get('metadata', 'HGETALL', 'category:%s' % category)
+        for sample, value in values.items():
+            if keep(sample):
+                metadata[sample]['#SampleID'] = sample
+                metadata[sample][category] = value
+
+    return dict(metadata)
+
+
 def get_sample_values(samples, category, get=None):
     """Obtain the metadata values associated with the requested samples
 
@@ -751,7 +1048,6 @@ def get_sample_values(samples, category, get=None):
     getter = redbiom._requests.buffered(iter(samples), None,
                                         'HMGET',
                                         'metadata', get=get,
-                                        buffer_size=200,
                                         multikey=key)
 
     return [item for chunk in getter for item in zip(*chunk)]
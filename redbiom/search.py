@@ -22,14 +22,10 @@ def metadata_full(query, categories=False, get=None):
     set
         The observed sample IDs
     """
-    from os.path import join, dirname
     import redbiom
     import redbiom.set_expr
     import redbiom.where_expr
     import redbiom._requests
-    import redbiom.util
-    import functools
-    import nltk
 
     if get is None:
         config = redbiom.get_config()
@@ -40,12 +36,7 @@ def metadata_full(query, categories=False, get=None):
     else:
         target = 'text-search'
 
-    stemmer = nltk.PorterStemmer(nltk.PorterStemmer.MARTIN_EXTENSIONS)
-    nltk_data_path = join(dirname(__file__), 'assets', 'nltk_data')
-    if nltk.data.path[0] != nltk_data_path:
-        nltk.data.path = [nltk_data_path] + nltk.data.path
-    stops = frozenset(nltk.corpus.stopwords.words('english'))
-    stem_f = functools.partial(redbiom.util.stems, stops, stemmer)
+    stem_f = _stemmer()
 
     samples = set()
     for plan_type, q in query_plan(query):
@@ -57,7 +48,7 @@ def metadata_full(query, categories=False, get=None):
             if categories:
                 raise ValueError("where clauses not allowed with a category "
                                  "search")
-            obs = set(redbiom.where_expr.whereeval(q, get=get).index)
+            obs = redbiom.where_expr.where_ids(q, get=get)
             if samples:
                 samples &= obs
             else:
@@ -66,6 +57,21 @@ def metadata_full(query, categories=False, get=None):
     return samples
 
 
+def _stemmer():
+    """Construct the stemmer used for search terms"""
+    from os.path import join, dirname
+    import functools
+    import nltk
+    import redbiom.util
+
+    stemmer = nltk.PorterStemmer(nltk.PorterStemmer.MARTIN_EXTENSIONS)
+    nltk_data_path = join(dirname(__file__), 'assets', 'nltk_data')
+    if nltk.data.path[0] != nltk_data_path:
+        nltk.data.path = [nltk_data_path] + nltk.data.path
+    stops = frozenset(nltk.corpus.stopwords.words('english'))
+    return functools.partial(redbiom.util.stems, stops, stemmer)
+
+
 def query_plan(query):
     """Light sanity checking and query partitioning
 
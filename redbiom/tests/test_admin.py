@@ -1,8 +1,10 @@
 import unittest
 import hashlib
 import datetime
+import json
 
 import skbio
+import numpy as np
 import pandas as pd
 import biom
 import requests
@@ -11,6 +13,7 @@ import redbiom
 import redbiom.admin
 import redbiom._requests
 import redbiom.fetch
+import redbiom.util
 from redbiom.tests import assert_test_env
 
 assert_test_env()
@@ -174,6 +177,129 @@ class AdminTests(unittest.TestCase):
         obs = self.get(context, 'SMEMBERS', 'samples-represented')
         self.assertEqual(set(obs), exp)
 
+    def test_fetch_indexed(self):
+        context = 'fetch-indexed-test'
+        redbiom.admin.create_context(context, 'foo')
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.load_sample_data(table, context, tag=None)
+
+        fetch_sample = redbiom.admin.ScriptManager.get('fetch-sample')
+        fetch_indexed = redbiom.admin.ScriptManager.get('fetch-indexed')
+        ids = ['UNTAGGED_%s' % i for i in table.ids()]
+        obs = self.se(fetch_indexed, 0, context, 'sample', *ids)
+        self.assertEqual(set(obs), set(ids))
+        for id_ in ids:
+            exp = self.se(fetch_sample, 0, context, id_)
+            indices = obs[id_][::2]
+            names = self.get(context, 'HMGET',
+                             'feature-index-inverted/%s' %
+                             '/'.join([str(i) for i in indices]))
+            self.assertEqual(dict(zip(names, obs[id_][1::2])), exp)
+
+        obs = self.se(fetch_indexed, 0, context, 'sample', 'doesnotexist')
+        self.assertFalse(obs['doesnotexist'])
+
+    def test_ids_from(self):
+        context = 'ids-from-test'
+        redbiom.admin.create_context(context, 'foo')
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.load_sample_data(table, context, tag=None)
+
+        fetch_feature = redbiom.admin.ScriptManager.get('fetch-feature')
+        ids_from = redbiom.admin.ScriptManager.get('ids-from')
+        features = list(table.ids(axis='observation')[:3])
+        per_feature = [self.se(fetch_feature, 0, context, f)
+                       for f in features]
+
+        for min_count in (1, 5):
+            kept = [{k for k, v in f.items() if v >= min_count}
+                    for f in per_feature]
+            exp = set.intersection(*kept)
+            obs = self.se(ids_from, 0, context, 'feature', 1, min_count,
+                          *features)
+            self.assertEqual(set(obs or []), exp)
+            self.assertEqual(len(obs or []), len(exp))
+
+            exp = set.union(*kept)
+            obs = self.se(ids_from, 0, context, 'feature', 0, min_count,
+                          *features)
+            self.assertEqual(set(obs or []), exp)
+            self.assertEqual(len(obs or []), len(exp))
+
+        obs = self.se(ids_from, 0, context, 'feature', 1, 1, 'doesnotexist')
+        self.assertFalse(obs)
+
+        obs = self.se(ids_from, 0, context, 'feature', 1, 1,
+                      features[0], 'doesnotexist')
+        self.assertFalse(obs)
+
+    def test_ids_from_exact_probe(self):
+        # a feature present in many samples, such that the candidates are
+        # probed for over multiple ranges of its list, and a rare feature
+        context = 'ids-from-probe'
+        n_samples = 12000
+        rare = {'5': '1', '6001': '3', '11999': '2'}
+
+        def rpush_pairs(command, key, pairs):
+            for chunk in redbiom._requests.batch_by_size(pairs, 32768,
+                                                         key='/'.join):
+                self.post(context, command,
+                          '/'.join([key] + ['/'.join(p) for p in chunk]))
+
+        rpush_pairs('RPUSH', 'feature:common',
+                    [(str(i), '1' if i == 6001 else '2')
+                     for i in range(n_samples)])
+        rpush_pairs('RPUSH', 'feature:rare', list(rare.items()))
+        rpush_pairs('HSET', 'sample-index-inverted',
+                    [(str(i), 'sample%d' % i) for i in range(n_samples)])
+
+        ids_from = redbiom.admin.ScriptManager.get('ids-from')
+        for order in (['common', 'rare'], ['rare', 'common']):
+            obs = self.se(ids_from, 0, context, 'feature', 1, 1, *order)
+            self.assertEqual(set(obs), {'sample5', 'sample6001',
+                                        'sample11999'})
+
+            obs = self.se(ids_from, 0, context, 'feature', 1, 2, *order)
+            self.assertEqual(set(obs), {'sample11999'})
+
+            obs = self.se(ids_from, 0, context, 'feature', 0, 1, *order)
+            self.assertEqual(len(obs), n_samples)
+
+        obs = self.se(ids_from, 0, context, 'feature', 1, 1, 'common',
+                      'rare', 'doesnotexist')
+        self.assertFalse(obs)
+
+    def test_axis_packer(self):
+        samples = table.ids()
+        obs = table.ids(axis='observation')
+        obs_index = {o: 100 + i for i, o in enumerate(obs[::-1])}
+        samp_index = {s: 7 * i for i, s in enumerate(samples)}
+
+        for axis, ids, opposite, index in (('sample', samples, obs,
+                                            obs_index),
+                                           ('observation', obs, samples,
+                                            samp_index)):
+            packer = redbiom.admin._axis_packer(table, opposite, index, axis)
+            for id_ in ids:
+                values = table.data(id_, axis=axis, dense=False)
+                values.sort_indices()
+                exp = '|'.join(['%d|%d' % (v, index[i]) for i, v in
+                                zip(opposite[values.indices],
+                                    values.data.astype(int))])
+                self.assertEqual(packer(id_), exp)
+
+    def test_axis_packer_not_counts(self):
+        t = biom.Table(np.array([[0, 1.25], [2, 0]]), ['a', 'b'], ['x', 'y'])
+        with self.assertRaisesRegex(ValueError, 'counts'):
+            redbiom.admin._axis_packer(t, t.ids(axis='observation'),
+                                       {'a': 0, 'b': 1}, 'sample')
+
+        t = biom.Table(np.array([[0, 1.0], [2, 0]]), ['a', 'b'], ['x', 'y'])
+        packer = redbiom.admin._axis_packer(t, t.ids(axis='observation'),
+                                            {'a': 5, 'b': 6}, 'sample')
+        self.assertEqual(packer('x'), '2|6')
+        self.assertEqual(packer('y'), '1|5')
+
     def test_load_sample_data_empty(self):
         context = 'load-data-empty'
         redbiom.admin.create_context(context, 'foo')
@@ -229,6 +355,268 @@ class AdminTests(unittest.TestCase):
             id_ = 'UNTAGGED_%s' % id_
             self.assertTrue(self.get(context, 'EXISTS', 'sample:%s' % id_))
 
+    def test_index_ambiguities(self):
+        context = 'index-ambiguities'
+        redbiom.admin.create_context(context, 'foo')
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.load_sample_data(table, context, tag=None)
+        redbiom.admin.load_sample_data(table, context, tag='other')
+
+        index = self.get(context, 'HGETALL', 'ambiguity-index')
+        self.assertEqual(set(index), set(table.ids()))
+        for id_, tagged in index.items():
+            self.assertEqual(sorted(json.loads(tagged)),
+                             ['UNTAGGED_%s' % id_, 'other_%s' % id_])
+        self.assertEqual(self.get(context, 'GET', 'ambiguity-index-size'),
+                         '20')
+
+        # indexing is idempotent
+        self.assertEqual(redbiom.admin.index_ambiguities(context), 0)
+        self.assertEqual(self.get(context, 'GET', 'ambiguity-index-size'),
+                         '20')
+
+        ambiguities = redbiom.admin.ScriptManager.get('ambiguities')
+        id_ = table.ids()[0]
+        obs = self.se(ambiguities, 0, context, id_, 'doesnotexist')
+        self.assertEqual(list(obs), [id_])
+        self.assertEqual(sorted(obs[id_]), ['UNTAGGED_%s' % id_,
+                                            'other_%s' % id_])
+
+        # the index is not used if it does not describe the context
+        self.post(context, 'DEL', 'ambiguity-index')
+        self.post(context, 'DEL', 'ambiguity-index-size')
+        self.assertIs(self.se(ambiguities, 0, context, id_), False)
+
+        # and is rebuilt on a subsequent load
+        redbiom.admin.load_sample_metadata(metadata_with_alt)
+        redbiom.admin.load_sample_data(table_with_alt, context, tag=None)
+        self.assertEqual(sorted(self.se(ambiguities, 0, context, id_)[id_]),
+                         ['UNTAGGED_%s' % id_, 'other_%s' % id_])
+        self.assertEqual(self.get(context, 'GET', 'ambiguity-index-size'),
+                         str(self.get(context, 'SCARD',
+                                      'samples-represented')))
+
+    def _assert_contexts_equal(self, exp_context, obs_context):
+        samples = ['UNTAGGED_%s' % i for i in table.ids()]
+        features = list(table.ids(axis='observation'))
+        for key, ids in (('sample', samples), ('feature', features)):
+            for id_ in ids:
+                exp = self.get(exp_context, 'LRANGE',
+                               '%s:%s/0/-1' % (key, id_))
+                obs = self.get(obs_context, 'LRANGE',
+                               '%s:%s/0/-1' % (key, id_))
+                self.assertEqual(obs, exp)
+                self.assertTrue(obs)
+
+            name = '%ss-represented' % key
+            exp = self.get(exp_context, 'SMEMBERS', name)
+            obs = self.get(obs_context, 'SMEMBERS', name)
+            self.assertEqual(sorted(obs), sorted(exp))
+            self.assertEqual(sorted(obs), sorted(ids))
+
+            for name in ('%s-index' % key, '%s-index-inverted' % key):
+                exp = self.get(exp_context, 'HGETALL', name)
+                obs = self.get(obs_context, 'HGETALL', name)
+                self.assertEqual(obs, exp)
+
+    def test_load_sample_data_workers(self):
+        redbiom.admin.load_sample_metadata(metadata)
+        for workers in (1, 4):
+            context = 'load-sample-data-%d' % workers
+            redbiom.admin.create_context(context, 'foo')
+            n = redbiom.admin.load_sample_data(table, context, tag=None,
+                                               workers=workers)
+            self.assertEqual(n, 10)
+
+        self._assert_contexts_equal('load-sample-data-1',
+                                    'load-sample-data-4')
+
+    def _replay_mass_insertion(self, path):
+        import gzip
+        from urllib.parse import quote_plus
+
+        with gzip.open(path, 'rb') as fp:
+            data = fp.read()
+
+        config = redbiom.get_config()
+        post = redbiom._requests.make_post(config)
+        put = redbiom._requests.make_put(config)
+
+        position = 0
+        n = 0
+        while position < len(data):
+            end = data.index(b'\r\n', position)
+            self.assertEqual(data[position:position + 1], b'*')
+            nargs = int(data[position + 1:end])
+            position = end + 2
+
+            args = []
+            for _ in range(nargs):
+                end = data.index(b'\r\n', position)
+                size = int(data[position + 1:end])
+                position = end + 2
+                args.append(data[position:position + size].decode('utf-8'))
+                position += size + 2
+
+            if args[0] == 'SCRIPT':
+                put(None, 'SCRIPT', 'LOAD', args[2])
+            else:
+                post(None, args[0], '/'.join([quote_plus(a)
+                                              for a in args[1:]]))
+            n += 1
+        return n
+
+    def test_write_sample_data(self):
+        import os
+        import tempfile
+
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.create_context('load-sample-data', 'foo')
+        redbiom.admin.create_context('mass-insertion', 'foo')
+        redbiom.admin.load_sample_data(table, 'load-sample-data', tag=None)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'load.resp.gz')
+            n = redbiom.admin.load_sample_data(table, 'mass-insertion',
+                                               tag=None, redis_protocol=True,
+                                               output=path, offline=True)
+            self.assertEqual(n, 10)
+
+            # nothing is loaded until the commands are
+            self.assertEqual(self.get('mass-insertion', 'SCARD',
+                                      'samples-represented'), 0)
+            self.assertTrue(self._replay_mass_insertion(path) > 0)
+
+        self._assert_contexts_equal('load-sample-data', 'mass-insertion')
+        for name in ('ambiguity-index', 'taxonomy-parents'):
+            exp = self.get('load-sample-data', 'HGETALL', name)
+            obs = self.get('mass-insertion', 'HGETALL', name)
+            self.assertEqual(obs, exp)
+        self.assertEqual(self.get('mass-insertion', 'SMEMBERS',
+                                  'taxonomy-children:k__Bacteria'),
+                         self.get('load-sample-data', 'SMEMBERS',
+                                  'taxonomy-children:k__Bacteria'))
+        self.assertTrue(redbiom.admin._ambiguity_index_complete(
+            'mass-insertion', redbiom._requests.make_get(
+                redbiom.get_config())))
+
+    def test_write_sample_data_into_loaded_context(self):
+        import os
+        import tempfile
+
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.ScriptManager.load_scripts(read_only=False)
+        redbiom.admin.create_context('load-sample-data', 'foo')
+        redbiom.admin.create_context('mass-insertion', 'foo')
+
+        # the contexts already contain some of the samples, and features
+        first = table.filter(table.ids()[:4], inplace=False)
+        for context in ('load-sample-data', 'mass-insertion'):
+            redbiom.admin.load_sample_data(first, context, tag=None)
+
+        redbiom.admin.load_sample_data(table, 'load-sample-data', tag=None)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'load.resp.gz')
+            n = redbiom.admin.load_sample_data(table, 'mass-insertion',
+                                               tag=None, redis_protocol=True,
+                                               output=path)
+            self.assertEqual(n, 6)
+            self._replay_mass_insertion(path)
+
+        self._assert_contexts_equal('load-sample-data', 'mass-insertion')
+        exp = self.get('load-sample-data', 'HGETALL', 'ambiguity-index')
+        obs = self.get('mass-insertion', 'HGETALL', 'ambiguity-index')
+        self.assertEqual(obs, exp)
+
+        # samples already loaded are not written again
+        with self.assertRaises(redbiom.admin.AlreadyLoaded):
+            redbiom.admin.load_sample_data(table, 'mass-insertion',
+                                           tag=None, redis_protocol=True,
+                                           output=os.devnull)
+
+        with self.assertRaisesRegex(ValueError, "cannot be resumed"):
+            redbiom.admin.load_sample_data(table, 'mass-insertion',
+                                           tag=None, redis_protocol=True,
+                                           output=os.devnull, resume=True)
+        with self.assertRaisesRegex(ValueError, "cannot be resumed"):
+            redbiom.admin.load_sample_data(table, 'mass-insertion',
+                                           tag=None, redis_protocol=True,
+                                           output=os.devnull, resume=True,
+                                           offline=True)
+        with self.assertRaisesRegex(ValueError, "requires redis_protocol"):
+            redbiom.admin.load_sample_data(table, 'mass-insertion',
+                                           tag=None, offline=True)
+
+    def test_load_sample_data_resume(self):
+        from unittest import mock
+
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.create_context('load-sample-data', 'foo')
+        redbiom.admin.create_context('resumed', 'foo')
+        redbiom.admin.load_sample_data(table, 'load-sample-data', tag=None)
+
+        with self.assertRaisesRegex(ValueError, "no load to resume"):
+            redbiom.admin.load_sample_data(table, 'resumed', tag=None,
+                                           resume=True)
+
+        # interrupt the load after the first batch of features
+        axis_batches = redbiom.admin._axis_batches
+
+        def interrupted(*args, **kwargs):
+            for i, batch in enumerate(axis_batches(*args, **kwargs)):
+                if args[4] == 'feature' and i == 1:
+                    raise IOError("interrupted")
+                yield batch
+
+        with mock.patch.object(redbiom.admin, '_axis_batches', interrupted):
+            with self.assertRaisesRegex(IOError, "interrupted"):
+                redbiom.admin.load_sample_data(table, 'resumed', tag=None,
+                                               workers=1)
+
+        journal = set(self.get('resumed', 'HKEYS', 'load-journal'))
+        self.assertEqual(journal, {'samples', 'sample:0', 'feature:0'})
+
+        with self.assertRaisesRegex(ValueError, "must be resumed"):
+            redbiom.admin.load_sample_data(table, 'resumed', tag=None)
+
+        with self.assertRaisesRegex(ValueError, "does not contain"):
+            redbiom.admin.load_sample_data(table, 'resumed', tag='other',
+                                           resume=True)
+
+        n = redbiom.admin.load_sample_data(table, 'resumed', tag=None,
+                                           resume=True)
+        self.assertEqual(n, 10)
+        self.assertEqual(self.get('resumed', 'EXISTS', 'load-journal'), 0)
+        self.assertEqual(self.get('load-sample-data', 'EXISTS',
+                                  'load-journal'), 0)
+
+        self._assert_contexts_equal('load-sample-data', 'resumed')
+
+        with self.assertRaises(redbiom.admin.AlreadyLoaded):
+            redbiom.admin.load_sample_data(table, 'resumed', tag=None)
+
+    def test_load_batches_journaled(self):
+        context = 'load-sample-data'
+        redbiom.admin.create_context(context, 'foo')
+        journal = '%s:load-journal' % context
+        batch = ('sample:0', ['a', 'b'],
+                 ['%s:sample:a' % context, '%s:sample:b' % context],
+                 ['3|0|2|1', '5|1'])
+
+        # a batch noted in the journal is not loaded again
+        for _ in range(2):
+            redbiom.admin._load_batches([batch], context, journal=journal)
+
+        self.assertEqual(self.get(context, 'LRANGE', 'sample:a/0/-1'),
+                         ['1', '2', '0', '3'])
+        self.assertEqual(self.get(context, 'LRANGE', 'sample:b/0/-1'),
+                         ['1', '5'])
+        self.assertEqual(sorted(self.get(context, 'SMEMBERS',
+                                         'samples-represented')),
+                         ['a', 'b'])
+        self.assertEqual(self.get(context, 'HGET', 'load-journal/sample:0'),
+                         '1')
+
     def test_load_sample_data_taxonomy(self):
         context = 'load-sample-data'
         redbiom.admin.create_context(context, 'foo')
@@ -287,6 +675,101 @@ class AdminTests(unittest.TestCase):
         obs = set(self.get('metadata', 'SMEMBERS', 'samples-represented'))
         self.assertEqual(obs, exp)
 
+    def test_load_sample_metadata_categories(self):
+        md = metadata.copy()
+        md['with_nulls'] = ['foo', 'Not applicable', None, np.nan, '',
+                            'a/b', 'missing', 'NaN', 'x.html', 'bar']
+        redbiom.admin.load_sample_metadata(md)
+
+        for idx, row in md.set_index('#SampleID').iterrows():
+            exp = [c for c, v in row.items()
+                   if redbiom.admin._indexable(v, redbiom.util.NULL_VALUES)]
+            obs = json.loads(self.get('metadata', 'GET',
+                                      'categories:%s' % idx))
+            self.assertEqual(obs, exp)
+
+        obs = self.get('metadata:category', 'HGETALL', 'with_nulls')
+        self.assertEqual(sorted(obs.values()),
+                         ['a/b', 'bar', 'foo', 'x.html'])
+
+    def test_index_sample_categories(self):
+        redbiom.admin.load_sample_metadata(metadata)
+        samples = list(metadata['#SampleID'])
+        for sample in samples:
+            exp = json.loads(self.get('metadata', 'GET',
+                                      'categories:%s' % sample))
+            obs = self.get('metadata', 'SMEMBERS',
+                           'categories-set:%s' % sample)
+            self.assertEqual(sorted(obs), sorted(exp + ['']))
+        self.assertEqual(self.get('metadata', 'GET', 'categories-set-size'),
+                         str(len(samples)))
+
+        # indexing is idempotent
+        self.assertEqual(redbiom.admin.index_sample_categories(samples), 0)
+
+        # sets missing from a database are rebuilt on the next load
+        for sample in samples:
+            self.post('metadata', 'DEL', 'categories-set:%s' % sample)
+        self.post('metadata', 'DEL', 'categories-set-size')
+
+        md = pd.DataFrame([['new-sample', 'foo']],
+                          columns=['#SampleID', 'new_column'])
+        redbiom.admin.load_sample_metadata(md)
+        self.assertEqual(self.get('metadata', 'GET', 'categories-set-size'),
+                         str(len(samples) + 1))
+        self.assertEqual(sorted(self.get('metadata', 'SMEMBERS',
+                                         'categories-set:new-sample')),
+                         ['', 'new_column'])
+
+    def test_index_numeric_category(self):
+        def scored(category):
+            members = self.get('metadata', 'ZRANGEBYSCORE',
+                               'numeric:%s/-inf/+inf' % category)
+            return {m: float(self.get('metadata', 'ZSCORE',
+                                      'numeric:%s/%s' % (category, m)))
+                    for m in members}
+
+        redbiom.admin.load_sample_metadata(metadata, numeric=['AGE_YEARS'])
+        values = pd.to_numeric(metadata.set_index('#SampleID')['AGE_YEARS'],
+                               errors='coerce').dropna()
+        self.assertTrue(len(values) > 0)
+        self.assertEqual(scored('AGE_YEARS'), values.to_dict())
+        self.assertEqual(self.get('metadata', 'SMEMBERS',
+                                  'numeric-represented'), ['AGE_YEARS'])
+
+        # indexed categories are maintained as samples are added
+        md = pd.DataFrame([['new-a', ' 7 ', '1'], ['new-b', 'foo', '2']],
+                          columns=['#SampleID', 'AGE_YEARS', 'BMI'])
+        redbiom.admin.load_sample_metadata(md)
+        exp = dict(values.to_dict(), **{'new-a': 7.0})
+        self.assertEqual(scored('AGE_YEARS'), exp)
+        self.assertEqual(scored('BMI'), {})
+
+        # a category can be indexed after its samples are loaded
+        redbiom.admin.load_sample_metadata(md, numeric=['BMI'])
+        self.assertIn('new-b', scored('BMI'))
+        self.assertEqual(sorted(self.get('metadata', 'SMEMBERS',
+                                         'numeric-represented')),
+                         ['AGE_YEARS', 'BMI'])
+
+        # indexing is idempotent
+        n = redbiom.admin.index_numeric_category('AGE_YEARS')
+        self.assertEqual(n, len(exp))
+        self.assertEqual(scored('AGE_YEARS'), exp)
+
+        with self.assertRaisesRegex(ValueError, "not a category"):
+            redbiom.admin.index_numeric_category('missing')
+        with self.assertRaisesRegex(ValueError, "not a category"):
+            redbiom.admin.load_sample_metadata(md, numeric=['missing'])
+
+    def test_indexable_mask(self):
+        md = pd.DataFrame([['a', None, 'NA'], [np.nan, 'b', '']],
+                          columns=['x', 'y', 'z'])
+        obs = redbiom.admin._indexable_mask(md, redbiom.util.NULL_VALUES)
+        exp = pd.DataFrame([[True, False, False], [False, True, False]],
+                           columns=['x', 'y', 'z'])
+        pd.testing.assert_frame_equal(obs, exp)
+
     def test_load_sample_metadata_encoded(self):
         md = metadata.copy()
         md['http_quoted_characters'] = ['foo', 'bar', 'foo/bar', 'baz$12',
@@ -0,0 +1,204 @@
+import asyncio
+import unittest
+
+import biom
+import pandas as pd
+import requests
+
+import redbiom
+import redbiom.admin
+import redbiom.aio
+import redbiom.fetch
+import redbiom.search
+import redbiom.util
+import redbiom._requests
+from redbiom.tests import assert_test_env
+
+assert_test_env()
+
+try:
+    import aiohttp  # noqa
+except ImportError:
+    aiohttp = None
+
+
+table = biom.load_table('test.biom')
+metadata = pd.read_csv('test.txt', sep='\t', dtype=str, na_values=[],
+                       keep_default_na=False)
+
+
+def run(coro):
+    async def f():
+        try:
+            return await coro
+        finally:
+            await redbiom.aio.close_session()
+    return asyncio.run(f())
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not available")
+class AIOTests(unittest.TestCase):
+    def setUp(self):
+        self.config = redbiom.get_config()
+        host = self.config['hostname']
+        req = requests.get(host + '/FLUSHALL')
+        assert req.status_code == 200
+        redbiom.admin.ScriptManager.load_scripts(read_only=False)
+
+    def test_get_post(self):
+        async def f():
+            get = redbiom.aio.make_get(self.config)
+            post = redbiom.aio.make_post(self.config)
+            await post('test', 'SET', 'foo/bar')
+            return await get('test', 'GET', 'foo')
+
+        self.assertEqual(run(f()), 'bar')
+
+    def test_buffered(self):
+        exp_items = [str(i) for i in range(25)]
+
+        async def f():
+            post = redbiom.aio.make_post(self.config)
+            for i in exp_items:
+                await post('test', 'SET', 'foo:%s/%s' % (i, i))
+
+            obs = []
+            async for items, values in redbiom.aio.buffered(iter(exp_items),
+                                                            'foo', 'MGET',
+                                                            'test',
+                                                            buffer_size=10):
+                self.assertEqual(items, values)
+                obs.extend(items)
+            return obs
+
+        self.assertEqual(run(f()), exp_items)
+
+    def test_buffered_in_flight(self):
+        exp_items = [str(i) for i in range(25)]
+        counts = {'current': 0, 'max': 0}
+
+        async def get(context, cmd, bulk):
+            counts['current'] += 1
+            counts['max'] = max(counts['max'], counts['current'])
+            await asyncio.sleep(0.01)
+            counts['current'] -= 1
+            return [k.split(':')[-1] for k in bulk.split('/')]
+
+        async def f():
+            obs = []
+            async for items, values in redbiom.aio.buffered(iter(exp_items),
+                                                            'foo', 'MGET',
+                                                            'test', get=get,
+                                                            buffer_size=2,
+                                                            in_flight=3):
+                self.assertEqual(items, values)
+                obs.extend(items)
+            return obs
+
+        self.assertEqual(run(f()), exp_items)
+        self.assertEqual(counts['max'], 3)
+
+    def test_script_exec(self):
+        redbiom.admin.create_context('test', 'a nice test')
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.load_sample_data(table, 'test', tag=None)
+
+        sample = 'UNTAGGED_%s' % table.ids()[0]
+        exp = dict(zip(table.ids(axis='observation'),
+                       table.data(table.ids()[0], dense=True)))
+        exp = {k: v for k, v in exp.items() if v > 0}
+
+        async def f():
+            se = redbiom.aio.make_script_exec(self.config)
+            sha = await redbiom.aio.script_sha('fetch-sample')
+            return await se(sha, 0, 'test', sample)
+
+        self.assertEqual(run(f()), exp)
+
+    def test_valid(self):
+        redbiom.admin.create_context('test', 'a nice test')
+        run(redbiom.aio.valid('test'))
+        with self.assertRaises(ValueError):
+            run(redbiom.aio.valid('not-a-context'))
+
+    def test_ids_from(self):
+        redbiom.admin.create_context('test', 'a nice test')
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.load_sample_data(table, 'test', tag=None)
+
+        ids = list(table.ids(axis='observation')[:10])
+        for exact in (True, False):
+            for min_count in (1, 5):
+                exp = redbiom.util.ids_from(iter(ids), exact, 'feature',
+                                            ['test'], min_count)
+                obs = run(redbiom.aio.ids_from(iter(ids), exact, 'feature',
+                                               ['test'], min_count))
+                self.assertEqual(obs, exp)
+
+    def test_data_from_samples(self):
+        redbiom.admin.create_context('test', 'a nice test')
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.load_sample_data(table, 'test', tag=None)
+
+        samples = list(table.ids()) + ['doesnotexist']
+        exp, exp_map = redbiom.fetch.data_from_samples('test', samples)
+        obs, obs_map = run(redbiom.aio.data_from_samples('test', samples))
+        self.assertEqual(obs, exp)
+        self.assertEqual(obs_map, exp_map)
+
+        exp, exp_map = redbiom.fetch.data_from_samples('test', samples,
+                                                       skip_taxonomy=True)
+        obs, obs_map = run(redbiom.aio.data_from_samples('test', samples,
+                                                         skip_taxonomy=True))
+        self.assertEqual(obs, exp)
+        self.assertEqual(obs_map, exp_map)
+
+    def test_resolve_ambiguities(self):
+        redbiom.admin.create_context('test', 'a nice test')
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.load_sample_data(table, 'test', tag=None)
+        redbiom.admin.load_sample_data(table, 'test', tag='other')
+
+        get = redbiom._requests.make_get(self.config)
+        samples = [table.ids()[0], 'other_%s' % table.ids()[1], 'foo']
+        exp = redbiom.util.resolve_ambiguities('test', samples, get)
+        obs = run(redbiom.aio.resolve_ambiguities('test', samples))
+        self.assertEqual(obs[0], exp[0])
+        self.assertEqual(obs[1], exp[1])
+        self.assertEqual({k: sorted(v) for k, v in obs[2].items()},
+                         {k: sorted(v) for k, v in exp[2].items()})
+        self.assertEqual(obs[3], exp[3])
+
+        # without a usable ambiguity index
+        post = redbiom._requests.make_post(self.config)
+        post('test', 'DEL', 'ambiguity-index-size')
+        obs = run(redbiom.aio.resolve_ambiguities('test', samples))
+        self.assertEqual(obs[0], exp[0])
+        self.assertEqual(obs[3], exp[3])
+
+    def test_metadata_full(self):
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.load_sample_metadata_full_search(metadata)
+
+        tests = ['antibiotics', 'ab',
+                 'antibiotics where AGE_CAT in ("20s","30s")',
+                 'antibiotics where AGE_CAT != "40s" and AGE_YEARS > 40',
+                 '(antibiotics | NY) - MA',
+                 'where AGE_CAT != "40s"',
+                 'antibiotics where (AGE_YEARS > 3) != 5']
+        for test in tests:
+            exp = redbiom.search.metadata_full(test)
+            obs = run(redbiom.aio.metadata_full(test))
+            self.assertEqual(obs, exp)
+
+        exp = redbiom.search.metadata_full('antibiotics', categories=True)
+        obs = run(redbiom.aio.metadata_full('antibiotics', categories=True))
+        self.assertEqual(obs, exp)
+
+        with self.assertRaises(ValueError):
+            run(redbiom.aio.metadata_full('antibiotics where AGE_YEARS > 4',
+                                          categories=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+import os
+import unittest
+from unittest import mock
+
+import pandas as pd
+import requests
+
+import redbiom
+import redbiom.admin
+import redbiom.cache
+import redbiom.fetch
+import redbiom.util
+import redbiom._requests
+from redbiom.cache import LRUCache, lookup
+from redbiom.tests import assert_test_env
+
+assert_test_env()
+
+metadata = pd.read_csv('test.txt', sep='\t', dtype=str)
+
+
+class LRUCacheTests(unittest.TestCase):
+    def test_get_set(self):
+        cache = LRUCache(maxsize=2)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache['a'], 1)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        with self.assertRaises(KeyError):
+            cache['b']
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache.get('a')
+        cache['c'] = 3
+        self.assertEqual(len(cache), 2)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+
+    def test_ttl(self):
+        cache = LRUCache(ttl=0)
+        cache['a'] = 1
+        self.assertNotIn('a', cache)
+
+        cache.set('b', 2, ttl=60)
+        self.assertIn('b', cache)
+
+        with mock.patch('time.monotonic', return_value=1e12):
+            self.assertNotIn('b', cache)
+        self.assertEqual(len(cache), 0)
+
+    def test_pop_clear(self):
+        cache = LRUCache()
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertIsNone(cache.pop('a'))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+class LookupTests(unittest.TestCase):
+    def setUp(self):
+        redbiom.cache.clear()
+        self.calls = []
+
+    def f(self, *key):
+        def compute():
+            self.calls.append(key)
+            if key[0] == 'fail':
+                raise ValueError()
+            return [key[0]]
+        return lookup('test-lookup', key, compute)
+
+    def test_lookup(self):
+        before = redbiom.cache.stats().get('test-lookup',
+                                           {'hits': 0, 'misses': 0})
+        self.assertEqual(self.f('x'), ['x'])
+        self.assertEqual(self.f('x'), ['x'])
+        self.assertEqual(self.f('x', 1), ['x'])
+        self.assertEqual(self.f('x', 1), ['x'])
+        self.assertEqual(self.calls, [('x', ), ('x', 1)])
+
+        after = redbiom.cache.stats()['test-lookup']
+        self.assertEqual(after['hits'] - before['hits'], 2)
+        self.assertEqual(after['misses'] - before['misses'], 2)
+
+    def test_lookup_copies(self):
+        self.f('x').append('y')
+        self.assertEqual(self.f('x'), ['x'])
+
+    def test_lookup_exceptions(self):
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                self.f('fail')
+        self.assertEqual(len(self.calls), 2)
+
+    def test_lookup_disabled(self):
+        with mock.patch.dict(os.environ, {'REDBIOM_CACHE_TTL': '0'}):
+            self.f('x')
+            self.f('x')
+        self.assertEqual(len(self.calls), 2)
+
+    def test_lookup_unhashable(self):
+        self.f(['x'])
+        self.f(['x'])
+        self.assertEqual(len(self.calls), 2)
+
+    def test_clear(self):
+        self.f('x')
+        redbiom.cache.clear()
+        self.f('x')
+        self.assertEqual(len(self.calls), 2)
+
+
+class CachedLookupTests(unittest.TestCase):
+    def setUp(self):
+        host = redbiom.get_config()['hostname']
+        req = requests.get(host + '/FLUSHALL')
+        assert req.status_code == 200
+        redbiom.cache.clear()
+
+        get = redbiom._requests.make_get(redbiom.get_config())
+        self.commands = []
+
+        def recording_get(context, cmd, data):
+            self.commands.append(cmd)
+            return get(context, cmd, data)
+
+        self.get = recording_get
+
+    def test_valid(self):
+        with self.assertRaises(ValueError):
+            redbiom._requests.valid('test', self.get)
+
+        redbiom.admin.create_context('test', 'foo')
+        for _ in range(3):
+            redbiom._requests.valid('test', self.get)
+        self.assertEqual(self.commands, ['HEXISTS', 'HEXISTS'])
+
+    def test_category_exists(self):
+        redbiom.admin.load_sample_metadata(metadata)
+        for _ in range(3):
+            self.assertTrue(redbiom.util.category_exists('AGE_YEARS',
+                                                         self.get))
+        self.assertEqual(self.commands, ['SISMEMBER'])
+
+    def test_samples_in_context(self):
+        redbiom.admin.create_context('test', 'foo')
+        self.assertEqual(redbiom.fetch.samples_in_context('test', True,
+                                                          self.get), set())
+        self.assertEqual(redbiom.fetch.samples_in_context('test', True,
+                                                          self.get), set())
+        self.assertEqual(self.commands, ['HEXISTS', 'SMEMBERS'])
+
+        # writes through redbiom.admin discard the cached lookups
+        post = redbiom._requests.make_post(redbiom.get_config())
+        post('test', 'SADD', 'samples-represented/UNTAGGED_foo')
+        self.assertEqual(redbiom.fetch.samples_in_context('test', True,
+                                                          self.get), set())
+        redbiom.admin.create_context('other', 'foo')
+        self.assertEqual(redbiom.fetch.samples_in_context('test', True,
+                                                          self.get),
+                         {'UNTAGGED_foo'})
+
+    def test_script_manager(self):
+        redbiom.admin.ScriptManager.load_scripts(read_only=False)
+        redbiom.admin.ScriptManager.get('fetch-feature')
+        before = redbiom.cache.stats()['scripts']['hits']
+        redbiom.admin.ScriptManager.get('fetch-feature')
+        self.assertEqual(redbiom.cache.stats()['scripts']['hits'],
+                         before + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
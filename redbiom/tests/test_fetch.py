@@ -8,11 +8,13 @@ import pandas as pd
 import pandas.testing as pdt
 
 import redbiom.admin
+import redbiom._requests
 import redbiom.fetch
 from redbiom.fetch import (_biom_from_samples, sample_metadata,
                            samples_in_context, features_in_context,
                            sample_counts_per_category, get_sample_values,
-                           _ambiguity_keep_most_reads, _ambiguity_merge)
+                           _ambiguity_keep_most_reads, _ambiguity_merge,
+                           feature_ids_from_indices)
 
 from redbiom.tests import assert_test_env
 
@@ -123,6 +125,42 @@ class FetchTests(unittest.TestCase):
         self.assertEqual(obs, exp)
         self.assertEqual(obs_map, exp_map)
 
+    def test_biom_from_samples_workers(self):
+        redbiom.admin.create_context('test', 'a nice test')
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.load_sample_data(table, 'test', tag=None)
+
+        exp, exp_map = _biom_from_samples('test', table.ids(),
+                                          skip_taxonomy=True, workers=1)
+        obs, obs_map = _biom_from_samples('test', table.ids(),
+                                          skip_taxonomy=True, workers=4)
+        self.assertEqual(obs, exp)
+        self.assertEqual(obs_map, exp_map)
+
+    def test_feature_ids_from_indices(self):
+        redbiom.admin.create_context('test', 'a nice test')
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.load_sample_data(table, 'test', tag=None)
+
+        get = redbiom._requests.make_get(redbiom.get_config())
+        features = list(table.ids(axis='observation')[:5])
+        indices = [int(i) for i in get('test', 'HMGET',
+                                       'feature-index/%s' %
+                                       '/'.join(features))]
+        exp = dict(zip(indices, features))
+        obs = feature_ids_from_indices('test', indices)
+        self.assertEqual(obs, exp)
+
+        # cached indices are not requested again
+        cache = {indices[0]: 'cached'}
+        obs = feature_ids_from_indices('test', indices[:2], cache=cache)
+        self.assertEqual(obs, {indices[0]: 'cached',
+                               indices[1]: features[1]})
+        self.assertEqual(cache[indices[1]], features[1])
+
+        with self.assertRaisesRegex(ValueError, "unassociated"):
+            feature_ids_from_indices('test', [100000])
+
     def test_taxon_ancestors(self):
         redbiom.admin.create_context('test', 'a nice test')
         redbiom.admin.load_sample_metadata(metadata)
@@ -211,6 +249,33 @@ class FetchTests(unittest.TestCase):
             sample_metadata(['10317.000047188', '10317.000046868'],
                             context='test')
 
+    def test_category_values(self):
+        tagged_md = pd.DataFrame([[ix, 'abc'] for ix in metadata['#SampleID']],
+                                 columns=['#SampleID', 'AGE_CAT'])
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.load_sample_metadata(tagged_md, 'testtag')
+        get = redbiom._requests.make_get(redbiom.get_config())
+
+        obs = redbiom.fetch._category_values(['AGE_CAT', 'SEX'], None, get)
+        md = metadata.set_index('#SampleID')
+        exp = {}
+        for sample, row in md.iterrows():
+            exp[sample] = {'#SampleID': sample, 'SEX': row['SEX']}
+            if row['AGE_CAT'] not in ('Unspecified', 'Unknown'):
+                exp[sample]['AGE_CAT'] = row['AGE_CAT']
+        self.assertEqual(obs, exp)
+
+        # only samples with a value for a category are obtained
+        obs = redbiom.fetch._category_values(['AGE_CAT'], None, get)
+        self.assertEqual(set(obs), {s for s, v in exp.items()
+                                    if 'AGE_CAT' in v})
+
+        obs = redbiom.fetch._category_values(['AGE_CAT'], 'testtag', get)
+        self.assertEqual(obs, {'testtag_%s' % s: {'#SampleID':
+                                                  'testtag_%s' % s,
+                                                  'AGE_CAT': 'abc'}
+                               for s in md.index})
+
     def test_get_sample_values(self):
         redbiom.admin.create_context('test', 'a nice test')
         redbiom.admin.load_sample_metadata(metadata)
@@ -273,6 +338,27 @@ class FetchTests(unittest.TestCase):
         pdt.assert_series_equal(obs['AGE_YEARS'], exp['AGE_YEARS'])
         pdt.assert_series_equal(obs['SAMPLE_TYPE'], exp['SAMPLE_TYPE'])
 
+    def test_sample_categories(self):
+        redbiom.admin.load_sample_metadata(metadata)
+        get = redbiom._requests.make_get(redbiom.get_config())
+        samples = list(table.ids()) + ['not-a-sample']
+
+        for common in (True, False):
+            exp = redbiom.fetch._sample_categories_json(samples, common, get)
+            obs = redbiom.fetch._sample_categories(samples, common)
+            self.assertEqual(obs, exp)
+            self.assertTrue(obs)
+
+        self.assertEqual(redbiom.fetch._sample_categories(['not-a-sample'],
+                                                          True), set())
+
+        # the sets are not used if they do not describe every sample
+        post = redbiom._requests.make_post(redbiom.get_config())
+        post('metadata', 'DEL', 'categories-set-size')
+        self.assertIsNone(redbiom.fetch._sample_categories(samples, True))
+        obs, _ = sample_metadata(table.ids(), common=True)
+        self.assertIn('BMI', obs.columns)
+
     def test_sample_metadata_have_data(self):
         redbiom.admin.load_sample_metadata(metadata)
         exp = metadata.copy()
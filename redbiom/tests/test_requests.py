@@ -7,7 +7,10 @@ import pandas as pd
 from redbiom import get_config
 import redbiom.admin
 from redbiom._requests import (valid, _parse_validate_request, _format_request,
-                               make_post, make_get, make_put, buffered)
+                               make_post, make_get, make_put, buffered,
+                               batch_by_size, parallel_map, get_session,
+                               _buffered_payloads, _wire_format,
+                               _probe_wire_format, make_script_exec)
 from redbiom.tests import assert_test_env
 
 assert_test_env()
@@ -73,6 +76,68 @@ class RequestsTests(unittest.TestCase):
         self.assertEqual(_format_request(None, '', 'bar'), "/bar.json")
         self.assertEqual(_format_request('baz', 'foo', 'bar'),
                          "foo/baz:bar.json")
+        self.assertEqual(_format_request('baz', 'foo', 'bar',
+                                         fmt='msgpack'),
+                         "foo/baz:bar.msg")
+
+    def test_wire_format(self):
+        for fmt in ('json', 'msgpack'):
+            self.assertEqual(_wire_format(dict(config, wire_format=fmt)), fmt)
+
+        self.assertIn(_wire_format(dict(config, wire_format='auto')),
+                      {'json', 'msgpack'})
+
+        with self.assertRaises(ValueError):
+            _wire_format(dict(config, wire_format='xml'))
+
+    def test_wire_format_probed_lazily(self):
+        from unittest import mock
+        import redbiom._requests
+
+        auto = dict(config, wire_format='auto')
+        with mock.patch.dict(redbiom._requests._wire_formats, clear=True), \
+                mock.patch.object(redbiom._requests, '_probe_wire_format',
+                                  return_value='json') as probe:
+            get = make_get(auto)
+            make_post(auto)
+            make_put(auto)
+            make_script_exec(auto)
+            probe.assert_not_called()
+
+            get('test', 'EXISTS', 'foo')
+            get('test', 'EXISTS', 'foo')
+            probe.assert_called_once_with(config['hostname'])
+
+    def test_msgpack_responses(self):
+        if _probe_wire_format(config['hostname']) != 'msgpack':
+            self.skipTest("The host does not provide msgpack")
+
+        redbiom.admin.create_context('test', 'foo')
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.ScriptManager.load_scripts(read_only=False)
+        redbiom.admin.load_sample_data(table, 'test', tag=None)
+
+        json_config = dict(config, wire_format='json')
+        msgpack_config = dict(config, wire_format='msgpack')
+        for cmd, payload in (('SMEMBERS', 'samples-represented'),
+                             ('HGETALL', 'category:BODY_SITE'),
+                             ('HGET', 'category:BODY_SITE/missing'),
+                             ('EXISTS', 'categories:10317.000033804'),
+                             ('SCARD', 'samples-represented')):
+            exp = make_get(json_config)('metadata', cmd, payload)
+            obs = make_get(msgpack_config)('metadata', cmd, payload)
+            self.assertEqual(obs, exp)
+
+        self.assertEqual(make_post(msgpack_config)('test', 'SET', 'foo/1'),
+                         [True, 'OK'])
+        self.assertEqual(make_put(msgpack_config)('test', 'SET', 'foo', '2'),
+                         [True, 'OK'])
+
+        sha = redbiom.admin.ScriptManager.get('fetch-sample')
+        sample = 'UNTAGGED_10317.000033804'
+        exp = make_script_exec(json_config)(sha, 0, 'test', sample)
+        obs = make_script_exec(msgpack_config)(sha, 0, 'test', sample)
+        self.assertEqual(obs, exp)
 
     def test_make_post(self):
         post = make_post(config)
@@ -132,6 +197,134 @@ class RequestsTests(unittest.TestCase):
         with self.assertRaises(StopIteration):
             next(gen)
 
+    def test_buffered_in_flight(self):
+        redbiom.admin.load_sample_metadata(metadata)
+        samples = list(metadata['#SampleID']) + ['does not exist']
+
+        exp = list(buffered(iter(samples), None, 'HMGET', 'metadata',
+                            buffer_size=3, multikey='category:BODY_SITE',
+                            in_flight=1))
+        self.assertEqual(sum([len(items) for items, _ in exp]), len(samples))
+        for in_flight in (2, 4, 100):
+            obs = list(buffered(iter(samples), None, 'HMGET', 'metadata',
+                                buffer_size=3, multikey='category:BODY_SITE',
+                                in_flight=in_flight))
+            self.assertEqual(obs, exp)
+
+        # the generator can be abandoned early
+        gen = buffered(iter(samples), None, 'HMGET', 'metadata',
+                       buffer_size=3, multikey='category:BODY_SITE',
+                       in_flight=4)
+        self.assertEqual(next(gen), exp[0])
+        gen.close()
+
+    def test_batch_by_size(self):
+        items = ['a', 'bb', 'ccc', 'dddd', 'e']
+        # each item costs its length plus a delimiter
+        exp = [['a', 'bb'], ['ccc'], ['dddd'], ['e']]
+        obs = list(batch_by_size(iter(items), 5))
+        self.assertEqual(obs, exp)
+
+        exp = [['a', 'bb'], ['ccc', 'dddd'], ['e']]
+        obs = list(batch_by_size(items, 100, max_items=2))
+        self.assertEqual(obs, exp)
+
+        # an item exceeding the bound is still yielded
+        exp = [['a'], ['x' * 10], ['e']]
+        obs = list(batch_by_size(['a', 'x' * 10, 'e'], 5))
+        self.assertEqual(obs, exp)
+
+        self.assertEqual(list(batch_by_size([], 5)), [])
+
+    def test_batch_by_size_key(self):
+        exp = [['a', 'b'], ['c']]
+        obs = list(batch_by_size(['a', 'b', 'c'], 8,
+                                 key=lambda i: 'x:%s' % i))
+        self.assertEqual(obs, exp)
+
+    def test_buffered_payloads(self):
+        exp = [(['a', 'b'], 'ctx:p:a/ctx:p:b'), (['c'], 'ctx:p:c')]
+        obs = list(_buffered_payloads(iter(['a', 'b ', 'c']), 'p', 'ctx',
+                                      None, None, 16))
+        self.assertEqual(obs, exp)
+
+        # the multikey header is accounted for
+        exp = [(['a', 'b'], 'ctx:mk/a/b'), (['c'], 'ctx:mk/c')]
+        obs = list(_buffered_payloads(iter(['a', 'b', 'c']), None, 'ctx',
+                                      None, 'mk', 11))
+        self.assertEqual(obs, exp)
+
+        # buffer_size remains an upper bound
+        exp = [(['a'], 'ctx:mk/a'), (['b'], 'ctx:mk/b'), (['c'], 'ctx:mk/c')]
+        obs = list(_buffered_payloads(iter(['a', 'b', 'c']), None, 'ctx',
+                                      1, 'mk', 100))
+        self.assertEqual(obs, exp)
+
+        self.assertEqual(list(_buffered_payloads(iter([]), None, 'ctx',
+                                                 None, 'mk', 100)), [])
+
+    def test_buffered_max_bytes(self):
+        redbiom.admin.load_sample_metadata(metadata)
+        samples = list(metadata['#SampleID']) + ['does not exist']
+
+        exp = list(buffered(iter(samples), None, 'HMGET', 'metadata',
+                            buffer_size=1, multikey='category:BODY_SITE'))
+        exp = ([i for items, _ in exp for i in items],
+               [v for _, values in exp for v in values])
+
+        # a budget smaller than any item forces each request into a POST
+        for max_bytes in (10, 100, 10000):
+            for in_flight in (1, 4):
+                obs = list(buffered(iter(samples), None, 'HMGET', 'metadata',
+                                    multikey='category:BODY_SITE',
+                                    in_flight=in_flight,
+                                    max_bytes=max_bytes))
+                for items, _ in obs:
+                    payload = 'metadata:category:BODY_SITE/%s' % \
+                        '/'.join(items)
+                    if len(items) > 1:
+                        self.assertTrue(len(payload) <= max_bytes)
+                obs = ([i for items, _ in obs for i in items],
+                       [v for _, values in obs for v in values])
+                self.assertEqual(obs, exp)
+
+    def test_parallel_map(self):
+        items = list(range(50))
+        exp = [i * 2 for i in items]
+        for workers in (1, 4):
+            obs = list(parallel_map(lambda x: x * 2, iter(items), workers))
+            self.assertEqual(obs, exp)
+
+    def test_parallel_map_sessions(self):
+        import threading
+
+        # each worker thread has its own session
+        def f(x):
+            return threading.get_ident(), id(get_session())
+
+        before = set(redbiom.active_sessions)
+        obs = list(parallel_map(f, range(20), 4))
+        by_thread = {}
+        for ident, session in obs:
+            by_thread.setdefault(ident, set()).add(session)
+        for sessions in by_thread.values():
+            self.assertEqual(len(sessions), 1)
+
+        # and the sessions of the workers are released
+        self.assertEqual(set(redbiom.active_sessions), before)
+
+    def test_parallel_map_requests(self):
+        post = make_post(config)
+        for i in range(20):
+            post('test', 'SET', 'k%d/%d' % (i, i))
+
+        def f(i):
+            get = make_get(config)
+            return get('test', 'GET', 'k%d' % i)
+
+        obs = list(parallel_map(f, range(20), 4))
+        self.assertEqual(obs, [str(i) for i in range(20)])
+
 
 if __name__ == '__main__':
     unittest.main()
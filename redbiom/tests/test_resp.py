@@ -0,0 +1,153 @@
+import os
+import socket
+import unittest
+from unittest import mock
+
+import biom
+import pandas as pd
+import requests
+
+import redbiom
+import redbiom.admin
+import redbiom.fetch
+import redbiom._requests
+import redbiom._resp
+from redbiom._resp import (parse_hostname, encode_command, command_args,
+                           as_webdis, _Status, _Error)
+from redbiom.tests import assert_test_env
+
+assert_test_env()
+
+
+REDIS_HOST = os.environ.get('REDBIOM_TEST_REDIS_HOST',
+                            'redis://127.0.0.1:6379')
+table = biom.load_table('test.biom')
+metadata = pd.read_csv('test.txt', sep='\t', dtype=str, na_values=[],
+                       keep_default_na=False)
+
+
+def _redis_available():
+    host, port, _, _ = parse_hostname(REDIS_HOST)
+    try:
+        socket.create_connection((host, port), timeout=1).close()
+    except OSError:
+        return False
+    return True
+
+
+class RESPTests(unittest.TestCase):
+    def test_parse_hostname(self):
+        self.assertEqual(parse_hostname('redis://foo:1234/2'),
+                         ('foo', 1234, 2, None))
+        self.assertEqual(parse_hostname('redis://:secret@foo'),
+                         ('foo', 6379, 0, 'secret'))
+        with self.assertRaises(ValueError):
+            parse_hostname('http://foo:7379')
+
+    def test_encode_command(self):
+        self.assertEqual(encode_command(['GET', 'foo']),
+                         b'*2\r\n$3\r\nGET\r\n$3\r\nfoo\r\n')
+        self.assertEqual(encode_command(['SET', 'k', 'b\xe9']),
+                         b'*3\r\n$3\r\nSET\r\n$1\r\nk\r\n$3\r\nb\xc3\xa9\r\n')
+
+    def test_command_args(self):
+        self.assertEqual(command_args('metadata', 'HGET',
+                                      'category:foo/a%2Eb+c'),
+                         ['HGET', 'metadata:category:foo', 'a.b c'])
+        self.assertEqual(command_args(None, 'SET', 'x/y', 'a/b'),
+                         ['SET', 'x', 'y', 'a/b'])
+
+    def test_as_webdis(self):
+        self.assertEqual(as_webdis('SET', _Status('OK')), [True, 'OK'])
+        self.assertEqual(as_webdis('HGETALL', ['a', '1', 'b', '2']),
+                         {'a': '1', 'b': '2'})
+        self.assertEqual(as_webdis('SMEMBERS', ['a', 'b']), ['a', 'b'])
+        self.assertEqual(as_webdis('GET', None), None)
+        self.assertEqual(as_webdis('GET', _Error('WRONGTYPE')),
+                         [False, 'WRONGTYPE'])
+
+
+@unittest.skipIf(not _redis_available(), "Redis is not available")
+class RESPTransportTests(unittest.TestCase):
+    def setUp(self):
+        host = redbiom.get_config()['hostname']
+        req = requests.get(host + '/FLUSHALL')
+        assert req.status_code == 200
+        redbiom.admin.ScriptManager.load_scripts(read_only=False)
+
+        self.config = {'hostname': REDIS_HOST, 'max_workers': 1}
+        self.webdis = redbiom.get_config()
+
+    def test_get_post_put(self):
+        post = redbiom._requests.make_post(self.config)
+        put = redbiom._requests.make_put(self.config)
+        get = redbiom._requests.make_get(self.config)
+        webdis_get = redbiom._requests.make_get(self.webdis)
+
+        self.assertEqual(post('test', 'SET', 'foo/a+b%2Fc'), [True, 'OK'])
+        self.assertEqual(put('test', 'SET', 'bar', '["x/y"]'), [True, 'OK'])
+        for cmd, payload in (('GET', 'foo'), ('GET', 'bar'),
+                             ('GET', 'missing'), ('EXISTS', 'foo')):
+            self.assertEqual(get('test', cmd, payload),
+                             webdis_get('test', cmd, payload))
+
+        post('test', 'HMSET', 'hash/a/1/b/2')
+        self.assertEqual(get('test', 'HGETALL', 'hash'),
+                         webdis_get('test', 'HGETALL', 'hash'))
+
+        obs = get('test', 'SMEMBERS', 'foo')
+        self.assertEqual(obs[0], False)
+        self.assertEqual(obs, webdis_get('test', 'SMEMBERS', 'foo'))
+
+        # the connection remains usable following an error
+        self.assertEqual(get('test', 'GET', 'foo'), 'a b/c')
+
+    def test_pipeline(self):
+        pipeline = redbiom._requests.make_pipeline(self.config)
+        webdis_pipeline = redbiom._requests.make_pipeline(self.webdis)
+
+        commands = [('test', 'SET', 'foo/1'), ('test', 'INCR', 'foo'),
+                    ('test', 'GET', 'foo'), ('test', 'GET', 'bar')]
+        exp = [[True, 'OK'], 2, '2', None]
+        self.assertEqual(pipeline(commands), exp)
+        self.assertEqual(webdis_pipeline(commands), exp)
+
+    def test_buffered(self):
+        redbiom.admin.load_sample_metadata(metadata)
+        samples = list(metadata['#SampleID']) + ['does not exist']
+
+        exp = list(redbiom._requests.buffered(iter(samples), None, 'HMGET',
+                                              'metadata', buffer_size=3,
+                                              multikey='category:BODY_SITE',
+                                              in_flight=1))
+        with mock.patch.dict(os.environ, {'REDBIOM_HOST': REDIS_HOST}):
+            for in_flight in (1, 4):
+                gen = redbiom._requests.buffered(
+                    iter(samples), None, 'HMGET', 'metadata', buffer_size=3,
+                    multikey='category:BODY_SITE', in_flight=in_flight)
+                self.assertEqual(list(gen), exp)
+
+    def test_data_from_samples(self):
+        redbiom.admin.create_context('test', 'a nice test')
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.load_sample_data(table, 'test', tag=None)
+
+        exp, exp_map = redbiom.fetch.data_from_samples('test', table.ids())
+        with mock.patch.dict(os.environ, {'REDBIOM_HOST': REDIS_HOST}):
+            obs, obs_map = redbiom.fetch.data_from_samples('test',
+                                                           table.ids())
+        self.assertEqual(obs, exp)
+        self.assertEqual(obs_map, exp_map)
+
+    def test_load_scripts(self):
+        with mock.patch.dict(os.environ, {'REDBIOM_HOST': REDIS_HOST}):
+            redbiom.admin.ScriptManager.drop_scripts()
+            redbiom.admin.ScriptManager.load_scripts(read_only=False)
+            sha = redbiom.admin.ScriptManager.get('fetch-sample')
+
+        get = redbiom._requests.make_get(self.webdis)
+        self.assertEqual(get('state', 'HGET', 'scripts/fetch-sample'), sha)
+
+
+if __name__ == '__main__':
+    unittest.main()
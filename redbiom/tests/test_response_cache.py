@@ -0,0 +1,181 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+import redbiom
+import redbiom.admin
+import redbiom._requests
+import redbiom._response_cache
+from redbiom._response_cache import (ResponseCache, timestamp_token,
+                                     cache_path)
+from redbiom.tests import assert_test_env
+
+assert_test_env()
+
+
+class ResponseCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = ResponseCache(os.path.join(self.dir, 'db', 'c.sqlite'),
+                                   100)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.dir)
+
+    def test_get_put(self):
+        self.assertEqual(self.cache.get('a'), (False, None))
+        self.cache.put('a', {'x': [1, None]})
+        self.assertEqual(self.cache.get('a'), (True, {'x': [1, None]}))
+        self.cache.put('b', None)
+        self.assertEqual(self.cache.get('b'), (True, None))
+
+    def test_put_evicts_least_recently_used(self):
+        value = 'x' * 28  # 30 bytes encoded
+        for key in 'abc':
+            self.cache.put(key, value)
+        self.cache.get('a')
+        self.cache.put('d', value)
+
+        self.assertTrue(self.cache.get('a')[0])
+        self.assertFalse(self.cache.get('b')[0])
+        self.assertTrue(self.cache.get('c')[0])
+        self.assertTrue(self.cache.get('d')[0])
+
+        # too large to retain
+        self.cache.put('e', 'x' * 200)
+        self.assertFalse(self.cache.get('e')[0])
+        self.assertTrue(self.cache.get('d')[0])
+
+    def test_validate(self):
+        self.cache.validate(None)
+        self.assertFalse(self.cache.enabled)
+
+        self.cache.validate([1, 'foo'])
+        self.assertTrue(self.cache.enabled)
+        self.cache.put('a', 1)
+        self.cache.validate([1, 'foo'])
+        self.assertEqual(self.cache.get('a'), (True, 1))
+
+        self.cache.validate([2, 'bar'])
+        self.assertEqual(self.cache.get('a'), (False, None))
+
+
+class CachedRequestsTests(unittest.TestCase):
+    def setUp(self):
+        host = redbiom.get_config()['hostname']
+        req = requests.get(host + '/FLUSHALL')
+        assert req.status_code == 200
+
+        self.dir = tempfile.mkdtemp()
+        self.env = mock.patch.dict(os.environ,
+                                   {'REDBIOM_CACHE_DIR': self.dir})
+        self.env.start()
+        self.config = redbiom.get_config()
+        self.post = redbiom._requests.make_post(self.config)
+
+    def tearDown(self):
+        self.env.stop()
+        caches = redbiom._response_cache._caches
+        for key in [k for k in caches if k[2] == self.dir]:
+            caches.pop(key).close()
+        shutil.rmtree(self.dir)
+
+    def test_timestamp_token(self):
+        get = redbiom._requests.make_get(self.config)
+        self.assertIsNone(timestamp_token(get))
+        self.post('state', 'LPUSH', 'timestamps/foo')
+        self.post('state', 'LPUSH', 'timestamps/bar')
+        self.assertEqual(timestamp_token(get), [2, 'bar'])
+
+    def test_get(self):
+        get = redbiom._requests.make_get(self.config)
+        self.post('test', 'SADD', 'foo/a/b')
+
+        # nothing is cached without timestamps
+        self.assertEqual(sorted(get('test', 'SMEMBERS', 'foo')), ['a', 'b'])
+        self.post('test', 'SADD', 'foo/c')
+        self.assertEqual(sorted(get('test', 'SMEMBERS', 'foo')),
+                         ['a', 'b', 'c'])
+
+        self.post('state', 'LPUSH', 'timestamps/foo')
+        with mock.patch.object(redbiom._response_cache, 'VALIDATE_SECONDS',
+                               0):
+            get = redbiom._requests.make_get(self.config)
+            self.assertEqual(sorted(get('test', 'SMEMBERS', 'foo')),
+                             ['a', 'b', 'c'])
+            self.post('test', 'SADD', 'foo/d')
+            self.assertEqual(sorted(get('test', 'SMEMBERS', 'foo')),
+                             ['a', 'b', 'c'])
+
+            # commands which are not listed are not cached
+            self.assertEqual(get('test', 'EXISTS', 'bar'), 0)
+            self.post('test', 'SADD', 'bar/a')
+            self.assertEqual(get('test', 'EXISTS', 'bar'), 1)
+
+            # the state of the database is not cached
+            self.post('state', 'HSET', 'foo/bar/1')
+            self.assertEqual(get('state', 'HGET', 'foo/bar'), '1')
+            self.post('state', 'HSET', 'foo/bar/2')
+            self.assertEqual(get('state', 'HGET', 'foo/bar'), '2')
+
+            # the cache is shared by processes
+            other = ResponseCache(cache_path(self.config), 1024)
+            self.assertTrue(other.get('["SMEMBERS", "test:foo"]')[0])
+            other.close()
+
+            # a new timestamp invalidates the cache
+            self.post('state', 'LPUSH', 'timestamps/bar')
+            self.assertEqual(sorted(get('test', 'SMEMBERS', 'foo')),
+                             ['a', 'b', 'c', 'd'])
+
+    def test_admin_invalidates(self):
+        redbiom.admin.create_context('test', 'foo')
+        self.post('state', 'LPUSH', 'timestamps/foo')
+        with mock.patch.object(redbiom._response_cache, 'VALIDATE_SECONDS',
+                               0):
+            get = redbiom._requests.make_get(self.config)
+            self.assertEqual(get('test', 'SMEMBERS', 'samples-represented'),
+                             [])
+
+            # writes through redbiom.admin discard the cached responses
+            self.post('test', 'SADD', 'samples-represented/a')
+            self.assertEqual(get('test', 'SMEMBERS', 'samples-represented'),
+                             [])
+            redbiom.admin.create_context('other', 'foo')
+
+            # including for other processes, as the cache is shared
+            other = ResponseCache(cache_path(self.config), 1024)
+            self.assertFalse(other.get('["SMEMBERS", '
+                                       '"test:samples-represented"]')[0])
+            other.close()
+
+            self.assertEqual(get('test', 'SMEMBERS', 'samples-represented'),
+                             ['a'])
+
+    def test_script_exec(self):
+        redbiom.admin.ScriptManager.load_scripts(read_only=False)
+        redbiom.admin.create_context('test', 'foo')
+        self.post('state', 'LPUSH', 'timestamps/foo')
+        self.post('test', 'HSET', 'sample-index-inverted/0/s0')
+        self.post('test', 'RPUSH', 'feature:f/0/5')
+
+        se = redbiom._requests.make_script_exec(self.config)
+        sha = redbiom.admin.ScriptManager.get('fetch-feature')
+        self.assertEqual(se(sha, 0, 'test', 'f'), {'s0': 5})
+
+        self.post('test', 'HSET', 'sample-index-inverted/1/s1')
+        self.post('test', 'RPUSH', 'feature:f/1/3')
+        self.assertEqual(se(sha, 0, 'test', 'f'), {'s0': 5})
+
+        uncached = redbiom._requests.make_script_exec(
+            dict(self.config, cache_dir=None))
+        self.assertEqual(uncached(sha, 0, 'test', 'f'), {'s0': 5, 's1': 3})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,7 @@ import requests
 import redbiom._requests
 import redbiom.admin
 import redbiom.search
+import redbiom.where_expr
 from redbiom.tests import assert_test_env
 
 assert_test_env()
@@ -75,6 +76,65 @@ class SearchTests(unittest.TestCase):
 
         # TODO: return dataframes
 
+    def test_where_ids(self):
+        post = redbiom._requests.make_post(redbiom.get_config())
+        db = {'age': {'A': '3', 'B': '20', 'C': '10', 'D': '5', 'E': ' 7 ',
+                      'F': '0x10', 'G': 'inf', 'H': '1e1', 'I': '.5'},
+              'other': {'B': '5', 'E': '10', 'C': '15'},
+              'sex': {'A': 'female', 'B': 'female', 'C': 'unknown',
+                      'D': 'male', 'E': 'Male'}}
+        for name, values in db.items():
+            payload = '/'.join(['%s/%s' % kv for kv in values.items()])
+            post('metadata:category', 'HMSET', '%s/%s' % (name, payload))
+
+        tests = ["age < 10",
+                 "age > 0",
+                 "age == 5",
+                 "10 <= age",
+                 "age != 10",
+                 "sex == 'male'",
+                 "sex < 'm'",
+                 "sex in ('male', 'female', 5)",
+                 "'male' in sex",
+                 "'male' not in sex",
+                 "5 in sex",
+                 "sex is 'male' or age < 11",
+                 "sex is not 'female' and sex is not 'male'",
+                 "(age > 4 and sex == 'female') or other < 12",
+                 "foo is bar",
+                 "age > other",
+                 "other is not None",
+                 "age == None",
+                 "(age <= 10) != 8"]
+
+        redbiom.admin.ScriptManager.load_scripts(read_only=True)
+        for test in tests:
+            exp = set(redbiom.where_expr.whereeval(test, get=self.get).index)
+            obs = redbiom.where_expr.where_ids(test, get=self.get)
+            self.assertEqual(obs, exp, test)
+
+        # the same samples are found through the numeric indexes
+        post('metadata', 'SADD', 'categories-represented/age/other')
+        redbiom.admin.index_numeric_category('age')
+        redbiom.admin.index_numeric_category('other')
+        for test in tests:
+            exp = set(redbiom.where_expr.whereeval(test, get=self.get).index)
+            obs = redbiom.where_expr.where_ids(test, get=self.get)
+            self.assertEqual(obs, exp, test)
+
+        # which are used in place of the values
+        post('metadata', 'ZADD', 'numeric:age/1/Z')
+        self.assertIn('Z', redbiom.where_expr.where_ids("age < 2"))
+        self.assertIn('Z', redbiom.where_expr.where_ids("age != 3"))
+        self.assertNotIn('Z', redbiom.where_expr.where_ids("age < 2 and "
+                                                           "sex != 'x'"))
+
+        # servers without the script evaluate the clause locally
+        redbiom.admin.ScriptManager.drop_scripts()
+        self.assertEqual(redbiom.where_expr.where_ids("age < 10",
+                                                      get=self.get),
+                         {'A', 'D', 'E', 'I'})
+
     def test_metadata_values_fail(self):
         tests = [('antibiotics and NY', TypeError, "Unsupported node type"),
                  ('NY where age & bmi', TypeError,
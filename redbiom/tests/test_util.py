@@ -1,4 +1,6 @@
+import os
 import unittest
+from unittest import mock
 from functools import reduce
 import random
 import numpy as np
@@ -9,8 +11,9 @@ import biom
 
 import redbiom
 import redbiom.admin
+import redbiom._requests
 from redbiom.util import (float_or_nan, from_or_nargs,
-                          ids_from, has_sample_metadata,
+                          ids_from, _ids_from_per_id, has_sample_metadata,
                           partition_samples_by_tags, resolve_ambiguities,
                           _stable_ids_from_ambig, _stable_ids_from_unambig,
                           category_exists, df_to_stems, stems)
@@ -128,6 +131,62 @@ class UtilTests(unittest.TestCase):
             self.assertEqual(obs_exact, exp_exact)
             self.assertEqual(obs_union, exp_union)
 
+    def test_ids_from_workers(self):
+        redbiom.admin.create_context('test', 'foo')
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.ScriptManager.load_scripts(read_only=False)
+        redbiom.admin.load_sample_data(table, 'test', tag=None)
+
+        ids = table.ids(axis='observation')[:10]
+        for exact in (True, False):
+            exp = ids_from(iter(ids), exact, 'feature', ['test'], workers=1)
+            obs = ids_from(iter(ids), exact, 'feature', ['test'], workers=4)
+            self.assertEqual(obs, exp)
+
+    def test_ids_from_per_id(self):
+        redbiom.admin.create_context('test', 'foo')
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.ScriptManager.load_scripts(read_only=False)
+        redbiom.admin.load_sample_data(table, 'test', tag=None)
+
+        features = list(table.ids(axis='observation')[:25])
+        samples = ['UNTAGGED_%s' % i for i in table.ids()[:5]]
+        tests = [(features[:1], 'feature'), (features, 'feature'),
+                 (features + ['doesnotexist'], 'feature'),
+                 (samples, 'sample'), ([], 'feature')]
+
+        # a small budget to force many batches
+        with mock.patch.dict(os.environ, {'REDBIOM_BUFFER_BYTES': '256'}):
+            for ids, axis in tests:
+                for exact in (True, False):
+                    for min_count in (1, 2, 10):
+                        exp = _ids_from_per_id(ids, exact, axis, ['test'],
+                                               min_count)
+                        obs = ids_from(iter(ids), exact, axis, ['test'],
+                                       min_count)
+                        self.assertEqual(obs, exp)
+
+    def test_ids_from_without_script(self):
+        redbiom.admin.create_context('test', 'foo')
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.ScriptManager.load_scripts(read_only=False)
+        redbiom.admin.load_sample_data(table, 'test', tag=None)
+
+        features = list(table.ids(axis='observation')[:10])
+        exp = ids_from(iter(features), False, 'feature', ['test'])
+
+        # a server which predates the ids-from script
+        post = redbiom._requests.make_post(redbiom.get_config())
+        post('state', 'HDEL', 'scripts/ids-from')
+        cache = redbiom.admin.ScriptManager._sha_cache()
+        sha = cache.pop('ids-from', None)
+        try:
+            obs = ids_from(iter(features), False, 'feature', ['test'])
+        finally:
+            if sha is not None:
+                cache['ids-from'] = sha
+        self.assertEqual(obs, exp)
+
     def test_ids_from_samples(self):
         redbiom.admin.create_context('test', 'foo')
         redbiom.admin.load_sample_metadata(metadata)
@@ -194,6 +253,137 @@ class UtilTests(unittest.TestCase):
         self.assertEqual(obs_ambiguous, exp_ambiguous)
         self.assertEqual(obs_ri, exp_ri)
 
+    def test_resolve_ambiguities_indexed(self):
+        config = redbiom.get_config()
+        get = redbiom._requests.make_get(config)
+        post = redbiom._requests.make_post(config)
+
+        commands = []
+
+        def recording_get(context, cmd, data):
+            commands.append(cmd)
+            return get(context, cmd, data)
+
+        redbiom.admin.create_context('test', 'foo')
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.ScriptManager.load_scripts(read_only=False)
+        redbiom.admin.load_sample_data(table, 'test', tag=None)
+        redbiom.admin.load_sample_data(table, 'test', tag='other')
+
+        samples = ['10317.000047188', 'UNTAGGED_10317.000046868',
+                   'other_10317.000046868', 'other_foo', 'foo']
+        obs = resolve_ambiguities('test', iter(samples), recording_get)
+        self.assertEqual(commands, [])
+
+        post('test', 'DEL', 'ambiguity-index-size')
+        exp = resolve_ambiguities('test', samples, recording_get)
+        self.assertEqual(commands, ['SMEMBERS'])
+
+        obs_stable, obs_unobserved, obs_ambig, obs_ri = obs
+        exp_stable, exp_unobserved, exp_ambig, exp_ri = exp
+        self.assertEqual(obs_stable, exp_stable)
+        self.assertEqual(sorted(obs_unobserved), sorted(exp_unobserved))
+        self.assertEqual({k: sorted(v) for k, v in obs_ambig.items()},
+                         {k: sorted(v) for k, v in exp_ambig.items()})
+        self.assertEqual(obs_ri, exp_ri)
+        self.assertEqual(sorted(obs_unobserved), ['foo', 'other_foo'])
+        self.assertEqual(sorted(obs_ambig['10317.000047188']),
+                         ['UNTAGGED_10317.000047188',
+                          'other_10317.000047188'])
+
+    def test_resolve_ambiguities_without_script(self):
+        config = redbiom.get_config()
+        get = redbiom._requests.make_get(config)
+
+        redbiom.admin.create_context('test', 'foo')
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.ScriptManager.load_scripts(read_only=False)
+        redbiom.admin.load_sample_data(table, 'test', tag=None)
+
+        samples = ['10317.000047188', 'UNTAGGED_10317.000046868', 'foo']
+        exp = resolve_ambiguities('test', samples, get)
+
+        # a server which predates the ambiguities script
+        post = redbiom._requests.make_post(config)
+        post('state', 'HDEL', 'scripts/ambiguities')
+        cache = redbiom.admin.ScriptManager._sha_cache()
+        sha = cache.pop('ambiguities', None)
+        try:
+            obs = resolve_ambiguities('test', samples, get)
+        finally:
+            if sha is not None:
+                cache['ambiguities'] = sha
+        self.assertEqual(obs, exp)
+
+    def test_resolve_ambiguities_cached(self):
+        import tempfile
+        config = redbiom.get_config()
+        get = redbiom._requests.make_get(config)
+
+        commands = []
+
+        def recording_get(context, cmd, data):
+            commands.append(cmd)
+            return get(context, cmd, data)
+
+        redbiom.admin.create_context('test', 'foo')
+        redbiom.admin.load_sample_metadata(metadata)
+        redbiom.admin.ScriptManager.load_scripts(read_only=False)
+        redbiom.admin.load_sample_data(table, 'test', tag=None)
+
+        # the membership is only obtained if the ambiguity index is unusable
+        post = redbiom._requests.make_post(config)
+        post('test', 'DEL', 'ambiguity-index-size')
+
+        samples = ['10317.000047188', 'UNTAGGED_10317.000046868', 'foo']
+        exp = resolve_ambiguities('test', samples, get)
+
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                mock.patch.dict(os.environ, {'REDBIOM_CACHE_DIR': cache_dir}):
+            # nothing is cached without timestamps
+            self.assertEqual(resolve_ambiguities('test', samples,
+                                                 recording_get), exp)
+            self.assertEqual(resolve_ambiguities('test', samples,
+                                                 recording_get), exp)
+            self.assertEqual(commands.count('SMEMBERS'), 2)
+            self.assertFalse(os.path.exists(os.path.join(cache_dir,
+                                                         'membership')))
+
+            redbiom.admin.create_timestamp()
+            commands.clear()
+            for _ in range(3):
+                self.assertEqual(resolve_ambiguities('test', samples,
+                                                     recording_get), exp)
+            self.assertEqual(commands.count('SMEMBERS'), 1)
+
+            # a change to the context invalidates the cache
+            redbiom.admin.load_sample_data(table, 'test', tag='other')
+            post('test', 'DEL', 'ambiguity-index-size')
+            commands.clear()
+            obs_stable, _, obs_ambig, _ = \
+                resolve_ambiguities('test', samples, recording_get)
+            self.assertEqual(commands.count('SMEMBERS'), 1)
+            self.assertEqual(sorted(obs_ambig['10317.000047188']),
+                             ['UNTAGGED_10317.000047188',
+                              'other_10317.000047188'])
+
+            # as does a new timestamp
+            redbiom.admin.create_timestamp()
+            commands.clear()
+            resolve_ambiguities('test', samples, recording_get)
+            resolve_ambiguities('test', samples, recording_get)
+            self.assertEqual(commands.count('SMEMBERS'), 1)
+
+            # an unreadable cache is disregarded
+            membership = os.path.join(cache_dir, 'membership')
+            for name in os.listdir(membership):
+                with open(os.path.join(membership, name), 'w') as fp:
+                    fp.write('{')
+            obs = resolve_ambiguities('test', samples, get)
+            self.assertEqual(sorted(obs[2]['10317.000047188']),
+                             ['UNTAGGED_10317.000047188',
+                              'other_10317.000047188'])
+
     def test_resolve_ambiguities_mixed(self):
         import redbiom._requests
         import redbiom
@@ -2,7 +2,8 @@ import unittest
 import pandas as pd
 import pandas.testing as pdt
 
-from redbiom.where_expr import whereeval, _cast_retain_numeric
+from redbiom.where_expr import (whereeval, _cast_retain_numeric,
+                                compile_plan)
 
 
 mock_db = {'age': {'A': '3', 'B': '20', 'C': '10', 'D': '5'},
@@ -74,6 +75,42 @@ class WhereTests(unittest.TestCase):
             obs = whereeval(test, get=mock_get)
             self.assertEqual(set(obs.index), exp)
 
+    def test_compile_plan(self):
+        age_lt = {'kind': 'compare', 'name': 'age', 'op': 'lt', 'value': 10.0}
+        tests = [("age < 10", age_lt),
+                 ("10 > age", age_lt),
+                 ("sex <= 'male'",
+                     {'kind': 'compare', 'name': 'sex', 'op': 'le',
+                      'value': 'male'}),
+                 ("age > other",
+                     {'kind': 'compare-names', 'name': 'age', 'op': 'gt',
+                      'other': 'other'}),
+                 ("sex in ('male', 5, None)",
+                     {'kind': 'in', 'name': 'sex', 'values': ['male'],
+                      'negate': False}),
+                 ("'male' not in sex",
+                     {'kind': 'in', 'name': 'sex', 'values': ['male'],
+                      'negate': True}),
+                 ("other is not None",
+                     {'kind': 'in', 'name': 'other', 'values': [],
+                      'negate': True}),
+                 ("age < 10 or sex is 'male'",
+                     {'kind': 'or', 'left': age_lt,
+                      'right': {'kind': 'compare', 'name': 'sex', 'op': 'eq',
+                                'value': 'male'}}),
+                 ("(age <= 10) != 8", None),
+                 ("1 < age < 10", None),
+                 ("age < None", None),
+                 ("age > 1 and age < 10 and sex == 'male'", None)]
+
+        for test, exp in tests:
+            self.assertEqual(compile_plan(test), exp)
+
+        with self.assertRaises(TypeError):
+            compile_plan("print('hi')")
+        with self.assertRaises(SyntaxError):
+            compile_plan("age >")
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -31,7 +31,7 @@ def from_or_nargs(from_, nargs_variable):
     return iter((s.strip() for s in nargs_variable))
 
 
-def ids_from(it, exact, axis, contexts, min_count=1):
+def ids_from(it, exact, axis, contexts, min_count=1, workers=None):
     """Grab samples from an iterable of IDs
 
     Parameters
@@ -47,23 +47,37 @@ def ids_from(it, exact, axis, contexts, min_count=1):
         The contexts to search in
     min_count : int, optional
         The minimum count (inclusive) to retain an observation.
+    workers : int, optional
+        The number of concurrent requests to issue. If not specified,
+        REDBIOM_MAX_WORKERS is used.
 
     Notes
     -----
     Contexts are evaluated independently, and the results of each context are
     unioned.
 
+    The filtering by min_count, and the intersection or union, are performed
+    within Redis by the ids-from script over batches of IDs, such that only
+    the resulting IDs are transferred. For an intersection, the script
+    examines the IDs with the fewest associations first, only searches the
+    associations of subsequent IDs for the remaining candidates, and stops
+    once no candidates remain. If the script is not loaded on the server,
+    the associations of each ID are instead fetched and combined locally.
+
     Returns
     -------
     set
         The IDs associated with the search IDs.
 
+    Redis command summary
+    ---------------------
+    EVALSHA <ids-from-sha1> 0 <context> <axis> <exact> <min_count> <id> ...
+    LLEN <context>:<axis>:<id> (within ids-from, if exact)
     """
     import redbiom
     import redbiom._requests
     import redbiom.admin
     config = redbiom.get_config()
-    se = redbiom._requests.make_script_exec(config)
 
     retrieved = set()
 
@@ -73,15 +87,74 @@ def ids_from(it, exact, axis, contexts, min_count=1):
     if not isinstance(contexts, (list, set, tuple)):
         contexts = [contexts]
 
+    it = list(it)
+    try:
+        fetcher = redbiom.admin.ScriptManager.get('ids-from')
+    except ValueError:
+        # the server predates the script
+        return _ids_from_per_id(it, exact, axis, contexts, min_count,
+                                workers)
+
+    for context in contexts:
+        def fetch(batch):
+            # constructed per call so that the session of the thread is used
+            se = redbiom._requests.make_script_exec(config)
+            return se(fetcher, 0, context, axis, int(exact), min_count,
+                      *batch)
+
+        batches = redbiom._requests.batch_by_size(it, config['buffer_bytes'])
+
+        context_ids = None
+        for block in redbiom._requests.parallel_map(fetch, batches, workers):
+            # an empty result is decoded as an empty dict as Lua does not
+            # distinguish an empty array
+            block = set(block or [])
+            if context_ids is None:
+                context_ids = block
+            elif exact:
+                context_ids &= block
+            else:
+                context_ids |= block
+
+            # the intersection cannot grow, so further batches are moot
+            if exact and not context_ids:
+                break
+
+        if context_ids:
+            retrieved = retrieved.union(context_ids)
+
+    return retrieved
+
+
+def _ids_from_per_id(it, exact, axis, contexts, min_count=1, workers=None):
+    """Grab samples from IDs, obtaining the associations of each ID
+
+    Parameters and return values are as described by ids_from.
+
+    Redis command summary
+    ---------------------
+    EVALSHA <fetch-feature-sha1> 0 <context> <id>
+    EVALSHA <fetch-sample-sha1> 0 <context> <id>
+    """
+    import redbiom
+    import redbiom._requests
+    import redbiom.admin
+    config = redbiom.get_config()
+
+    retrieved = set()
+
     def min_count_filter(dat):
         return {k: v for k, v in dat.items() if v >= min_count}
 
-    it = list(it)
     fetcher = redbiom.admin.ScriptManager.get('fetch-%s' % axis)
     for context in contexts:
+        def fetch(id_):
+            # constructed per call so that the session of the thread is used
+            se = redbiom._requests.make_script_exec(config)
+            return min_count_filter(se(fetcher, 0, context, id_))
+
         context_ids = None
-        for id_ in it:
-            block = min_count_filter(se(fetcher, 0, context, id_))
+        for block in redbiom._requests.parallel_map(fetch, it, workers):
             if not exact:
                 if context_ids is None:
                     context_ids = set()
@@ -116,7 +189,17 @@ def category_exists(category, get=None):
     Redis Command Summary
     ---------------------
     SISMEMBER <category> metadata:catetories-represented
+
+    The result is retained for REDBIOM_CACHE_TTL seconds (see
+    redbiom.cache).
     """
+    import redbiom.cache
+    return redbiom.cache.lookup('category_exists', (category, ),
+                                lambda: _category_exists(category, get))
+
+
+def _category_exists(category, get=None):
+    """Test if a category exists, without caching the result"""
     if get is None:
         import redbiom
         import redbiom._requests
@@ -210,28 +293,201 @@ def resolve_ambiguities(context, samples, get):
     redbiomids
         A dict keyed by "rid_sampleid" and valued by a QIIME compatible sample
         ID.
+
+    Notes
+    -----
+    The tagged IDs corresponding to the requested samples are obtained from
+    the ambiguity index of the context (see
+    redbiom.admin.index_ambiguities) by the ambiguities script. If the index
+    is unavailable or incomplete, all samples represented in the context
+    are obtained instead.
+
+    If REDBIOM_CACHE_DIR is set, the samples represented by the context are
+    persisted there, and reused while the timestamps of the database and the
+    number of samples represented are unchanged. Nothing is persisted if the
+    database does not have timestamps.
+
+    Redis command summary
+    ---------------------
+    EVALSHA <ambiguities-sha1> 0 <context> <untagged_id> ...
+    SMEMBERS <context>:samples-represented (if the index is not usable)
+    LLEN state:timestamps (if caching)
+    LINDEX state:timestamps 0 (if caching)
+    SCARD <context>:samples-represented (if caching)
     """
-    from collections import defaultdict
+    samples = list(samples)
 
-    # split the requested samples into what is and is not tagged
-    untagged, tagged, _, tagged_clean = partition_samples_by_tags(samples)
+    ctx_with_ambig = _indexed_ambiguity_map(context, samples)
+    if ctx_with_ambig is None:
+        ctx_with_ambig = _context_ambiguity_map(context, get)
 
-    # get all known tagged samples in the context
-    ctx = get(context, 'SMEMBERS', 'samples-represented')
-    _, ctx_tagged, _, ctx_tagged_clean = partition_samples_by_tags(ctx)
+    return _resolve_with_ambiguity_map(samples, ctx_with_ambig)
+
+
+def _ambiguity_map(represented):
+    """Map the untagged form of the samples represented to their tagged IDs
+
+    Parameters
+    ----------
+    represented : Iterable of str
+        The samples-represented of a context
+
+    Returns
+    -------
+    dict
+        {untagged sample ID: [tagged sample ID, ...]}
+    """
+    from collections import defaultdict
+
+    _, ctx_tagged, _, ctx_tagged_clean = partition_samples_by_tags(represented)
 
-    # create a map of known ambiguous ID -> known stable IDs
     ctx_with_ambig = defaultdict(list)
     for with_tag, without_tag in zip(ctx_tagged, ctx_tagged_clean):
         ctx_with_ambig[without_tag].append(with_tag)
-    ctx_known_stable = set(ctx_tagged)
+
+    return dict(ctx_with_ambig)
+
+
+def _ambiguity_lookups(samples):
+    """The untagged IDs to look up in an ambiguity index for samples"""
+    untagged, _, _, tagged_clean = partition_samples_by_tags(samples)
+    return sorted(set(untagged) | set(tagged_clean))
+
+
+def _indexed_ambiguity_map(context, samples):
+    """Obtain the ambiguity map of samples from the ambiguity index
+
+    Parameters
+    ----------
+    context : str
+        The context to search within
+    samples : Iterable of str
+        The samples of interest
+
+    Returns
+    -------
+    dict or None
+        {untagged sample ID: [tagged sample ID, ...]} for the samples
+        of interest which are represented, or None if the ambiguity index
+        is unavailable or does not describe the context in full.
+    """
+    import redbiom
+    import redbiom._requests
+    import redbiom.admin
+
+    config = redbiom.get_config()
+    try:
+        sha = redbiom.admin.ScriptManager.get('ambiguities')
+    except ValueError:
+        # the server predates the script
+        return None
+
+    se = redbiom._requests.make_script_exec(config)
+
+    ctx_with_ambig = {}
+    for batch in redbiom._requests.batch_by_size(_ambiguity_lookups(samples),
+                                                 config['buffer_bytes']):
+        found = se(sha, 0, context, *batch)
+        if found is False:
+            return None
+        ctx_with_ambig.update(found)
+
+    return ctx_with_ambig
+
+
+def _membership_token(context, get):
+    """Describe the state of a context to validate its cached membership
+
+    Returns
+    -------
+    list or None
+        The number of timestamps, the latest timestamp, and the number of
+        samples represented in the context, or None if the database does not
+        have timestamps.
+    """
+    import redbiom._response_cache
+
+    token = redbiom._response_cache.timestamp_token(get)
+    if token is None:
+        return None
+
+    return token + [get(context, 'SCARD', 'samples-represented')]
+
+
+def _membership_cache_path(cache_dir, hostname, context):
+    """The file the membership of a context on a host is cached in"""
+    import hashlib
+    import os
+
+    key = hashlib.sha1(('%s\n%s' % (hostname, context)).encode('utf-8'))
+    return os.path.join(os.path.expanduser(cache_dir), 'membership',
+                        '%s.json' % key.hexdigest())
+
+
+def _context_ambiguity_map(context, get):
+    """Obtain the ambiguity map of a context, using the cache if valid"""
+    import json
+    import os
+    import redbiom
+
+    config = redbiom.get_config()
+    cache_dir = config['cache_dir']
+    if not cache_dir:
+        return _ambiguity_map(get(context, 'SMEMBERS', 'samples-represented'))
+
+    token = _membership_token(context, get)
+    path = _membership_cache_path(cache_dir, config['hostname'], context)
+
+    if token is not None:
+        try:
+            with open(path) as fp:
+                cached = json.load(fp)
+        except (OSError, ValueError):
+            cached = None
+
+        if cached is not None and cached.get('token') == token:
+            return cached['ambiguities']
+
+    ambiguities = _ambiguity_map(get(context, 'SMEMBERS',
+                                     'samples-represented'))
+
+    if token is not None:
+        # the token was obtained prior to the membership, so a concurrent
+        # update of the context can only cause a later miss
+        tmp = '%s.%d' % (path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, 'w') as fp:
+                json.dump({'hostname': config['hostname'],
+                           'context': context,
+                           'token': token,
+                           'ambiguities': ambiguities}, fp)
+            os.replace(tmp, path)
+        except OSError:
+            # the cache is an optimization, and is not essential
+            pass
+
+    return ambiguities
+
+
+def _resolve_with_ambiguity_map(samples, ctx_with_ambig):
+    """Resolve ambiguities against the ambiguity map of a context
+
+    Parameters and return values are as described by resolve_ambiguities,
+    where ctx_with_ambig is as produced by _ambiguity_map.
+    """
+    # split the requested samples into what is and is not tagged
+    untagged, tagged, _, tagged_clean = partition_samples_by_tags(samples)
+
+    # the known stable IDs
+    ctx_known_stable = {t for v in ctx_with_ambig.values() for t in v}
 
     # what is ambiguous and exists
     unobserved = []
     known_ambiguous = {}
     for i in untagged:
         if i in ctx_with_ambig:
-            known_ambiguous[i] = ctx_with_ambig[i]
+            known_ambiguous[i] = list(ctx_with_ambig[i])
         else:
             unobserved.append(i)
 
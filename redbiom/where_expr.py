@@ -1,5 +1,6 @@
 import sys
 import ast
+import math
 import operator
 import functools
 
@@ -170,16 +171,8 @@ if sys.version_info.major == 3:
             raise TypeError("Unknown NameConstant: %s" % value)
 
 
-def whereeval(str_, get=None):
-    """Evaluate a set operation string, where each Name is fetched"""
-    if get is None:
-        import redbiom
-        config = redbiom.get_config()
-        get = redbiom._requests.make_get(config)
-
-    # Load is subject to indirection to simplify testing
-    globals()['Load'] = make_Load(get)
-
+def _parse(str_):
+    """Parse a where clause, verifying only supported nodes are used"""
     formed = ast.parse(str_, mode='eval')
 
     node_types = [ast.Compare, ast.In, ast.NotIn, ast.BoolOp, ast.And,
@@ -196,6 +189,21 @@ def whereeval(str_, get=None):
         if not isinstance(node, node_types):
             raise TypeError("Unsupported node type: %s" % ast.dump(node))
 
+    return formed
+
+
+def whereeval(str_, get=None):
+    """Evaluate a set operation string, where each Name is fetched"""
+    if get is None:
+        import redbiom
+        config = redbiom.get_config()
+        get = redbiom._requests.make_get(config)
+
+    # Load is subject to indirection to simplify testing
+    globals()['Load'] = make_Load(get)
+
+    formed = _parse(str_)
+
     result = eval(ast.dump(formed))
 
     # clean up
@@ -203,3 +211,208 @@ def whereeval(str_, get=None):
     del Load
 
     return result
+
+
+# {comparison: (operator, operator with the operands swapped)}
+_PLAN_OPERATORS = {ast.Lt: ('lt', 'gt'), ast.LtE: ('le', 'ge'),
+                   ast.Gt: ('gt', 'lt'), ast.GtE: ('ge', 'le'),
+                   ast.Eq: ('eq', 'eq'), ast.Is: ('eq', 'eq'),
+                   ast.NotEq: ('ne', 'ne'), ast.IsNot: ('ne', 'ne')}
+
+
+def _plan_operand(node):
+    """Describe an operand as a (kind, value) tuple, or None if unsupported
+
+    The kinds are "name" for a category, "none" for None, "value" for a
+    number (as float) or string, and "tuple" for a tuple of values.
+    """
+    if isinstance(node, ast.Name):
+        if node.id in {'None', 'none'}:
+            return ('none', None)
+        return ('name', node.id)
+    elif isinstance(node, ast.Tuple):
+        values = [_plan_operand(e) for e in node.elts]
+        if any(v is None or v[0] not in ('value', 'none') for v in values):
+            return None
+        return ('tuple', [v[1] for v in values])
+
+    # literals are parsed as Num, Str and NameConstant prior to Python 3.8,
+    # and as Constant since
+    try:
+        value = ast.literal_eval(node)
+    except ValueError:
+        return None
+
+    if value is None:
+        return ('none', None)
+    elif isinstance(value, (int, float)):
+        # infinities are not representable in the JSON of a plan
+        if not math.isfinite(value):
+            return None
+        return ('value', float(value))
+    elif isinstance(value, str):
+        return ('value', value)
+
+    return None
+
+
+def _plan_compare(node):
+    """Compile a comparison, or return None if it is unsupported"""
+    if len(node.ops) != 1:
+        return None
+
+    op = type(node.ops[0])
+    left = _plan_operand(node.left)
+    right = _plan_operand(node.comparators[0])
+    if left is None or right is None:
+        return None
+
+    kinds = (left[0], right[0])
+    if op in (ast.In, ast.NotIn):
+        negate = op is ast.NotIn
+        if kinds == ('name', 'tuple'):
+            # only strings can be members of a category
+            values = [v for v in right[1] if isinstance(v, str)]
+            return {'kind': 'in', 'name': left[1], 'values': values,
+                    'negate': negate}
+        elif kinds in (('value', 'name'), ('none', 'name')):
+            values = [left[1]] if isinstance(left[1], str) else []
+            return {'kind': 'in', 'name': right[1], 'values': values,
+                    'negate': negate}
+        return None
+
+    if op not in _PLAN_OPERATORS:
+        return None
+    name, swapped = _PLAN_OPERATORS[op]
+
+    if kinds == ('name', 'name'):
+        return {'kind': 'compare-names', 'name': left[1], 'op': name,
+                'other': right[1]}
+    elif kinds == ('name', 'value'):
+        return {'kind': 'compare', 'name': left[1], 'op': name,
+                'value': right[1]}
+    elif kinds == ('value', 'name'):
+        return {'kind': 'compare', 'name': right[1], 'op': swapped,
+                'value': left[1]}
+    elif 'name' in kinds and 'none' in kinds and name in ('eq', 'ne'):
+        # nothing is equal to None, and everything differs from it
+        category = left[1] if left[0] == 'name' else right[1]
+        return {'kind': 'in', 'name': category, 'values': [],
+                'negate': name == 'ne'}
+
+    return None
+
+
+def _plan_node(node):
+    """Compile a node of a where clause, or return None if unsupported"""
+    if isinstance(node, ast.Expression):
+        return _plan_node(node.body)
+    elif isinstance(node, ast.Compare):
+        return _plan_compare(node)
+    elif isinstance(node, ast.BoolOp):
+        if len(node.values) != 2:
+            return None
+
+        left, right = [_plan_node(v) for v in node.values]
+        if left is None or right is None:
+            return None
+
+        kind = 'and' if isinstance(node.op, ast.And) else 'or'
+        return {'kind': kind, 'left': left, 'right': right}
+
+    return None
+
+
+def compile_plan(str_):
+    """Compile a where clause for evaluation within Redis
+
+    Parameters
+    ----------
+    str_ : str
+        The where clause
+
+    Raises
+    ------
+    TypeError
+        When unexpected operators are used
+    SyntaxError
+        When the clause cannot be parsed
+
+    Returns
+    -------
+    dict or None
+        The plan interpreted by the "where" script, or None if the clause
+        can only be evaluated by whereeval.
+
+    Notes
+    -----
+    The plan is a tree of nodes, each a dict with a "kind" of:
+
+        and, or : the samples of both or either of "left" and "right"
+        compare : the samples whose value of the category "name" satisfies
+            "op" (lt, le, gt, ge, eq or ne) against "value". A numeric
+            value is compared against the values which are numeric, and
+            is resolved by ZRANGEBYSCORE if the category is indexed
+            numerically (see redbiom.admin.index_numeric_category).
+        compare-names : the samples whose numeric values of the categories
+            "name" and "other" satisfy "op"
+        in : the samples whose value of the category "name" is (or, if
+            "negate", is not) one of "values"
+    """
+    return _plan_node(_parse(str_))
+
+
+def where_ids(str_, get=None):
+    """Obtain the samples satisfying a where clause
+
+    Parameters
+    ----------
+    str_ : str
+        The where clause
+    get : function, optional
+        A getter, used if the clause is evaluated by whereeval
+
+    Raises
+    ------
+    TypeError
+        When unexpected operators are used
+
+    Returns
+    -------
+    set
+        The sample IDs
+
+    Redis command summary
+    ---------------------
+    EVALSHA <where-sha1> 0 <plan>
+    SISMEMBER metadata:numeric-represented <category>
+    ZRANGEBYSCORE metadata:numeric:<category> <min> <max>
+    HGETALL metadata:category:<category>
+
+    Where possible, the clause is evaluated within Redis by the "where"
+    script so that the categories involved are not transferred. Otherwise,
+    or if the server predates the script, the categories are obtained and
+    the clause is evaluated by whereeval.
+    """
+    import json
+    import redbiom
+    import redbiom._requests
+    import redbiom.admin
+
+    plan = compile_plan(str_)
+    if plan is not None:
+        try:
+            sha = redbiom.admin.ScriptManager.get('where')
+        except ValueError:
+            # the server predates the script
+            sha = None
+
+        if sha is not None:
+            config = redbiom.get_config()
+            se = redbiom._requests.make_script_exec(config)
+
+            # an empty array is encoded by Lua as an empty object
+            return set(se(sha, 0,
+                          redbiom.admin.quote_plus(json.dumps(plan))))
+
+    return set(whereeval(str_, get=get).index)
@@ -30,6 +30,7 @@ setup(
     install_requires=['click >= 6.7', 'biom-format >= 2.1.5',
                       'requests', 'h5py', 'pandas', 'nltk',
                       'joblib', 'scikit-bio >= 0.4.2', 'msgpack'],
+    extras_require={'aio': ['aiohttp']},
     entry_points='''
         [console_scripts]
         redbiom=redbiom.commands:cli